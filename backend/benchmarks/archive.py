@@ -0,0 +1,76 @@
+import argparse
+import datetime
+import time
+
+from common import setup_database, measure, report
+
+from django.db import connection
+from django.db.models import F
+from django.db.models.functions import Mod
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from todo import archive, stats
+from todo.caching import get_cache
+from todo.datasets import generate
+from todo.models import TodoItem
+
+
+def routes(today):
+    window = f'date_from={today - datetime.timedelta(days=7)}&date_to={today + datetime.timedelta(days=7)}'
+    return [
+        ('todo list page', '/todos/?limit=100'),
+        ('todo filter pending', '/todos/filter/?checked=false&limit=100'),
+        ('todo filter overdue', '/todos/filter/?overdue=true&limit=100'),
+        ('todo filter window', f'/todos/filter/?{window}'),
+        ('todo filter title', '/todos/filter/?q=plan&limit=50'),
+        ('group list', '/groups/?limit=20'),
+    ]
+
+def run(client, today, label, repeat):
+    for name, url in routes(today):
+        def request():
+            get_cache().clear()
+            assert client.get(url).status_code == 200
+        report(f'{label} {name}', measure(request, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hot-table read latency with a history of checked todos, before and after archiving it.')
+    parser.add_argument('--todos', type=int, default=50000, help='Todos per user.')
+    parser.add_argument('--users', type=int, default=2)
+    parser.add_argument('--history', type=int, default=8, help='Tenths of the todos made old and checked.')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_database()
+    users = generate(users=args.users, todos=args.todos, subtasks=2, groups=20, recurring=0.05, prefix='bench')
+    today = datetime.date.today()
+    old = today - datetime.timedelta(days=400)
+    history = TodoItem.objects.annotate(bucket=Mod(F('id'), 10)).filter(bucket__lt=args.history, repeat='')
+    TodoItem.objects.filter(id__in=history.values('id')).update(checked=True, date=old, updated_at=timezone.now() - datetime.timedelta(days=400))
+    for user in users:
+        stats.rebuild(user)
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    client = APIClient()
+    client.force_authenticate(users[0])
+    print(f'{TodoItem.objects.count()} hot todos')
+    run(client, today, 'before', args.repeat)
+
+    began = time.perf_counter()
+    moved = archive.archive()
+    elapsed = time.perf_counter() - began
+    report('archive run', {'todos': moved, 'seconds': elapsed, 'todos_per_s': moved / elapsed})
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    print(f'{TodoItem.objects.count()} hot todos')
+    run(client, today, 'after', args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import asyncio
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import setup_database, report
+
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.db import connections
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from todo.models import TodoItem
+from todo.tests import make_todos
+
+
+CLIENTS = 500
+REQUESTS_PER_CLIENT = 4
+USERS = 50
+TODOS_PER_USER = 20
+# Worker threads of the WSGI deployment, as in gunicorn --threads.
+WSGI_THREADS = 16
+
+
+def seed():
+    targets = []
+    for i in range(USERS):
+        user = User.objects.create_user(username=f'bench{i}', password='bench')
+        make_todos(user, TODOS_PER_USER)
+        token = Token.objects.create(user=user).key
+        todo = TodoItem.objects.filter(user=user).values_list('id', flat=True).first()
+        targets.append(({'Authorization': f'Token {token}'}, todo))
+    return targets
+
+def paths(targets):
+    # Every client alternates the (cached) list and an uncached detail.
+    for client, (headers, todo) in zip(range(CLIENTS), itertools.cycle(targets)):
+        for request in range(REQUESTS_PER_CLIENT):
+            yield client, headers, '/todos/' if request % 2 == 0 else f'/todos/{todo}/'
+
+def by_client(targets):
+    requests = {}
+    for client, headers, path in paths(targets):
+        requests.setdefault(client, []).append((headers, path))
+    return requests
+
+def summary(elapsed, latencies, failures):
+    latencies.sort()
+    return {
+        'requests_per_s': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        'failures': failures,
+    }
+
+
+def run_wsgi(targets):
+    # 500 client threads, each sending its requests one after the other,
+    # served by a fixed number of worker threads; latency includes the
+    # wait for a free worker.
+    workers = threading.BoundedSemaphore(WSGI_THREADS)
+
+    def client(requests):
+        client, results = Client(), []
+        for headers, path in requests:
+            began = time.perf_counter()
+            with workers:
+                response = client.get(path, headers=headers)
+            results.append((response.status_code, time.perf_counter() - began))
+        connections.close_all()
+        return results
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=CLIENTS) as pool:
+        batches = list(pool.map(client, by_client(targets).values()))
+    elapsed = time.perf_counter() - began
+    results = [result for batch in batches for result in batch]
+    return summary(elapsed, [latency for _, latency in results], sum(1 for status, _ in results if status != 200))
+
+async def asgi_get(application, path, headers):
+    # One GET through the ASGI application itself, as uvicorn would send
+    # it. AsyncClient skips the handler's per-request ThreadSensitiveContext,
+    # which runs every request's sync work on one shared thread.
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+        'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+        'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+    }
+    received = asyncio.Event()
+    status = None
+
+    async def receive():
+        if not received.is_set():
+            received.set()
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await asyncio.Future()
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await application(scope, receive, send)
+    return status
+
+def run_asgi(targets):
+    # 500 concurrent clients on one event loop, each sending its requests
+    # one after the other.
+    application = get_asgi_application()
+
+    async def client(requests):
+        results = []
+        for headers, path in requests:
+            began = time.perf_counter()
+            status = await asgi_get(application, path, headers)
+            results.append((status, time.perf_counter() - began))
+        return results
+
+    async def main():
+        return await asyncio.gather(*(client(batch) for batch in by_client(targets).values()))
+
+    began = time.perf_counter()
+    results = [result for batch in asyncio.run(main()) for result in batch]
+    elapsed = time.perf_counter() - began
+    return summary(elapsed, [latency for _, latency in results], sum(1 for status, _ in results if status != 200))
+
+
+def main():
+    setup_database()
+    targets = seed()
+    report(f'wsgi threads={WSGI_THREADS} clients={CLIENTS}', run_wsgi(targets))
+    report(f'asgi clients={CLIENTS}', run_asgi(targets))
+
+
+if __name__ == '__main__':
+    main()
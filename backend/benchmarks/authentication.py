@@ -0,0 +1,46 @@
+import time
+
+from common import setup_database, report
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication, SessionAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from todo import views
+from todo.authentication import CachedTokenAuthentication, token_cache
+
+
+REQUESTS = 2000
+
+
+def run(client, authentication):
+    views.TestUserView.authentication_classes = [authentication, SessionAuthentication]
+    token_cache.clear()
+    client.get('/testuser/')
+    with CaptureQueriesContext(connection) as context:
+        began = time.perf_counter()
+        for _ in range(REQUESTS):
+            client.get('/testuser/')
+        elapsed = time.perf_counter() - began
+    return {
+        'requests_per_s': REQUESTS / elapsed,
+        'queries_per_request': len(context.captured_queries) / REQUESTS,
+    }
+
+
+def main():
+    setup_database()
+    user = User.objects.create_user(username='bench', password='bench')
+    token = Token.objects.create(user=user)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    report('TokenAuthentication', run(client, TokenAuthentication))
+    report('CachedTokenAuthentication', run(client, CachedTokenAuthentication))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+import os
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'todoapp.settings')
+
+import django
+
+django.setup()
+
+from django.db import connection
+from django.test.utils import setup_test_environment
+
+
+def setup_database():
+    # Benchmarks run against a throwaway test database, never db.sqlite3,
+    # with the test client allowed and DEBUG query logging off.
+    setup_test_environment(debug=False)
+    connection.creation.create_test_db(verbosity=0)
+
+def measure(function, repeat=100):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        'mean_ms': sum(timings) / len(timings) * 1000,
+        'p50_ms': timings[len(timings) // 2] * 1000,
+        'p99_ms': timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000,
+    }
+
+def report(name, stats):
+    values = '  '.join(f'{key}={value:.3f}' if isinstance(value, float) else f'{key}={value}' for key, value in stats.items())
+    print(f'{name:<40} {values}')
@@ -0,0 +1,100 @@
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from common import setup_database, report
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, connections, OperationalError
+
+from todo.selectors import todo_list
+from todo.services import TodoItemService
+
+
+WRITERS = 8
+WRITES_PER_WRITER = 100
+READERS = 4
+
+
+def workload():
+    user = User.objects.create_user(username='bench', password='bench')
+    errors = []
+    writes_done = threading.Event()
+    reads = [0]
+    writes = [0]
+
+    def write(worker):
+        try:
+            for i in range(WRITES_PER_WRITER):
+                try:
+                    todo = TodoItemService.create(title=f'{worker}-{i}', content='content', date='2024-01-01', user=user, subtasks=['a', 'b'])
+                    TodoItemService.check(todo)
+                    writes[0] += 2
+                except OperationalError as error:
+                    errors.append(str(error))
+        finally:
+            connections.close_all()
+
+    def read():
+        try:
+            while not writes_done.is_set():
+                try:
+                    len(todo_list(user)[:50])
+                    reads[0] += 1
+                except OperationalError as error:
+                    errors.append(str(error))
+        finally:
+            connections.close_all()
+
+    readers = [threading.Thread(target=read) for _ in range(READERS)]
+    writers = [threading.Thread(target=write, args=(i,)) for i in range(WRITERS)]
+    began = time.perf_counter()
+    for thread in readers + writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    elapsed = time.perf_counter() - began
+    writes_done.set()
+    for thread in readers:
+        thread.join()
+
+    return {
+        'writes_per_s': writes[0] / elapsed,
+        'reads_per_s': reads[0] / elapsed,
+        'locked_errors': sum('locked' in error for error in errors),
+    }
+
+
+def run(profile):
+    # A file database: in-memory SQLite has no journal to tune.
+    path = os.path.join(tempfile.mkdtemp(), f'{profile}.sqlite3')
+    connection.settings_dict['TEST']['NAME'] = path
+    if profile == 'default':
+        settings.TODO_SQLITE_PRAGMAS = {}
+        settings.TODO_SQLITE_TRANSACTION_MODE = ''
+    setup_database()
+    with connection.cursor() as cursor:
+        mode = cursor.execute('PRAGMA journal_mode').fetchone()[0]
+    report(f'sqlite {profile} journal={mode}', workload())
+
+
+def main():
+    # One process per profile, since journal mode sticks to the file and
+    # the pragmas to open connections.
+    if connection.vendor == 'postgresql':
+        setup_database()
+        report(f'postgresql conn_max_age={connection.settings_dict["CONN_MAX_AGE"]}', workload())
+        return
+    if len(sys.argv) > 1:
+        run(sys.argv[1])
+        return
+    for profile in ('default', 'tuned'):
+        subprocess.run([sys.executable, __file__, profile], check=True)
+
+
+if __name__ == '__main__':
+    main()
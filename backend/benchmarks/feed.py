@@ -0,0 +1,122 @@
+import asyncio
+import time
+import tracemalloc
+
+from common import setup_database, report
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, override_settings
+from rest_framework.authtoken.models import Token
+
+from todo.feed import bus
+from todo.services import TodoItemService
+
+
+USERS = 50
+CLIENTS_PER_USER = 10
+WINDOW = 5.0
+POLL_INTERVAL = 1.0
+
+queries = [0]
+
+def count_queries(execute, sql, params, many, context):
+    queries[0] += 1
+    return execute(sql, params, many, context)
+
+def counted(sender, connection, **kwargs):
+    connection.execute_wrappers.append(count_queries)
+
+
+def seed():
+    users = []
+    for i in range(USERS):
+        user = User.objects.create_user(username=f'bench{i}', password='bench')
+        users.append((user, {'Authorization': f'Token {Token.objects.create(user=user).key}'}))
+    return users
+
+def write(user):
+    # A committed write, as a request would make it.
+    with transaction.atomic():
+        TodoItemService.create(title='pushed', content='content', date='2024-01-01', subtasks=[], user=user)
+
+
+async def polling(users):
+    # Every client asks /sync/ what changed once per POLL_INTERVAL.
+    client = AsyncClient()
+    cursors = {}
+    for user, headers in users:
+        cursors[user.id] = (await client.get('/sync/', headers=headers)).json()['cursor']
+
+    async def poll(user, headers):
+        requests = 0
+        deadline = time.perf_counter() + WINDOW
+        while time.perf_counter() < deadline:
+            await client.get('/sync/', {'since': cursors[user.id]}, headers=headers)
+            requests += 1
+            await asyncio.sleep(POLL_INTERVAL)
+        return requests
+
+    before = queries[0]
+    began = time.perf_counter()
+    requests = await asyncio.gather(*(poll(user, headers) for user, headers in users for _ in range(CLIENTS_PER_USER)))
+    return {'requests': sum(requests), 'queries': queries[0] - before, 'seconds': time.perf_counter() - began}
+
+async def parked(users):
+    # Every client long-polls /feed/; halfway through, each user writes once.
+    client = AsyncClient()
+    cursors = {}
+    for user, headers in users:
+        cursors[user.id] = (await client.get('/sync/', headers=headers)).json()['cursor']
+    await asyncio.sleep(0.01)
+
+    async def wait(user, headers):
+        response = await client.get('/feed/', {'since': cursors[user.id]}, headers=headers)
+        return user.id, time.perf_counter(), len(response.json()['todos'])
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    tasks = [asyncio.ensure_future(wait(user, headers)) for user, headers in users for _ in range(CLIENTS_PER_USER)]
+    while bus.count() < len(tasks):
+        await asyncio.sleep(0.01)
+    parked_memory = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    # Let every request finish its initial has_changes check.
+    before = None
+    while before != queries[0]:
+        before = queries[0]
+        await asyncio.sleep(0.5)
+    await asyncio.sleep(WINDOW / 2)
+    idle_queries = queries[0] - before
+
+    written = {}
+    for user, _ in users:
+        await sync_to_async(write)(user)
+        written[user.id] = time.perf_counter()
+    results = await asyncio.gather(*tasks)
+    latencies = sorted(done - written[user_id] for user_id, done, _ in results)
+    return {
+        'clients': len(tasks),
+        'idle_queries': idle_queries,
+        'bytes_per_parked_client': parked_memory // len(tasks),
+        'wake_p50_ms': latencies[len(latencies) // 2] * 1000,
+        'wake_p99_ms': latencies[int(len(latencies) * 0.99)] * 1000,
+        'delivered': sum(1 for *_, todos in results if todos),
+    }
+
+
+def main():
+    setup_database()
+    connection_created.connect(counted)
+    connection.execute_wrappers.append(count_queries)
+    users = seed()
+    with override_settings(TODO_FEED_TIMEOUT=60):
+        report(f'polling /sync/ every {POLL_INTERVAL}s', asyncio.run(polling(users)))
+        report('long-poll /feed/', asyncio.run(parked(users)))
+
+
+if __name__ == '__main__':
+    main()
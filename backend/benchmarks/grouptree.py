@@ -0,0 +1,35 @@
+from common import setup_database, measure, report
+
+from django.contrib.auth.models import User
+
+from todo import grouptree
+from todo.models import TodoGroup
+from todo.services import TodoGroupService
+
+
+def make_chain(user, depth):
+    groups = [None]
+    for i in range(depth):
+        groups.append(TodoGroupService.create(name=str(i), user=user, todos=[], childs=[], parent=groups[-1]))
+    return groups[1:]
+
+
+def main():
+    setup_database()
+    user = User.objects.create(username='bench')
+
+    for depth in (10, 100, 1000):
+        groups = make_chain(user, depth)
+        root, leaf = groups[0], groups[-1]
+        report(f'verify_group cycle depth={depth}', measure(lambda: TodoGroupService.verify_group(leaf, root)))
+        report(f'in_subtree (CTE) depth={depth}', measure(lambda: grouptree.in_subtree(root, leaf)))
+        report(f'subtree (path) depth={depth}', measure(lambda: list(grouptree.subtree(root))))
+        report(f'subtree_todo_count depth={depth}', measure(lambda: grouptree.subtree_todo_count(root)))
+        report(f'ancestors depth={depth}', measure(lambda: grouptree.ancestors(leaf)))
+        report(f'descendants depth={depth}', measure(lambda: grouptree.descendants(root)))
+        report(f'tree depth={depth}', measure(lambda: grouptree.tree(user), repeat=20))
+        TodoGroup.objects.filter(user=user).delete()
+
+
+if __name__ == '__main__':
+    main()
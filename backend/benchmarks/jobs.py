@@ -0,0 +1,101 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from common import setup_database, report
+
+from django.contrib.auth.models import User
+from django.db import connection, connections, OperationalError
+
+from todo import jobs, search, stats
+from todo.models import TodoItem, TodoGroup, Subtask, Job
+from todo.services import TodoItemService, TodoGroupService
+
+
+def populate(user, todos, groups):
+    # One group with `groups` subgroups sharing `todos` todos, each with
+    # two subtasks.
+    root = TodoGroupService.create(name='root', childs=[], todos=[], user=user)
+    subgroups = [root] + [TodoGroupService.create(name=f'sub {i}', childs=[], todos=[], parent=root, user=user) for i in range(groups)]
+    items = TodoItem.objects.bulk_create([
+        TodoItem(title=f'todo {i}', content='content', date='2024-01-01', user=user, group=subgroups[i % len(subgroups)])
+        for i in range(todos)
+    ])
+    subtasks = Subtask.objects.bulk_create([
+        Subtask(todo=item, content=f'subtask {j}', position=(j + 1) * Subtask.GAP) for item in items for j in range(2)
+    ])
+    TodoItem.subtasks.through.objects.bulk_create([
+        TodoItem.subtasks.through(todoitem_id=subtask.todo_id, subtask_id=subtask.id) for subtask in subtasks
+    ])
+    stats.rebuild(user)
+    search.index_user(user.id)
+    return root
+
+def with_writer(user, work, interval=0.01):
+    # Runs work() while another connection creates a todo every interval
+    # seconds, and returns how long work took and the create latencies seen meanwhile.
+    latencies, errors = [], []
+    done = threading.Event()
+
+    def write():
+        try:
+            while not done.is_set():
+                began = time.perf_counter()
+                try:
+                    TodoItemService.create(title='new', content='content', date='2024-01-02', user=user, subtasks=[])
+                    latencies.append(time.perf_counter() - began)
+                except OperationalError as error:
+                    errors.append(str(error))
+                time.sleep(interval)
+        finally:
+            connections.close_all()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    time.sleep(0.2)
+    began = time.perf_counter()
+    work()
+    elapsed = time.perf_counter() - began
+    done.set()
+    writer.join()
+
+    latencies.sort()
+    return {
+        'work_s': elapsed,
+        'creates': len(latencies),
+        'create_p50_ms': latencies[len(latencies) // 2] * 1000,
+        'create_p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        'create_max_ms': latencies[-1] * 1000,
+        'errors': len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Create latency while a large group is deleted inline or by a chunked job.')
+    parser.add_argument('--todos', type=int, default=10000, help='Todos in the deleted group.')
+    parser.add_argument('--groups', type=int, default=50, help='Subgroups in the deleted group.')
+    args = parser.parse_args()
+
+    if connection.vendor == 'sqlite':
+        # A file database, so the writer thread gets its own connection and
+        # competes for the same write lock.
+        connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.mkdtemp(), 'jobs.sqlite3')
+    setup_database()
+
+    user = User.objects.create_user(username='bench', password='bench')
+    root = populate(user, args.todos, args.groups)
+    report(f'{connection.vendor} inline delete', with_writer(user, lambda: TodoGroupService.delete(root.id)))
+    assert stats.rebuild(user) == 0
+
+    root = populate(user, args.todos, args.groups)
+    job = jobs.enqueue(user, jobs.DELETE_GROUP, group=root.id)
+    report(f'{connection.vendor} job delete', with_writer(user, lambda: jobs.run(jobs.claim())))
+    job.refresh_from_db()
+    assert job.status == Job.DONE and not TodoGroup.objects.filter(id=root.id).exists()
+    assert stats.rebuild(user) == 0
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+from common import setup_database, report
+
+from django.contrib.auth.models import User
+from django.test import AsyncClient
+from rest_framework.authtoken.models import Token
+
+from todo import hashing
+
+
+LOGINS = 60
+TODO_REQUESTS = 60
+
+
+async def timed(coroutine):
+    began = time.perf_counter()
+    response = await coroutine
+    return response.status_code, time.perf_counter() - began
+
+async def storm(token):
+    # A burst of logins and a steady stream of todo reads at the same time.
+    client = AsyncClient()
+    reader = AsyncClient(headers={'Authorization': f'Token {token}'})
+    logins = [timed(client.post('/login/', {'username': 'bench', 'password': 'bench'}, content_type='application/json')) for _ in range(LOGINS)]
+    reads = [timed(reader.get('/todos/')) for _ in range(TODO_REQUESTS)]
+    began = time.perf_counter()
+    results = await asyncio.gather(*logins, *reads)
+    return time.perf_counter() - began, results[:LOGINS], results[LOGINS:]
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000
+
+
+def main():
+    setup_database()
+    user = User.objects.create_user(username='bench', password='bench')
+    token = Token.objects.create(user=user).key
+
+    for label, pending in (('unbounded', 10 ** 6), ('bounded', 16)):
+        hashing.slots = hashing.threading.BoundedSemaphore(pending)
+        elapsed, logins, reads = asyncio.run(storm(token))
+        report(f'{label} max_pending={pending}', {
+            'elapsed_s': elapsed,
+            'logins_ok': sum(1 for status, _ in logins if status == 200),
+            'logins_429': sum(1 for status, _ in logins if status == 429),
+            'todo_p50_ms': percentile([latency for _, latency in reads], 0.5),
+            'todo_p99_ms': percentile([latency for _, latency in reads], 0.99),
+        })
+
+
+if __name__ == '__main__':
+    main()
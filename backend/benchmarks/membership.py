@@ -0,0 +1,60 @@
+import argparse
+import itertools
+
+from common import setup_database, measure, report
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from rest_framework.test import APIClient
+
+from todo import stats
+from todo.models import TodoItem, TodoGroup
+from todo.services import TodoGroupService
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PUT /groups/<id>/ latency for a group holding many todos and children.')
+    parser.add_argument('--todos', type=int, default=10000, help='Todos in the group.')
+    parser.add_argument('--childs', type=int, default=50, help='Child groups.')
+    parser.add_argument('--changed', type=int, default=100, help='Todos swapped in and out by each changed save.')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    setup_database()
+    # Every save runs inline, as it would below the job threshold.
+    settings.TODO_JOB_INLINE_LIMIT = 10 ** 9
+    user = User.objects.create_user(username='bench', password='bench')
+    TodoItem.objects.bulk_create([
+        TodoItem(title=f'todo {i}', content='content', date='2024-01-01', user=user) for i in range(args.todos + args.changed)
+    ])
+    stats.rebuild(user)
+    todos = list(TodoItem.objects.filter(user=user).order_by('id').values_list('id', flat=True))
+    group = TodoGroupService.create(name='group', childs=[], todos=[], user=user)
+    childs = [TodoGroupService.create(name=f'child {i}', childs=[], todos=[], user=user).id for i in range(args.childs)]
+
+    client = APIClient()
+    client.force_authenticate(user)
+    def save(todos):
+        def put():
+            assert client.put(f'/groups/{group.id}/', {'name': 'group', 'todos': todos, 'childs': childs}, format='json').status_code == 200
+        return put
+
+    def run(name, function, repeat):
+        # Counted with a wrapper: requests reset the debug query log.
+        queries = []
+        with connection.execute_wrapper(lambda execute, sql, *rest: queries.append(sql) or execute(sql, *rest)):
+            function()
+        report(name, dict(measure(function, repeat=repeat), queries=len(queries)))
+
+    first, second = todos[:args.todos], todos[args.changed:]
+    run('first save', save(first), 1)
+    run('save unchanged', save(first), args.repeat)
+    saves = itertools.cycle([save(second), save(first)])
+    run(f'save {args.changed} in, {args.changed} out', lambda: next(saves)(), args.repeat)
+    assert stats.rebuild(user) == 0
+    assert TodoGroup.objects.get(id=group.id).childs.count() == args.childs
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import datetime
+import time
+import tracemalloc
+
+from common import report
+
+from todo import recurrence
+
+
+USERS = 1000
+# Peak traced memory allowed while expanding, cache included.
+MEMORY_BUDGET = 64 * 1024 * 1024
+
+
+def main():
+    start = datetime.date(2024, 1, 1)
+    window_end = start + datetime.timedelta(days=364)
+    # Each user gets a differently anchored daily rule so the cache cannot
+    # collapse them into one entry.
+    anchors = [start - datetime.timedelta(days=i) for i in range(USERS)]
+
+    for label, expand in (
+        ('generator', lambda anchor: sum(1 for _ in recurrence.occurrences(recurrence.parse('daily'), anchor, start, window_end))),
+        ('cached expand', lambda anchor: len(recurrence.expand('daily', anchor, start, window_end))),
+    ):
+        recurrence.expand.cache_clear()
+        began = time.perf_counter()
+        total = sum(expand(anchor) for anchor in anchors)
+        elapsed = time.perf_counter() - began
+
+        # Memory is traced in a second pass; tracing slows Python down.
+        recurrence.expand.cache_clear()
+        tracemalloc.start()
+        sum(expand(anchor) for anchor in anchors)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        report(f'{label} {USERS} users x 1 year', {
+            'occurrences': total,
+            'total_ms': elapsed * 1000,
+            'peak_mb': peak / 1024 / 1024,
+            'within_budget': peak <= MEMORY_BUDGET,
+        })
+
+    began = time.perf_counter()
+    for anchor in anchors:
+        recurrence.expand('daily', anchor, start, window_end)
+    report('cached expand, warm', {'total_ms': (time.perf_counter() - began) * 1000})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+import argparse
+import datetime
+import itertools
+import json
+import sys
+import time
+import tracemalloc
+
+from common import setup_database
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from todo import jobs
+from todo.caching import get_cache
+from todo.datasets import generate
+from todo.models import TodoItem, TodoGroup, Subtask
+from todo.services import TodoGroupService
+from todoapp import urls
+
+
+DATASET = {'users': 5, 'todos': 300, 'subtasks': 3, 'groups': 20, 'depth': 8, 'recurring': 0.1}
+REPEAT = 30
+# Password hashing dominates these; fewer runs keep the suite quick.
+SLOW_CASES = {'login', 'register'}
+SLOW_REPEAT = 5
+METRICS_TOKEN = 'bench'
+
+
+class Context:
+    def __init__(self, user):
+        self.user = user
+        self.token = Token.objects.create(user=user).key
+        self.todos = list(TodoItem.objects.filter(user=user).order_by('id').values_list('id', flat=True))
+        self.groups = list(TodoGroup.objects.filter(user=user).order_by('id').values_list('id', flat=True))
+        self.counter = itertools.count()
+        self.today = datetime.date.today()
+        self.job = jobs.enqueue(user, jobs.REBUILD).id
+
+    def todo_body(self, **extra):
+        return dict({
+            'title': 'bench', 'content': 'bench', 'created_at': '2024-01-01T00:00:00Z',
+            'date': self.today.isoformat(), 'checked': False, 'subtasks': ['a', 'b', 'c'],
+        }, **extra)
+
+    def fresh_todo(self):
+        return TodoItem.objects.create(title='fresh', content='fresh', date=self.today, user=self.user)
+
+    def fresh_subtask(self):
+        todo = TodoItem.objects.get(id=self.todos[0])
+        subtask = Subtask.objects.create(todo=todo, content='fresh', position=next(self.counter) + 1)
+        todo.subtasks.add(subtask)
+        return subtask
+
+    def fresh_group(self):
+        # Through the service, which gives it a path; a pathless group's
+        # subtree would span the whole dataset and the delete would queue.
+        return TodoGroupService.create(name='fresh', childs=[], todos=[], user=self.user)
+
+    def import_body(self):
+        # A one-line JSONL file: the test client sends the dict as one line.
+        return {'type': 'todo', 'id': 1, 'title': 'imported', 'content': 'bench', 'date': self.today.isoformat(), 'subtasks': ['a', 'b']}
+
+    def other_user_headers(self):
+        # Logout deletes the caller's tokens, so it runs as someone else.
+        user, _ = User.objects.get_or_create(username='bench-logout')
+        return {'Authorization': f'Token {Token.objects.get_or_create(user=user)[0].key}'}
+
+
+# (case name, url name, build). build runs untimed before each request and
+# returns (method, path, data, headers); headers default to the dataset
+# user's token.
+CASES = [
+    ('login', 'login', lambda c: ('post', '/login/', {'username': 'user0', 'password': 'password'}, {})),
+    ('logout', 'logout', lambda c: ('post', '/logout/', None, c.other_user_headers())),
+    ('register', 'register', lambda c: ('post', '/register/', {'username': f'new{next(c.counter)}', 'password': 'password'}, {})),
+    ('testuser', 'testuser', lambda c: ('get', '/testuser/', None, None)),
+    ('todo list', 'todo-list', lambda c: ('get', '/todos/', None, None)),
+    ('todo list page', 'todo-list', lambda c: ('get', '/todos/?limit=50', None, None)),
+    ('todo create', 'todo-list', lambda c: ('post', '/todos/', c.todo_body(), None)),
+    ('todo detail', 'todo-detail', lambda c: ('get', f'/todos/{c.todos[0]}/', None, None)),
+    ('todo add subtask', 'todo-detail', lambda c: ('post', f'/todos/{c.fresh_todo().id}/', {'content': 'bench'}, None)),
+    ('todo update', 'todo-detail', lambda c: ('put', f'/todos/{c.todos[1]}/', c.todo_body(), None)),
+    ('todo delete', 'todo-detail', lambda c: ('delete', f'/todos/{c.fresh_todo().id}/', None, None)),
+    ('todo filter window', 'todo-filter', lambda c: ('get', '/todos/filter/?date_from=%s&date_to=%s' % (c.today - datetime.timedelta(days=7), c.today + datetime.timedelta(days=7)), None, None)),
+    ('todo filter page', 'todo-filter', lambda c: ('get', '/todos/filter/?checked=false&limit=50', None, None)),
+    ('todo search', 'todo-search', lambda c: ('get', '/todos/search/?q=buy%20pl', None, None)),
+    ('todo check', 'todo-action', lambda c: ('post', f'/todos/{c.todos[2]}/action/', {'action': ('check', 'uncheck')[next(c.counter) % 2]}, None)),
+    ('subtask rename', 'subtask-action', lambda c: ('post', f'/subtask/{c.fresh_subtask().id}/', {'action': 'rename', 'content': 'renamed'}, None)),
+    ('subtask delete', 'subtask-action', lambda c: ('delete', f'/subtask/{c.fresh_subtask().id}/', None, None)),
+    ('group list', 'group-list', lambda c: ('get', '/groups/', None, None)),
+    ('group create', 'group-list', lambda c: ('post', '/groups/', {'name': 'bench', 'childs': [], 'todos': []}, None)),
+    ('group detail', 'group-detail', lambda c: ('get', f'/groups/{c.groups[0]}/', None, None)),
+    ('group update', 'group-detail', lambda c: ('put', f'/groups/{c.fresh_group().id}/', {'name': 'renamed', 'childs': [], 'todos': c.todos[:5]}, None)),
+    ('group delete', 'group-detail', lambda c: ('delete', f'/groups/{c.fresh_group().id}/', None, None)),
+    ('group filter', 'group-filter', lambda c: ('get', '/groups/filter/', None, None)),
+    ('group tree', 'group-tree', lambda c: ('get', '/groups/tree/', None, None)),
+    ('group rename', 'group-action', lambda c: ('post', f'/groups/{c.groups[1]}/action/', {'action': 'rename', 'content': f'g{next(c.counter)}'}, None)),
+    ('batch', 'batch', lambda c: ('post', '/batch/', {'actions': [{'target': 'todo', 'id': id, 'action': 'check'} for id in c.todos[3:23]]}, None)),
+    ('sync', 'sync', lambda c: ('get', '/sync/', None, None)),
+    ('feed', 'feed', lambda c: ('get', '/feed/', None, None)),
+    ('stats', 'stats', lambda c: ('get', '/stats/', None, None)),
+    ('export jsonl', 'export', lambda c: ('get', '/export/', None, None)),
+    ('export csv', 'export', lambda c: ('get', '/export/?format=csv', None, None)),
+    ('import', 'import', lambda c: ('post', '/import/?format=jsonl', c.import_body(), None)),
+    ('job list', 'job-list', lambda c: ('get', '/jobs/', None, None)),
+    ('job create', 'job-list', lambda c: ('post', '/jobs/', {'kind': 'rebuild'}, None)),
+    ('job detail', 'job-detail', lambda c: ('get', f'/jobs/{c.job}/', None, None)),
+    ('metrics', 'metrics', lambda c: ('get', '/metrics/', None, {'Authorization': f'Bearer {METRICS_TOKEN}'})),
+]
+
+
+def route_names():
+    return {pattern.name for pattern in get_resolver(urls).url_patterns if getattr(pattern, 'name', None)}
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def read(response):
+    # Streamed bodies are read within the timing; the async views stream
+    # from an async iterator.
+    if response.is_async:
+        async def chunks():
+            return [chunk async for chunk in response.streaming_content]
+        async_to_sync(chunks)()
+    else:
+        for chunk in response.streaming_content:
+            pass
+    return response
+
+def run_case(client, context, build, repeat):
+    def request():
+        method, path, data, headers = build(context)
+        # Every run starts from an empty response cache, so list routes
+        # are measured doing their real work.
+        get_cache().clear()
+        headers = headers if headers is not None else {'Authorization': f'Token {context.token}'}
+        def send():
+            response = getattr(client, method)(path, data, format='json', headers=headers)
+            return read(response) if response.streaming else response
+        return send
+
+    request()()
+    timings, queries, statuses = [], [], set()
+    for _ in range(repeat):
+        send = request()
+        with CaptureQueriesContext(connection) as captured:
+            began = time.perf_counter()
+            response = send()
+            timings.append(time.perf_counter() - began)
+        queries.append(len(captured.captured_queries))
+        statuses.add(response.status_code)
+
+    # Peak memory from a separate run, since tracing skews timings.
+    send = request()
+    tracemalloc.start()
+    send()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'p50_ms': round(percentile(timings, 0.5) * 1000, 3),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 3),
+        'queries': max(queries),
+        'peak_kb': round(peak / 1024, 1),
+        'status': sorted(statuses),
+    }
+
+@override_settings(TODO_METRICS_TOKEN=METRICS_TOKEN)
+def run(repeat):
+    setup_database()
+    users = generate(**DATASET)
+    context = Context(users[0])
+    client = APIClient(raise_request_exception=False)
+
+    missing = route_names() - {route for _, route, _ in CASES}
+    if missing:
+        raise SystemExit('Routes without a benchmark case: ' + ', '.join(sorted(missing)))
+
+    results = {}
+    for name, route, build in CASES:
+        results[name] = dict(route=route, **run_case(client, context, build, SLOW_REPEAT if name in SLOW_CASES else repeat))
+    return {'dataset': DATASET, 'repeat': repeat, 'cases': results}
+
+
+def compare(report, baseline, threshold):
+    # Query counts are deterministic and must not grow at all. Timings of
+    # a few milliseconds easily move by a third between runs on the same
+    # machine, so latency and memory only count past threshold (a
+    # fraction).
+    regressions = []
+    print(f'{"case":<22} {"p50_ms":>10} {"base":>10} {"delta":>8} {"queries":>8} {"base":>5} {"peak_kb":>9}')
+    for name, result in report['cases'].items():
+        base = baseline['cases'].get(name)
+        if base is None:
+            print(f'{name:<22} {result["p50_ms"]:>10.3f} {"-":>10} {"new":>8} {result["queries"]:>8} {"-":>5} {result["peak_kb"]:>9.1f}')
+            continue
+        delta = result['p50_ms'] / base['p50_ms'] - 1 if base['p50_ms'] else 0.0
+        flags = []
+        if result['queries'] > base['queries']:
+            flags.append('queries')
+        if delta > threshold:
+            flags.append('latency')
+        if base['peak_kb'] and result['peak_kb'] / base['peak_kb'] - 1 > threshold:
+            flags.append('memory')
+        if result['status'] != base['status']:
+            flags.append('status')
+        if flags:
+            regressions.append((name, flags))
+        print(f'{name:<22} {result["p50_ms"]:>10.3f} {base["p50_ms"]:>10.3f} {delta:>+8.0%} {result["queries"]:>8} {base["queries"]:>5} {result["peak_kb"]:>9.1f}  {" ".join(flags)}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Drive every route through the test client and report latency, queries and memory.')
+    parser.add_argument('--output', help='Write the JSON report here.')
+    parser.add_argument('--baseline', help='Compare against this JSON report; exits 1 on regressions.')
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--threshold', type=float, default=0.5, help='Allowed p50 and peak memory growth as a fraction.')
+    args = parser.parse_args()
+
+    report = run(args.repeat)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+            file.write('\n')
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(report, json.load(file), args.threshold)
+        if regressions:
+            print('Regressions: ' + ', '.join(f'{name} ({" ".join(flags)})' for name, flags in regressions))
+            sys.exit(1)
+    else:
+        print(json.dumps(report['cases'], indent=2))
+
+
+if __name__ == '__main__':
+    main()
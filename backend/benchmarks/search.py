@@ -0,0 +1,46 @@
+import argparse
+import time
+
+from common import setup_database, measure, report
+
+from todo.datasets import generate
+from todo.models import TodoItem
+from todo.search import search
+from todo.selectors import todo_search
+from todo.services import TodoItemService
+
+
+# Generated text draws on a dozen words, so the first four queries match a
+# large share of every user's todos: the worst case for a ranked search,
+# which scores every match, and the best for an unranked scan, which stops
+# at the first page. 'quarterly' is a single todo and 'zzz' matches nothing.
+QUERIES = ['buy', 'pl', 'review plan', 'call fix send', 'quarterly', 'zzz']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Full-text search latency against an icontains scan.')
+    parser.add_argument('--todos', type=int, default=100000, help='Todos in total, split over --users.')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_database()
+    began = time.perf_counter()
+    users = generate(users=args.users, todos=args.todos // args.users, subtasks=2, groups=20, recurring=0, prefix='bench')
+    print(f'generated {args.todos} todos in {time.perf_counter() - began:.1f}s')
+    user = users[0]
+    TodoItemService.create(title='quarterly report', content='numbers', date='2024-01-01', subtasks=['tables'], user=user)
+
+    for query in QUERIES:
+        matches = len(search(user, query, limit=args.todos))
+        report(f'index ids "{query}" ({matches} hits)', measure(lambda: search(user, query), repeat=args.repeat))
+        report(f'index page "{query}"', measure(lambda: todo_search(user, query), repeat=args.repeat))
+        words = query.split()
+        scan = TodoItem.objects.filter(user=user)
+        for word in words:
+            scan = scan.filter(title__icontains=word)
+        report(f'icontains title "{query}"', measure(lambda: list(scan.values_list('id', flat=True)[:21]), repeat=args.repeat))
+
+
+if __name__ == '__main__':
+    main()
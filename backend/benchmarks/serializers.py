@@ -0,0 +1,33 @@
+from unittest import mock
+
+from common import setup_database, measure, report
+
+from rest_framework.renderers import JSONRenderer
+
+from todo import compact
+from todo.datasets import generate
+from todo.pagination import TODO_ORDERING, GROUP_ORDERING
+from todo.selectors import todo_list, group_list
+from todo.serializers import TodoOutputSerializer, GroupOutputSerializer
+
+
+def main():
+    setup_database()
+    user, = generate(users=1, todos=5000, subtasks=3, groups=200, prefix='bench')
+    renderer = JSONRenderer()
+
+    for size in (100, 1000, 5000):
+        todos = todo_list(user).order_by(*TODO_ORDERING)[:size]
+        repeat = 20 if size < 5000 else 5
+        report(f'todos={size} DRF serializer + renderer', measure(lambda: renderer.render(TodoOutputSerializer(todos, many=True).data), repeat))
+        report(f'todos={size} compact + orjson', measure(lambda: compact.dumps(compact.CompactTodoSerializer.rows(todos)), repeat))
+        with mock.patch.object(compact, 'orjson', None):
+            report(f'todos={size} compact + json', measure(lambda: compact.dumps(compact.CompactTodoSerializer.rows(todos)), repeat))
+
+    groups = group_list(user).order_by(*GROUP_ORDERING)
+    report('groups=200 DRF serializer + renderer', measure(lambda: renderer.render(GroupOutputSerializer(groups, many=True).data), 20))
+    report('groups=200 compact + orjson', measure(lambda: compact.dumps(compact.CompactGroupSerializer.rows(groups)), 20))
+
+
+if __name__ == '__main__':
+    main()
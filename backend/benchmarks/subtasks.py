@@ -0,0 +1,37 @@
+import datetime
+
+from common import setup_database, measure, report
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from todo.models import TodoItem
+from todo.services import TodoItemService, SubtaskService
+
+
+def main():
+    setup_database()
+    user = User.objects.create(username='bench')
+
+    for size in (10, 100, 1000):
+        contents = [f'subtask {i}' for i in range(size)]
+        edited = [f'edited {i}' if i % 2 else content for i, content in enumerate(contents)]
+
+        def create():
+            TodoItemService.create(title='bench', content='bench', date=datetime.date.today(), user=user, subtasks=contents)
+
+        todo = TodoItem.objects.create(title='bench', content='bench', date=datetime.date.today(), user=user)
+
+        def update():
+            SubtaskService.sync(todo, contents)
+            SubtaskService.sync(todo, edited)
+
+        with CaptureQueriesContext(connection) as context:
+            update()
+        report(f'create with {size} subtasks', measure(create, repeat=10))
+        report(f'sync twice with {size} subtasks', dict(measure(update, repeat=10), queries=len(context.captured_queries)))
+
+
+if __name__ == '__main__':
+    main()
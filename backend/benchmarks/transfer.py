@@ -0,0 +1,67 @@
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from common import setup_database, report
+
+from django.contrib.auth.models import User
+
+from todo import transfer
+from todo.datasets import generate
+from todo.models import TodoItem
+from todo.services import TodoItemService
+
+
+def timed(function, trace):
+    # Wall time and, with --trace, peak traced memory, which stays flat
+    # with bounded buffering whatever the number of todos. Tracing slows
+    # everything down, so timings are only comparable without it.
+    if trace:
+        tracemalloc.start()
+    began = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - began
+    peak = tracemalloc.get_traced_memory()[1] if trace else 0
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk export/import throughput and memory against per-todo creates.')
+    parser.add_argument('--todos', type=int, default=100000)
+    parser.add_argument('--format', choices=transfer.FORMATS, default=transfer.JSONL)
+    parser.add_argument('--batch-size', type=int, default=transfer.BATCH_SIZE)
+    parser.add_argument('--trace', action='store_true', help='Report peak Python memory of each step.')
+    parser.add_argument('--sample', type=int, default=1000, help='Todos created one by one through the service for comparison.')
+    args = parser.parse_args()
+
+    setup_database()
+    source, = generate(users=1, todos=args.todos, subtasks=2, groups=50, prefix='source')
+    target = User.objects.create_user(username='target', password='password')
+
+    path = os.path.join(tempfile.mkdtemp(), f'todos.{args.format}')
+    def export():
+        with open(path, 'wb') as output:
+            for chunk in transfer.export_lines(source, args.format):
+                output.write(chunk)
+    _, elapsed, peak = timed(export, args.trace)
+    report(f'export {args.todos} {args.format}', {'seconds': elapsed, 'todos_per_s': args.todos / elapsed, 'peak_mb': peak / 2**20, 'file_mb': os.path.getsize(path) / 2**20})
+
+    def load():
+        with open(path, 'rb') as input:
+            return transfer.import_records(target, input, args.format, args.batch_size)
+    counts, elapsed, peak = timed(load, args.trace)
+    report(f'import {counts["todos"]} {args.format}', {'seconds': elapsed, 'todos_per_s': counts['todos'] / elapsed, 'peak_mb': peak / 2**20})
+
+    todos = list(TodoItem.objects.filter(user=source).values('title', 'content', 'date', 'checked')[:args.sample])
+    def one_by_one():
+        for todo in todos:
+            TodoItemService.create(**todo, subtasks=['a', 'b'], user=target)
+    _, elapsed, _ = timed(one_by_one, False)
+    report(f'TodoItemService.create x{len(todos)}', {'seconds': elapsed, 'todos_per_s': len(todos) / elapsed})
+
+
+if __name__ == '__main__':
+    main()
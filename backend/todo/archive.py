@@ -0,0 +1,73 @@
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import TodoItem, Subtask, ArchivedTodo, ArchivedSubtask
+from .services import TodoItemService
+
+
+# Moves checked todos that nobody has touched for TODO_ARCHIVE_AFTER_DAYS,
+# with their subtasks, from TodoItem/Subtask into ArchivedTodo and
+# ArchivedSubtask, so the hot tables and their indexes only hold what the
+# lists actually show. Archived todos drop out of every default read: lists,
+# groups, search and /stats/ counters. /todos/filter/?include_archived=true
+# reads both tiers.
+#
+# Recurring todos stay hot whatever their state, since they still produce
+# occurrences. Each batch is one transaction, so an archive run can be
+# stopped at any point and picked up by the next. Leaving the hot tier is a
+# TodoItemService.delete_many, so /sync/ clients get tombstones and the
+# counters and search index follow.
+
+FIELDS = ['id', 'title', 'content', 'created_at', 'updated_at', 'date', 'checked', 'group_id', 'repeat', 'user_id']
+SUBTASK_FIELDS = ['id', 'todo_id', 'position', 'content', 'checked', 'updated_at']
+
+
+def cutoff(days=None):
+    if days is None:
+        days = getattr(settings, 'TODO_ARCHIVE_AFTER_DAYS', 90)
+    return timezone.now() - datetime.timedelta(days=days)
+
+def candidates(before, users=None):
+    todos = TodoItem.objects.filter(checked=True, repeat='', date__lt=before.date(), updated_at__lt=before)
+    if users is not None:
+        todos = todos.filter(user__in=users)
+    return todos
+
+
+def archive_batch(before, batch_size, users=None, after=0):
+    # Archives up to batch_size candidates with ids above after and returns
+    # them, locked and re-checked inside the transaction so a todo
+    # unchecked meanwhile stays where it is.
+    with transaction.atomic():
+        todos = list(candidates(before, users).filter(id__gt=after).select_for_update().order_by('id')[:batch_size])
+        if not todos:
+            return todos
+        ids = [todo.id for todo in todos]
+        subtasks = list(Subtask.objects.filter(todo_id__in=ids))
+
+        ArchivedTodo.objects.bulk_create([ArchivedTodo(**{field: getattr(todo, field) for field in FIELDS}) for todo in todos])
+        ArchivedSubtask.objects.bulk_create([
+            ArchivedSubtask(**{field: getattr(subtask, field) for field in SUBTASK_FIELDS}) for subtask in subtasks
+        ])
+
+        TodoItemService.delete_many(todos)
+    return todos
+
+def archive(before=None, batch_size=None, users=None, progress=None):
+    # Archives every candidate, batch by batch, and returns how many todos
+    # were moved. progress, when given, is called with the running total.
+    before = before or cutoff()
+    batch_size = batch_size or getattr(settings, 'TODO_ARCHIVE_BATCH_SIZE', 1000)
+    total = 0
+    after = 0
+    while True:
+        todos = archive_batch(before, batch_size, users, after)
+        if not todos:
+            return total
+        total += len(todos)
+        after = todos[-1].id
+        if progress is not None:
+            progress(total)
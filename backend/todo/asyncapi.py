@@ -0,0 +1,111 @@
+import asyncio
+import weakref
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import HttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+
+from .authentication import CachedTokenAuthentication, AsyncSessionAuthentication
+from .compact import dumps
+
+
+# Under ASGI each request in flight runs its sync work on a thread of its
+# own, so five hundred open requests are five hundred threads contending
+# for the GIL and the database. At most TODO_ASYNC_MAX_ACTIVE requests of
+# the async views run at once per event loop, the counterpart of a WSGI
+# server's worker threads; the rest wait on the loop, holding no thread.
+semaphores = weakref.WeakKeyDictionary()
+
+def active_slot():
+    loop = asyncio.get_running_loop()
+    semaphore = semaphores.get(loop)
+    if semaphore is None:
+        semaphore = semaphores[loop] = asyncio.Semaphore(getattr(settings, 'TODO_ASYNC_MAX_ACTIVE', 16))
+    return semaphore
+
+
+class AsyncAPIView(View):
+    # DRF 3.15's APIView only dispatches sync handlers, so under ASGI every
+    # request pays a thread hop before the view runs. This covers the parts
+    # of APIView the todo API uses (parsing, authentication, IsAuthenticated
+    # and JSON rendering) on the event loop; handlers are async and read
+    # through the async ORM. Views that park a request, like the feed,
+    # set limited = False to wait outside active_slot().
+    authentication_classes = [CachedTokenAuthentication, AsyncSessionAuthentication]
+    parser_classes = api_settings.DEFAULT_PARSER_CLASSES
+    limited = True
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        request = Request(
+            request,
+            parsers=[parser() for parser in self.parser_classes],
+            authenticators=[authenticator() for authenticator in self.authentication_classes],
+        )
+        self.request = request
+        if not self.limited:
+            return await self.handle(request, *args, **kwargs)
+        async with active_slot():
+            return await self.handle(request, *args, **kwargs)
+
+    async def handle(self, request, *args, **kwargs):
+        try:
+            await self.authenticate(request)
+            response = await super().dispatch(request, *args, **kwargs)
+        except exceptions.APIException as error:
+            response = self.handle_exception(request, error)
+        except ObjectDoesNotExist:
+            # An id that is gone, or archived, answers like APIView's
+            # get_object_or_404 would.
+            response = self.handle_exception(request, exceptions.NotFound())
+        return self.finalize(response)
+
+    async def authenticate(self, request):
+        for authenticator in request.authenticators:
+            if hasattr(authenticator, 'aauthenticate'):
+                result = await authenticator.aauthenticate(request)
+            else:
+                result = await sync_to_async(authenticator.authenticate)(request)
+            if result is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = result
+                break
+        else:
+            request._not_authenticated()
+
+        if not request.user or not request.user.is_authenticated:
+            raise exceptions.NotAuthenticated()
+
+    def handle_exception(self, request, error):
+        if isinstance(error, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            header = self.authentication_classes[0]().authenticate_header(request)
+            if header:
+                error.auth_header = header
+            else:
+                error.status_code = 403
+        return exception_handler(error, {'view': self, 'request': request})
+
+    def finalize(self, response):
+        # Rendered here rather than left to the handler, which would render
+        # a TemplateResponse in another thread hop. dumps gives the same
+        # bytes as DRF's JSONRenderer, faster.
+        if not isinstance(response, Response):
+            return response
+        content = dumps(response.data) if response.data is not None else b''
+        rendered = HttpResponse(content, status=response.status_code, content_type='application/json')
+        for header, value in response.items():
+            if header != 'Content-Type':
+                rendered[header] = value
+        return rendered
@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication, SessionAuthentication, get_authorization_header
+
+
+class TokenCache:
+    # Bounded LRU of token key -> (user, token, expiry). Entries live for at
+    # most ttl seconds, which also bounds how long another process can keep
+    # serving a token that was revoked elsewhere.
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[0], entry[1]
+
+    def set(self, key, user, token):
+        with self.lock:
+            self.entries[key] = (user, token, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def evict(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def evict_user(self, user_id):
+        with self.lock:
+            for key in [key for key, entry in self.entries.items() if entry[0].id == user_id]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = TokenCache(
+    getattr(settings, 'TODO_AUTH_CACHE_SIZE', 10000),
+    getattr(settings, 'TODO_AUTH_CACHE_TTL', 60),
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    # Drop-in for TokenAuthentication that skips the Token/User query for
+    # keys seen recently. Invalidation comes from the signals in
+    # todo/signals.py: logout and rotation delete or replace the Token, and
+    # a password change saves the User.
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, user, token)
+        return user, token
+
+    def get_key(self, request):
+        # The header checks of TokenAuthentication.authenticate, without
+        # the lookup, so aauthenticate can await it.
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed(_('Invalid token header.'))
+        try:
+            return auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. Token string should not contain invalid characters.'))
+
+    async def aauthenticate(self, request):
+        key = self.get_key(request)
+        if key is None:
+            return None
+
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+
+        model = self.get_model()
+        try:
+            token = await model.objects.select_related('user').aget(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        token_cache.set(key, token.user, token)
+        return token.user, token
+
+
+class AsyncSessionAuthentication(SessionAuthentication):
+    async def aauthenticate(self, request):
+        user = await request._request.auser()
+        if not user or not user.is_active:
+            return None
+
+        self.enforce_csrf(request)
+        return user, None
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    # The stock SQLite backend plus the TODO_SQLITE_* tuning from settings:
+    # pragmas run on every new connection, and transactions open with
+    # TODO_SQLITE_TRANSACTION_MODE. Django 5.1 offers both through the
+    # init_command and transaction_mode options.
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in getattr(settings, 'TODO_SQLITE_PRAGMAS', {}).items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode = getattr(settings, 'TODO_SQLITE_TRANSACTION_MODE', '')
+        self.cursor().execute(f'BEGIN {mode}'.strip())
@@ -0,0 +1,125 @@
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db import transaction
+
+from .models import TodoItem, TodoGroup, Subtask
+from .services import TodoItemService, TodoGroupService, SubtaskService
+from .serializers import TodoInputSerializer, GroupInputSerializer, SubtaskInputSerializer
+
+
+SERVICES = {
+    'todo': TodoItemService,
+    'group': TodoGroupService,
+    'subtask': SubtaskService,
+}
+
+# Consecutive actions of these kinds are applied with one UPDATE.
+BULK_ACTIONS = {'check': True, 'uncheck': False}
+
+
+class BatchFailed(Exception):
+    pass
+
+
+def is_bulkable(item):
+    return item['target'] in ('todo', 'subtask') and item['action'] in BULK_ACTIONS
+
+def content_dict(item):
+    content = item.get('content')
+    return content if isinstance(content, dict) else {}
+
+
+def load_targets(user, actions):
+    ids = {target: set() for target in SERVICES}
+    for item in actions:
+        if 'id' in item:
+            ids[item['target']].add(item['id'])
+        if item['target'] == 'subtask' and item['action'] == 'create':
+            ids['todo'].add(content_dict(item).get('todo'))
+
+    return {
+        'todo': TodoItem.objects.filter(user=user).in_bulk(ids['todo']),
+        'group': TodoGroup.objects.filter(user=user).in_bulk(ids['group']),
+        'subtask': Subtask.objects.filter(todo__user=user).select_related('todo').in_bulk(ids['subtask']),
+    }
+
+def create(user, targets, target, content):
+    if target == 'subtask':
+        todo = targets['todo'].get(content.get('todo'))
+        if todo is None:
+            return {'error': 'Not found', 'status': False}
+        serializer = SubtaskInputSerializer(data=content)
+        if not serializer.is_valid():
+            return {'error': serializer.errors, 'status': False}
+        TodoItemService.add_subtask(todo, serializer.validated_data['content'])
+        return SERVICES[target].performed('create')
+
+    serializer_class = TodoInputSerializer if target == 'todo' else GroupInputSerializer
+    serializer = serializer_class(data=content)
+    if not serializer.is_valid():
+        return {'error': serializer.errors, 'status': False}
+    object = SERVICES[target].create(**serializer.validated_data, user=user)
+    targets[target][object.id] = object
+    return dict(SERVICES[target].performed('create'), id=object.id)
+
+def run_action(user, targets, item):
+    target, action, content = item['target'], item['action'], item.get('content')
+    service = SERVICES[target]
+
+    if action == 'create':
+        return create(user, targets, target, content_dict(item))
+
+    object = targets[target].get(item.get('id'))
+    if object is None:
+        return {'error': 'Not found', 'status': False}
+
+    try:
+        if action == 'delete':
+            service.delete(object.id)
+            del targets[target][item['id']]
+            return service.performed(action)
+        return service.perform(object, action, content)
+    except (KeyError, TypeError, ValueError, ObjectDoesNotExist, ValidationError):
+        return {'error': 'Invalid content', 'status': False}
+
+def run_bulk(targets, items):
+    # items share target and a BULK_ACTIONS action.
+    target, action = items[0]['target'], items[0]['action']
+    objects = [targets[target].get(item.get('id')) for item in items]
+    found = [object for object in objects if object is not None]
+    SERVICES[target].check_many(found, BULK_ACTIONS[action])
+    return [
+        SERVICES[target].performed(action) if object is not None else {'error': 'Not found', 'status': False}
+        for object in objects
+    ]
+
+def bulk_runs(actions):
+    # Splits actions into runs, merging consecutive bulkable actions that
+    # share a target and action so they can be applied together.
+    run = []
+    for item in actions:
+        if run and is_bulkable(item) and (run[0]['target'], run[0]['action']) == (item['target'], item['action']):
+            run.append(item)
+            continue
+        if run:
+            yield run
+        run = [item]
+    if run:
+        yield run
+
+def run_batch(user, actions):
+    # All actions run in one transaction: if any of them fails nothing is
+    # kept, and the results say which ones failed.
+    results = []
+    try:
+        with transaction.atomic():
+            targets = load_targets(user, actions)
+            for run in bulk_runs(actions):
+                if is_bulkable(run[0]):
+                    results += run_bulk(targets, run)
+                else:
+                    results.append(run_action(user, targets, run[0]))
+            if not all(result['status'] for result in results):
+                raise BatchFailed()
+    except BatchFailed:
+        return False, results
+    return True, results
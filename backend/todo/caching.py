@@ -0,0 +1,123 @@
+import datetime
+import hashlib
+import secrets
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from rest_framework.response import Response
+
+
+# Responses are cached per process (TODO_CACHE), but the per-user versions
+# keying them live in TODO_VERSION_CACHE, which every process writing todos
+# must share: the web workers, runworker and the commands. A version is a
+# fresh random value on every bump rather than a counter, so two processes
+# bumping at once can lose one write but never leave the version at a value
+# a reader has already seen.
+
+def get_cache():
+    return caches[getattr(settings, 'TODO_CACHE', 'default')]
+
+def get_version_cache():
+    return caches[getattr(settings, 'TODO_VERSION_CACHE', getattr(settings, 'TODO_CACHE', 'default'))]
+
+def in_memory(cache):
+    # LocMem never blocks, so async callers use it without a thread hop.
+    return isinstance(cache, LocMemCache)
+
+def shared_versions():
+    # False when bumps made in this process never reach the others.
+    return not in_memory(get_version_cache())
+
+def version_key(user_id):
+    return f'todo:version:{user_id}'
+
+def new_version():
+    return secrets.token_hex(8)
+
+def get_version(user_id):
+    cache = get_version_cache()
+    version = cache.get(version_key(user_id))
+    if version is None:
+        # A fresh version can never match an ETag handed out before the
+        # entry was evicted.
+        version = new_version()
+        cache.add(version_key(user_id), version, timeout=None)
+        version = cache.get(version_key(user_id), version)
+    return version
+
+async def aget_version(user_id):
+    cache = get_version_cache()
+    if in_memory(cache):
+        return get_version(user_id)
+    version = await cache.aget(version_key(user_id))
+    if version is None:
+        version = new_version()
+        await cache.aadd(version_key(user_id), version, timeout=None)
+        version = await cache.aget(version_key(user_id), version)
+    return version
+
+def _bump(user_id):
+    get_version_cache().set(version_key(user_id), new_version(), timeout=None)
+
+def bump_version(user_id):
+    # Bump now so the writer's own next read is fresh, and again after
+    # commit so nothing cached from a concurrent read of the pre-commit
+    # state survives.
+    _bump(user_id)
+    transaction.on_commit(lambda: _bump(user_id))
+
+
+def response_key(request, user_id, version):
+    digest = hashlib.sha1(f'{request.get_full_path()}|{datetime.date.today()}'.encode()).hexdigest()[:16]
+    return f'"{user_id}-{version}-{digest}"', f'todo:response:{user_id}:{version}:{digest}'
+
+def cached_response(request, build):
+    # Serves list endpoints from the per-user cache. The ETag and cache key
+    # both carry the user's version, so any service mutation invalidates
+    # them and unchanged lists are answered with a 304 without a query.
+    if request.query_params.get('stream') == '1':
+        return build()
+
+    user_id = request.user.id
+    etag, key = response_key(request, user_id, get_version(user_id))
+
+    if etag in request.headers.get('If-None-Match', ''):
+        return Response(status=304, headers={'ETag': etag})
+
+    cache = get_cache()
+    data = cache.get(key)
+    if data is not None:
+        return Response(data, headers={'ETag': etag})
+
+    response = build()
+    if response.status_code == 200:
+        cache.set(key, response.data)
+        response['ETag'] = etag
+    return response
+
+async def acached_response(request, build):
+    # cached_response for async views; build is a coroutine function.
+    if request.query_params.get('stream') == '1':
+        return await build()
+
+    user_id = request.user.id
+    etag, key = response_key(request, user_id, await aget_version(user_id))
+
+    if etag in request.headers.get('If-None-Match', ''):
+        return Response(status=304, headers={'ETag': etag})
+
+    cache = get_cache()
+    data = cache.get(key) if in_memory(cache) else await cache.aget(key)
+    if data is not None:
+        return Response(data, headers={'ETag': etag})
+
+    response = await build()
+    if response.status_code == 200:
+        if in_memory(cache):
+            cache.set(key, response.data)
+        else:
+            await cache.aset(key, response.data)
+        response['ETag'] = etag
+    return response
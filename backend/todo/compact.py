@@ -0,0 +1,190 @@
+import time
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import TodoItem, TodoGroup
+from .selectors import subtask_queryset, archived_subtask_queryset
+from . import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Read path for the list endpoints. Rows go from .values() straight into
+# plain dicts, without model instances or DRF field objects, and are
+# encoded with orjson when it is installed. The bytes are exactly those of
+# TodoOutputSerializer/GroupOutputSerializer rendered by DRF's JSONRenderer;
+# CompactSerializerTest holds the two paths to that.
+
+renderer = JSONRenderer()
+encoder = JSONEncoder()
+
+if orjson is not None:
+    # Datetimes and dataclasses go through DRF's encoder, as they would
+    # with the json module.
+    OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+def dumps(data):
+    if orjson is not None:
+        try:
+            content = orjson.dumps(data, default=encoder.default, option=OPTIONS)
+        except TypeError:
+            # Non-string keys, integers past 64 bits and the like.
+            return renderer.render(data)
+        # JSONRenderer escapes these two so the output is valid JavaScript.
+        if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+            content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return content
+    return renderer.render(data)
+
+
+def format_datetime(value):
+    # DateTimeField.to_representation with the default ISO 8601 format.
+    if value is None:
+        return None
+    value = value.astimezone(timezone.get_current_timezone()).isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+def format_date(value):
+    return value.isoformat() if value is not None else None
+
+def timed(build):
+    # Reports the row building time like TimedSerializer does.
+    def wrapper(*args):
+        began = time.perf_counter()
+        try:
+            return build(*args)
+        finally:
+            metrics.add_serializer_time(time.perf_counter() - began)
+    return wrapper
+
+async def aiterate(rows, chunk_size):
+    # Drives a sync generator from a thread, chunk_size items per hop.
+    # Django 5.0's aiterator() opens values_list() cursors on the event
+    # loop, so the compact streams cannot use it.
+    next_chunk = sync_to_async(lambda: list(islice(rows, chunk_size)))
+    while True:
+        chunk = await next_chunk()
+        for item in chunk:
+            yield item
+        if len(chunk) < chunk_size:
+            break
+
+def grouped(pairs):
+    result = {}
+    for key, value in pairs:
+        result.setdefault(key, []).append(value)
+    return result
+
+
+class CompactSerializer:
+    # Subclasses name the .values_list() fields of the main rows and build
+    # dicts from them plus whatever related rows related() fetches for a
+    # batch of ids. Related rows are fetched per BATCH_SIZE rows, so a page
+    # costs two or three queries whatever its size and a long list stays
+    # under the database's limit on query parameters.
+    fields = ()
+    BATCH_SIZE = 2000
+
+    @classmethod
+    def values(cls, queryset):
+        return queryset.select_related(None).prefetch_related(None).values_list(*cls.fields)
+
+    @classmethod
+    def related(cls, ids):
+        return {}
+
+    @classmethod
+    def build(cls, rows, related):
+        raise NotImplementedError
+
+    @classmethod
+    def rows(cls, queryset):
+        return list(cls.stream(queryset, cls.BATCH_SIZE))
+
+    @classmethod
+    async def arows(cls, queryset):
+        return await sync_to_async(cls.rows)(queryset)
+
+    @classmethod
+    def stream(cls, queryset, chunk_size):
+        chunk = []
+        for row in cls.values(queryset).iterator(chunk_size=chunk_size):
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield from timed(cls.build)(chunk, cls.related([row[0] for row in chunk]))
+                chunk = []
+        if chunk:
+            yield from timed(cls.build)(chunk, cls.related([row[0] for row in chunk]))
+
+    @classmethod
+    def astream(cls, queryset, chunk_size):
+        return aiterate(cls.stream(queryset, chunk_size), chunk_size)
+
+
+class CompactTodoSerializer(CompactSerializer):
+    fields = ('id', 'title', 'content', 'created_at', 'date', 'checked', 'repeat', 'group_id', 'group__name')
+
+    @classmethod
+    def subtasks(cls, ids):
+        # The same query the list's subtask prefetch runs, so the index
+        # and the order match.
+        return subtask_queryset().filter(todoitem__in=ids).values_list('todoitem', 'id', 'index', 'checked', 'content')
+
+    @classmethod
+    def related(cls, ids):
+        subtasks = cls.subtasks(ids)
+        return grouped(
+            (todo_id, {'id': id, 'index': index, 'checked': bool(checked), 'content': content})
+            for todo_id, id, index, checked, content in subtasks
+        )
+
+    @classmethod
+    def build(cls, rows, subtasks):
+        return [
+            {
+                'id': id,
+                'title': title,
+                'content': content,
+                'created_at': format_datetime(created_at),
+                'date': format_date(date),
+                'checked': bool(checked),
+                'repeat': repeat,
+                'group': {'id': group_id, 'name': group_name} if group_id is not None else None,
+                'subtasks': subtasks.get(id, []),
+            }
+            for id, title, content, created_at, date, checked, repeat, group_id, group_name in rows
+        ]
+
+
+class CompactArchivedTodoSerializer(CompactTodoSerializer):
+    # ArchivedTodo has the same fields; its subtasks hang off a foreign key
+    # rather than the M2M table.
+    @classmethod
+    def subtasks(cls, ids):
+        return archived_subtask_queryset().filter(todo__in=ids).values_list('todo', 'id', 'index', 'checked', 'content')
+
+
+class CompactGroupSerializer(CompactSerializer):
+    fields = ('id', 'name', 'parent_id')
+
+    @classmethod
+    def related(cls, ids):
+        Childs = TodoGroup.childs.through
+        childs = Childs.objects.filter(from_todogroup_id__in=ids).order_by('to_todogroup_id').values_list('from_todogroup_id', 'to_todogroup_id')
+        todos = TodoItem.objects.filter(group_id__in=ids).order_by('id').values_list('group_id', 'id')
+        return {'childs': grouped(childs), 'todos': grouped(todos)}
+
+    @classmethod
+    def build(cls, rows, related):
+        childs, todos = related['childs'], related['todos']
+        return [
+            {'id': id, 'name': name, 'childs': childs.get(id, []), 'parent': parent_id, 'todos': todos.get(id, [])}
+            for id, name, parent_id in rows
+        ]
@@ -0,0 +1,87 @@
+import datetime
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .models import TodoItem, TodoGroup, Subtask
+from . import grouptree, search, stats
+
+
+BATCH_SIZE = 1000
+REPEATS = ['daily', 'weekly', 'monthly', 'FREQ=WEEKLY;BYDAY=MO,WE,FR', 'FREQ=DAILY;INTERVAL=3;COUNT=10']
+WORDS = ['buy', 'call', 'write', 'review', 'plan', 'fix', 'clean', 'read', 'send', 'book', 'pay', 'prepare']
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+def make_groups(rng, user, count, depth):
+    # The first depth groups form a chain, so every user has a tree at
+    # least that deep; the rest hang off random groups or become roots.
+    groups = TodoGroup.objects.bulk_create(
+        [TodoGroup(name=sentence(rng, 2), user=user) for _ in range(count)], batch_size=BATCH_SIZE,
+    )
+    for i, group in enumerate(groups):
+        if i == 0 or (i >= depth and rng.random() < 0.1):
+            parent = None
+        elif i < depth:
+            parent = groups[i - 1]
+        else:
+            parent = rng.choice(groups[:i])
+        group.parent = parent
+        group.path = grouptree.path_for(parent, group.id)
+    TodoGroup.objects.bulk_update(groups, ['parent', 'path'], batch_size=BATCH_SIZE)
+
+    Childs = TodoGroup.childs.through
+    Childs.objects.bulk_create(
+        [Childs(from_todogroup_id=group.parent_id, to_todogroup_id=group.id) for group in groups if group.parent_id],
+        batch_size=BATCH_SIZE,
+    )
+    return groups
+
+def make_todos(rng, user, groups, count, subtasks, recurring):
+    today = datetime.date.today()
+    todos = []
+    for _ in range(count):
+        date = today + datetime.timedelta(days=rng.randint(-60, 60))
+        todos.append(TodoItem(
+            title=sentence(rng, 3),
+            content=sentence(rng, 12),
+            date=date,
+            checked=rng.random() < (0.7 if date < today else 0.1),
+            group=rng.choice(groups) if groups and rng.random() < 0.8 else None,
+            repeat=rng.choice(REPEATS) if rng.random() < recurring else '',
+            user=user,
+        ))
+    todos = TodoItem.objects.bulk_create(todos, batch_size=BATCH_SIZE)
+
+    rows = [
+        Subtask(todo=todo, content=sentence(rng, 3), checked=rng.random() < 0.3, position=(i + 1) * Subtask.GAP)
+        for todo in todos for i in range(rng.randint(0, 2 * subtasks))
+    ]
+    rows = Subtask.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    Links = TodoItem.subtasks.through
+    Links.objects.bulk_create([Links(todoitem_id=row.todo_id, subtask_id=row.id) for row in rows], batch_size=BATCH_SIZE)
+    return todos, rows
+
+
+def generate(users=10, todos=500, subtasks=3, groups=20, depth=8, recurring=0.1, prefix='user', password='password', seed=0):
+    # Writes a synthetic dataset straight through bulk inserts, keeping the
+    # same invariants the services do (group paths, M2M mirrors, sparse
+    # subtask positions, counters, search index). Counts are per user
+    # except subtasks, which is the average per todo. Returns the created
+    # users.
+    rng = random.Random(seed)
+    hashed = make_password(password)
+    created = []
+    for i in range(users):
+        with transaction.atomic():
+            user = User.objects.create(username=f'{prefix}{i}', password=hashed)
+            user_groups = make_groups(rng, user, groups, depth) if groups else []
+            make_todos(rng, user, user_groups, todos, subtasks, recurring)
+            stats.rebuild(user)
+            search.index_user(user.id)
+        created.append(user)
+    return created
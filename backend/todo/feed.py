@@ -0,0 +1,66 @@
+import asyncio
+import threading
+
+
+# In-process pub/sub behind /feed/. The services publish a user's id once
+# a write to their data commits; every feed request of that user waiting
+# in this process wakes up and reads what changed through syncing.changes.
+# Notifications carry no data and coalesce, since a woken client fetches
+# everything since its cursor anyway. Publishers may be any thread;
+# subscribers are coroutines, woken on their own event loop.
+
+class Subscription:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+
+    def notify(self):
+        try:
+            self.loop.call_soon_threadsafe(self.event.set)
+        except RuntimeError:
+            # The loop closed under a request that is going away.
+            pass
+
+    async def wait(self, timeout):
+        # True when notified within timeout; notifications that arrived
+        # since the last wait count.
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self.event.clear()
+        return True
+
+
+class Bus:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = {}
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id)
+        with self.lock:
+            self.subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.subscribers[subscription.user_id]
+
+    def publish(self, user_id):
+        with self.lock:
+            subscribers = list(self.subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            subscription.notify()
+
+    def count(self):
+        with self.lock:
+            return sum(len(subscribers) for subscribers in self.subscribers.values())
+
+
+bus = Bus()
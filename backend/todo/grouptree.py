@@ -0,0 +1,112 @@
+from django.db import connection, transaction
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
+
+from .models import TodoGroup, TodoItem
+
+
+TABLE = TodoGroup._meta.db_table
+
+# Guards the recursive queries against rows that already form a cycle.
+MAX_DEPTH = 10000
+
+ANCESTORS_SQL = f'''
+    WITH RECURSIVE ancestors(id, parent_id, depth) AS (
+        SELECT id, parent_id, 0 FROM {TABLE} WHERE id = %s
+        UNION ALL
+        SELECT g.id, g.parent_id, a.depth + 1 FROM {TABLE} g
+        JOIN ancestors a ON g.id = a.parent_id
+        WHERE a.depth < {MAX_DEPTH}
+    )
+'''
+
+DESCENDANTS_SQL = f'''
+    WITH RECURSIVE descendants(id, name, parent_id, depth) AS (
+        SELECT id, name, parent_id, 0 FROM {TABLE} WHERE {{root}}
+        UNION ALL
+        SELECT g.id, g.name, g.parent_id, d.depth + 1 FROM {TABLE} g
+        JOIN descendants d ON g.parent_id = d.id
+        WHERE d.depth < {MAX_DEPTH}
+    )
+'''
+
+
+def _fetch(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+def _group_id(group):
+    return group.id if isinstance(group, TodoGroup) else int(group)
+
+
+def ancestors(group):
+    # Closest first, the group itself excluded.
+    rows = _fetch(ANCESTORS_SQL + 'SELECT id FROM ancestors WHERE depth > 0 ORDER BY depth', [_group_id(group)])
+    return [row[0] for row in rows]
+
+def descendants(group):
+    rows = _fetch(DESCENDANTS_SQL.format(root='id = %s') + 'SELECT id FROM descendants WHERE depth > 0 ORDER BY depth, id', [_group_id(group)])
+    return [row[0] for row in rows]
+
+def in_subtree(root, group):
+    # True when group is root or one of its descendants, found by walking
+    # up from group so the cost is bounded by its depth.
+    rows = _fetch(ANCESTORS_SQL + 'SELECT 1 FROM ancestors WHERE id = %s LIMIT 1', [_group_id(group), _group_id(root)])
+    return bool(rows)
+
+def tree(user):
+    rows = _fetch(DESCENDANTS_SQL.format(root='parent_id IS NULL AND user_id = %s') + 'SELECT id, name, parent_id FROM descendants ORDER BY depth, id', [user.id])
+
+    nodes = {}
+    roots = []
+    for id, name, parent_id in rows:
+        node = {'id': id, 'name': name, 'children': []}
+        nodes[id] = node
+        if parent_id is None:
+            roots.append(node)
+        else:
+            nodes[parent_id]['children'].append(node)
+    return roots
+
+
+# Materialized paths: every group stores the ids from its root down to
+# itself as '/1/5/9/'. A subtree is then the index range of paths sharing
+# the prefix; '0' sorts right after '/', so [path, path[:-1] + '0') holds
+# exactly the paths that start with path. That needs byte order, which
+# PostgreSQL only has under the "C" collation, so there the prefix match
+# goes through the text_pattern_ops index Django adds next to the plain one.
+
+def path_for(parent, id):
+    return (parent.path if parent is not None else '/') + f'{id}/'
+
+def subtree_range(path, field='path'):
+    if connection.vendor == 'postgresql':
+        return {field + '__startswith': path}
+    return {field + '__gte': path, field + '__lt': path[:-1] + '0'}
+
+def contains(root, group):
+    if root.path and group.path:
+        return group.path.startswith(root.path)
+    return in_subtree(root, group)
+
+def subtree(group):
+    return TodoGroup.objects.filter(**subtree_range(group.path))
+
+def subtree_todos(group):
+    return TodoItem.objects.filter(**subtree_range(group.path, 'group__path'))
+
+def subtree_todo_count(group):
+    return subtree_todos(group).count()
+
+def set_parent(group, parent):
+    old_path = group.path
+    group.parent = parent
+    group.path = path_for(parent, group.id)
+
+    with transaction.atomic():
+        if old_path and old_path != group.path:
+            TodoGroup.objects.filter(**subtree_range(old_path)).exclude(id=group.id).update(
+                path=Concat(Value(group.path), Substr('path', len(old_path) + 1))
+            )
+        group.save()
@@ -0,0 +1,50 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password, check_password
+
+
+class HashingBusy(Exception):
+    pass
+
+
+# PBKDF2 is CPU bound and deliberately slow. Hashes run on a small pool so a
+# burst of logins can use at most TODO_HASH_WORKERS cores, and at most
+# TODO_HASH_MAX_PENDING of them may be running or queued; past that callers
+# are turned away instead of piling up behind the pool.
+executor = ThreadPoolExecutor(max_workers=getattr(settings, 'TODO_HASH_WORKERS', 2), thread_name_prefix='password-hash')
+slots = threading.BoundedSemaphore(getattr(settings, 'TODO_HASH_MAX_PENDING', 16))
+
+
+def submit(function, *args):
+    if not slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        future = executor.submit(function, *args)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda future: slots.release())
+    return future
+
+async def ahash_password(raw_password):
+    return await asyncio.wrap_future(submit(make_password, raw_password))
+
+def check_user_password(user, raw_password):
+    # Like User.check_password, a hash made with an outdated hasher or
+    # iteration count is replaced on success. The new hash is made here on
+    # the pool; the caller saves it.
+    upgraded = []
+    def setter(raw_password):
+        user.set_password(raw_password)
+        upgraded.append(True)
+    return check_password(raw_password, user.password, setter), bool(upgraded)
+
+async def acheck_password(user, raw_password):
+    valid, upgraded = await asyncio.wrap_future(submit(check_user_password, user, raw_password))
+    if upgraded:
+        user._password = None
+        await user.asave(update_fields=['password'])
+    return valid
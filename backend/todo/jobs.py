@@ -0,0 +1,207 @@
+import datetime
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import TodoGroup, ArchivedTodo, Job
+from .services import TodoItemService, TodoGroupService, notify
+from . import grouptree, membership, search, stats
+
+
+logger = logging.getLogger(__name__)
+
+# Database-backed queue for work too large for a request: deleting a big
+# group subtree, rewriting a group's members and children, rebuilding a
+# user's counters and search index. The views enqueue a Job and answer 202
+# with its id; `manage.py runworker` claims jobs oldest first and runs them
+# in TODO_JOB_CHUNK_SIZE-row transactions, so no single write holds the
+# SQLite lock for long and readers see the work progress. Every handler
+# can be run again from the start, which is what happens to a job whose
+# worker died (see requeue_stale).
+
+DELETE_GROUP = 'delete_group'
+UPDATE_GROUP = 'update_group'
+REBUILD = 'rebuild'
+
+
+def chunk_size():
+    return getattr(settings, 'TODO_JOB_CHUNK_SIZE', 500)
+
+def inline_limit():
+    # Work on up to this many rows still runs inside the request.
+    return getattr(settings, 'TODO_JOB_INLINE_LIMIT', 500)
+
+def pause():
+    # Between two chunks, so writers waiting on the lock get it. SQLite
+    # waiters poll with growing sleeps and would otherwise keep missing the
+    # gap between back-to-back transactions.
+    time.sleep(getattr(settings, 'TODO_JOB_CHUNK_PAUSE', 0.05))
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def enqueue(user, kind, **params):
+    return Job.objects.create(user=user, kind=kind, params=params)
+
+async def aenqueue(user, kind, **params):
+    return await Job.objects.acreate(user=user, kind=kind, params=params)
+
+def report(job, done, total=None):
+    # Saved after every chunk, which also keeps the heartbeat fresh.
+    job.done = done
+    fields = ['done', 'updated_at']
+    if total is not None:
+        job.total = total
+        fields.append('total')
+    job.save(update_fields=fields)
+
+
+def claim():
+    # The oldest queued job, marked running. Workers on PostgreSQL skip
+    # each other's locked rows; SQLite transactions already take the write
+    # lock up front, so two workers cannot claim the same job.
+    with transaction.atomic():
+        job = Job.objects.select_for_update(skip_locked=True).filter(status=Job.QUEUED).order_by('id').first()
+        if job is None:
+            return None
+        job.status = Job.RUNNING
+        job.started_at = timezone.now()
+        job.attempts += 1
+        job.save(update_fields=['status', 'started_at', 'attempts', 'updated_at'])
+    return job
+
+def run(job):
+    try:
+        HANDLERS[job.kind](job)
+    except Exception as error:
+        logger.exception('Job %s (%s) failed', job.id, job.kind)
+        job.status = Job.FAILED
+        job.error = str(error) or error.__class__.__name__
+    else:
+        job.status = Job.DONE
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at', 'updated_at'])
+    return job
+
+def run_next():
+    job = claim()
+    return run(job) if job is not None else None
+
+def requeue_stale():
+    # Running jobs that have not reported progress for TODO_JOB_STALE_AFTER
+    # seconds lost their worker; they go back to the queue.
+    stale = timezone.now() - datetime.timedelta(seconds=getattr(settings, 'TODO_JOB_STALE_AFTER', 300))
+    return Job.objects.filter(status=Job.RUNNING, updated_at__lt=stale).update(status=Job.QUEUED)
+
+
+# Sizing, so the views only queue what is worth queueing.
+
+def delete_size(group):
+    # The groups of the subtree, group included, and their todos, from one
+    # scan of its path range.
+    counts = grouptree.subtree(group).aggregate(groups=Count('id', distinct=True), todos=Count('todos'))
+    return counts['groups'] + counts['todos']
+
+def update_size(changes):
+    # Only what differs from the stored membership gets written, so a save
+    # that sends back a large group unchanged still runs inline. changes
+    # are membership.changes for the save.
+    return sum(len(ids) for pair in changes for ids in pair)
+
+
+# Handlers
+
+def delete_group(job):
+    # Todos go first, a chunk per transaction, then archived todos, then
+    # the groups deepest first, so every chunk deletes rows nothing else
+    # still points at and the cascade never fans out.
+    group = TodoGroup.objects.filter(id=job.params['group'], user=job.user).first()
+    if group is None:
+        report(job, 0, 0)
+        return
+
+    groups = sorted(grouptree.subtree(group).values_list('id', 'path'), key=lambda row: -row[1].count('/'))
+    group_ids = [id for id, _ in groups]
+    todos = grouptree.subtree_todos(group).order_by('id')
+    archived = ArchivedTodo.objects.filter(group_id__in=group_ids).order_by('id')
+    done = 0
+    report(job, done, todos.count() + archived.count() + len(group_ids))
+
+    while True:
+        with transaction.atomic():
+            batch = list(todos.select_for_update()[:chunk_size()])
+            TodoItemService.delete_many(batch)
+        if not batch:
+            break
+        done += len(batch)
+        report(job, done)
+        pause()
+
+    while True:
+        ids = list(archived.values_list('id', flat=True)[:chunk_size()])
+        if not ids:
+            break
+        ArchivedTodo.objects.filter(id__in=ids).delete()
+        done += len(ids)
+        report(job, done)
+        pause()
+
+    for ids in chunks(group_ids, chunk_size()):
+        with transaction.atomic():
+            TodoGroup.objects.filter(id__in=ids).delete()
+            notify(job.user_id)
+        done += len(ids)
+        report(job, done)
+        pause()
+
+def update_group(job):
+    # TodoGroupService.update, with the membership changes applied a chunk
+    # per transaction.
+    params = job.params
+    group = TodoGroup.objects.filter(id=params['group'], user=job.user).first()
+    if group is None:
+        report(job, 0, 0)
+        return
+
+    with transaction.atomic():
+        parent = TodoGroup.objects.filter(id=params['parent']).first() if params.get('parent') is not None else None
+        TodoGroupService.save_group(group, params['name'], parent)
+        notify(job.user_id)
+    (added, removed), (adopted, dropped) = membership.changes(group, params['todos'], params['childs'])
+    steps = [(ids, lambda ids: membership.move_todos(ids, None, source=group)) for ids in chunks(removed, chunk_size())]
+    steps += [(ids, lambda ids: membership.move_todos(ids, group)) for ids in chunks(added, chunk_size())]
+    steps += [(ids, lambda ids: membership.remove_childs(group, ids)) for ids in chunks(dropped, chunk_size())]
+    steps += [(ids, lambda ids: membership.add_childs(group, ids)) for ids in chunks(adopted, chunk_size())]
+    done = 0
+    report(job, done, len(added) + len(removed) + len(adopted) + len(dropped))
+
+    for ids, apply in steps:
+        with transaction.atomic():
+            apply(ids)
+            notify(job.user_id)
+        done += len(ids)
+        report(job, done)
+        pause()
+    TodoGroupService.touch(group)
+
+def rebuild(job):
+    report(job, 0, 2)
+    stats.rebuild(job.user)
+    report(job, 1)
+    with transaction.atomic():
+        search.index_user(job.user_id)
+        notify(job.user_id)
+    report(job, 2)
+
+
+HANDLERS = {
+    DELETE_GROUP: delete_group,
+    UPDATE_GROUP: update_group,
+    REBUILD: rebuild,
+}
@@ -0,0 +1,31 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from todo import archive
+
+
+class Command(BaseCommand):
+    help = 'Move old checked todos and their subtasks into the archive tables, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Archive todos older than this; defaults to TODO_ARCHIVE_AFTER_DAYS.')
+        parser.add_argument('--batch-size', type=int, help='Todos per transaction; defaults to TODO_ARCHIVE_BATCH_SIZE.')
+        parser.add_argument('--user', action='append', default=[], help='Username to archive; repeatable. Defaults to everyone.')
+
+    def handle(self, *args, **options):
+        users = None
+        if options['user']:
+            users = User.objects.filter(username__in=options['user'])
+            missing = set(options['user']) - set(users.values_list('username', flat=True))
+            if missing:
+                raise CommandError('Unknown users: ' + ', '.join(sorted(missing)))
+
+        began = time.perf_counter()
+        def progress(total):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{total} todos archived')
+
+        total = archive.archive(archive.cutoff(options['days']), options['batch_size'], users, progress)
+        self.stdout.write(self.style.SUCCESS(f'Archived {total} todos in {time.perf_counter() - began:.1f}s'))
@@ -0,0 +1,39 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from todo import membership
+from todo.services import notify
+
+
+class Command(BaseCommand):
+    help = 'Check that group children, paths and todo memberships agree, and optionally repair them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', default=[], help='Username to check; repeatable. Defaults to everyone.')
+        parser.add_argument('--fix', action='store_true', help='Repair what is found, trusting TodoItem.group and TodoGroup.parent.')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['user']:
+            users = users.filter(username__in=options['user'])
+            missing = set(options['user']) - set(users.values_list('username', flat=True))
+            if missing:
+                raise CommandError('Unknown users: ' + ', '.join(sorted(missing)))
+
+        total = 0
+        for user in users.iterator():
+            problems = membership.check(user)
+            found = sum(len(rows) for rows in problems.values())
+            if not found:
+                continue
+            total += found
+            for problem, rows in problems.items():
+                if rows:
+                    self.stdout.write(f'{user.username}: {len(rows)} {problem.replace("_", " ")}')
+            if options['fix']:
+                membership.repair(user, problems)
+                notify(user.id)
+
+        if total and not options['fix']:
+            raise CommandError(f'{total} membership problems found; run with --fix to repair them')
+        self.stdout.write(self.style.SUCCESS(f'Checked membership; {total} problems {"fixed" if total else "found"}'))
@@ -0,0 +1,35 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from todo import transfer
+
+
+class Command(BaseCommand):
+    help = "Write a user's groups, todos and subtasks as JSONL or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', help='Username to export.')
+        parser.add_argument('--output', default='-', help='File to write; - for stdout.')
+        parser.add_argument('--format', choices=transfer.FORMATS, help='Defaults to the extension of --output, else jsonl.')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['user']).first()
+        if user is None:
+            raise CommandError(f'Unknown user: {options["user"]}')
+        format = options['format'] or transfer.format_for(options['output'])
+
+        if options['output'] != '-':
+            with open(options['output'], 'wb') as output:
+                for chunk in transfer.export_lines(user, format):
+                    output.write(chunk)
+            return
+
+        # Straight to the binary stream when there is one, so nothing is
+        # decoded or newline-translated on the way.
+        output = getattr(self.stdout, 'buffer', None)
+        for chunk in transfer.export_lines(user, format):
+            if output is not None:
+                output.write(chunk)
+            else:
+                self.stdout.write(chunk.decode(), ending='')
+        self.stdout.flush()
@@ -0,0 +1,40 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from todo.datasets import generate
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic dataset of users, group trees, todos and subtasks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--todos', type=int, default=500, help='Todos per user.')
+        parser.add_argument('--subtasks', type=int, default=3, help='Average subtasks per todo.')
+        parser.add_argument('--groups', type=int, default=20, help='Groups per user.')
+        parser.add_argument('--depth', type=int, default=8, help='Depth of the deepest group chain per user.')
+        parser.add_argument('--recurring', type=float, default=0.1, help='Fraction of todos that repeat.')
+        parser.add_argument('--prefix', default='user', help='Usernames are <prefix><n>.')
+        parser.add_argument('--password', default='password')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--clear', action='store_true', help='Delete existing users with the prefix first.')
+
+    def handle(self, *args, **options):
+        existing = User.objects.filter(username__startswith=options['prefix'])
+        if options['clear']:
+            existing.delete()
+        elif existing.exists():
+            raise CommandError(f'Users named {options["prefix"]}* already exist; use --clear or another --prefix.')
+
+        began = time.perf_counter()
+        users = generate(
+            users=options['users'], todos=options['todos'], subtasks=options['subtasks'], groups=options['groups'],
+            depth=options['depth'], recurring=options['recurring'], prefix=options['prefix'],
+            password=options['password'], seed=options['seed'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(users)} users with {options["todos"]} todos and {options["groups"]} groups each '
+            f'in {time.perf_counter() - began:.1f}s'
+        ))
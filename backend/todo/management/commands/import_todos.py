@@ -0,0 +1,43 @@
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from todo import transfer
+
+
+class Command(BaseCommand):
+    help = 'Load groups, todos and subtasks from JSONL or CSV into a user, in batched transactions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', help='Username to import into.')
+        parser.add_argument('input', help='File to read; - for stdin.')
+        parser.add_argument('--format', choices=transfer.FORMATS, help='Defaults to the extension of input, else jsonl.')
+        parser.add_argument('--batch-size', type=int, default=transfer.BATCH_SIZE, help='Todos per transaction.')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['user']).first()
+        if user is None:
+            raise CommandError(f'Unknown user: {options["user"]}')
+        format = options['format'] or transfer.format_for(options['input'])
+
+        began = time.perf_counter()
+        def progress(counts):
+            elapsed = time.perf_counter() - began
+            self.stderr.write(f'{counts["todos"]} todos, {counts["groups"]} groups ({counts["todos"] / elapsed:.0f} todos/s)')
+
+        importer = transfer.Importer(user, options['batch_size'], progress if options['verbosity'] else None)
+        try:
+            if options['input'] == '-':
+                counts = importer.run(transfer.read(sys.stdin.buffer, format))
+            else:
+                with open(options['input'], 'rb') as input:
+                    counts = importer.run(transfer.read(input, format))
+        except transfer.TransferError as error:
+            raise CommandError(f'Line {error.line}: {error} ({importer.counts["todos"]} todos imported before it)')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {counts["todos"]} todos, {counts["subtasks"]} subtasks and {counts["groups"]} groups '
+            f'in {time.perf_counter() - began:.1f}s'
+        ))
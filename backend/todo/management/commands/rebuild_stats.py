@@ -0,0 +1,29 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from todo import stats
+from todo.services import notify
+
+
+class Command(BaseCommand):
+    help = 'Recompute the /stats/ counters from the todos and report how many rows had drifted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', default=[], help='Username to rebuild; repeatable. Defaults to everyone.')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['user']:
+            users = users.filter(username__in=options['user'])
+            missing = set(options['user']) - set(users.values_list('username', flat=True))
+            if missing:
+                raise CommandError('Unknown users: ' + ', '.join(sorted(missing)))
+
+        total = 0
+        for user in users.iterator():
+            drift = stats.rebuild(user)
+            total += drift
+            if drift:
+                notify(user.id)
+                self.stdout.write(f'{user.username}: {drift} counter rows fixed')
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt counters; {total} rows had drifted'))
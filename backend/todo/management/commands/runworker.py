@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from todo import jobs
+from todo.caching import shared_versions
+
+
+class Command(BaseCommand):
+    help = 'Run queued jobs (large group deletes and updates, rebuilds) until stopped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run every queued job, then exit.')
+        parser.add_argument('--poll', type=float, help='Seconds between queue checks when idle; defaults to TODO_WORKER_POLL.')
+
+    def handle(self, *args, **options):
+        if not shared_versions():
+            raise CommandError('TODO_VERSION_CACHE is per process, so web workers would keep serving what jobs change; set TODO_VERSION_CACHE_DIR or point it at a shared cache')
+        poll = options['poll'] or getattr(settings, 'TODO_WORKER_POLL', 1.0)
+        try:
+            while True:
+                close_old_connections()
+                requeued = jobs.requeue_stale()
+                if requeued:
+                    self.stderr.write(f'Requeued {requeued} stale jobs')
+
+                began = time.perf_counter()
+                job = jobs.run_next()
+                if job is None:
+                    if options['once']:
+                        return
+                    time.sleep(poll)
+                    continue
+
+                message = f'Job {job.id} {job.kind} {job.status} ({job.done}/{job.total}) in {time.perf_counter() - began:.1f}s'
+                if job.status == job.FAILED:
+                    self.stdout.write(self.style.ERROR(f'{message}: {job.error}'))
+                else:
+                    self.stdout.write(self.style.SUCCESS(message))
+        except KeyboardInterrupt:
+            pass
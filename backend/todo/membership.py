@@ -0,0 +1,170 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .models import TodoItem, TodoGroup
+from . import grouptree, stats
+
+
+# Group membership. A todo's group is TodoItem.group and nothing else;
+# group.todos reads it back. A group's children are TodoGroup.parent, with
+# the childs M2M as a mirror for listing them, so both are only written
+# here. Saves compare what is stored with what was sent and write the
+# difference: one UPDATE for the todos that moved, one insert and one
+# delete of child rows, and a path rewrite per child that actually
+# changed parent. Callers notify the owner. Functions that touch other
+# groups take a touched set to collect their ids in instead, for a caller
+# making several changes to touch them all with one UPDATE.
+
+Childs = TodoGroup.childs.through
+
+
+def ids_of(items):
+    return [getattr(item, 'id', item) for item in items]
+
+def groups_of(items):
+    # Groups for a mix of ids and instances. Instances are used as given,
+    # so the caller's copy sees the new parent and path.
+    given = {item.id: item for item in items if isinstance(item, TodoGroup)}
+    fetched = TodoGroup.objects.filter(id__in=[id for id in ids_of(items) if id not in given])
+    return list(given.values()) + list(fetched)
+
+def touch(group_ids, touched=None):
+    group_ids = {id for id in group_ids if id is not None}
+    if touched is not None:
+        touched |= group_ids
+    elif group_ids:
+        TodoGroup.objects.filter(id__in=group_ids).update(updated_at=timezone.now())
+
+def changes(group, todos, childs):
+    # ((added, removed) todos, (added, removed) childs) that saving group
+    # with todos and childs would write.
+    return todo_changes(group, todos), child_changes(group, childs)
+
+
+# Todos
+
+def todo_changes(group, todos):
+    # (added, removed) todo ids for a group that should hold todos.
+    wanted = set(ids_of(todos))
+    current = set(TodoItem.objects.filter(group_id=group.id).values_list('id', flat=True))
+    return sorted(wanted - current), sorted(current - wanted)
+
+def move_todos(ids, group, source=None, touched=None):
+    # Moves the todos to group, or out of any group for None, and returns
+    # how many moved. Only the group owner's todos can join it; with a
+    # source, only todos currently in source leave it.
+    group_id = group.id if group is not None else None
+    if not ids:
+        return 0
+    with transaction.atomic():
+        todos = TodoItem.objects.select_for_update().filter(id__in=ids).exclude(group_id=group_id)
+        if group is not None:
+            todos = todos.filter(user_id=group.user_id)
+        if source is not None:
+            todos = todos.filter(group_id=source.id)
+        rows = list(todos.values_list('id', 'user_id', 'group_id', 'checked'))
+        if not rows:
+            return 0
+
+        stats.todos_moved([row[1:] for row in rows], group_id)
+        TodoItem.objects.filter(id__in=[row[0] for row in rows]).update(group_id=group_id, updated_at=timezone.now())
+        # Both ends list different todos now.
+        touch({row[2] for row in rows} | {group_id}, touched)
+    return len(rows)
+
+
+# Children
+
+def child_changes(group, childs):
+    wanted = set(ids_of(childs))
+    current = set(Childs.objects.filter(from_todogroup_id=group.id).values_list('to_todogroup_id', flat=True))
+    return sorted(wanted - current), sorted(current - wanted)
+
+def can_adopt(group, child):
+    return child.id != group.id and child.user_id == group.user_id and not grouptree.contains(child, group)
+
+def add_childs(group, childs, touched=None):
+    # Makes the groups children of group, leaving out the group itself, its
+    # ancestors and other users' groups, and returns the ids taken in.
+    if not childs:
+        return []
+    with transaction.atomic():
+        children = [child for child in groups_of(childs) if can_adopt(group, child)]
+        if not children:
+            return []
+        adopted = [child.id for child in children]
+        # A group has one parent, so it leaves the one it had.
+        Childs.objects.filter(to_todogroup_id__in=adopted).delete()
+        Childs.objects.bulk_create([Childs(from_todogroup_id=group.id, to_todogroup_id=id) for id in adopted])
+        moved = [child for child in children if child.parent_id != group.id]
+        touch({child.parent_id for child in moved}, touched)
+        for child in moved:
+            grouptree.set_parent(child, group)
+    return adopted
+
+def remove_childs(group, childs):
+    if not childs:
+        return
+    with transaction.atomic():
+        Childs.objects.filter(from_todogroup_id=group.id, to_todogroup_id__in=ids_of(childs)).delete()
+        for child in groups_of(childs):
+            if child.parent_id == group.id:
+                grouptree.set_parent(child, None)
+
+
+# Consistency
+
+def expected_paths(groups):
+    # {id: path} from the parent links alone, as grouptree.path_for would
+    # build them top down. A parent cycle is cut where it closes.
+    parents = {group.id: group.parent_id for group in groups}
+    paths = {}
+    for id in parents:
+        chain = []
+        while id is not None and id not in paths and id not in chain:
+            chain.append(id)
+            id = parents.get(id)
+        path = paths.get(id, '/')
+        for id in reversed(chain):
+            path = paths[id] = path + f'{id}/'
+    return paths
+
+def check(user):
+    # Returns {problem: [ids]} for whatever of user's membership disagrees
+    # with itself:
+    #   foreign_todos   todos filed in another user's group
+    #   foreign_childs  groups under another user's group
+    #   missing_childs  groups whose parent does not list them
+    #   stray_childs    child rows (parent id, child id) without the parent link
+    #   paths           groups whose path does not follow their parents
+    groups = list(TodoGroup.objects.filter(user=user).only('id', 'parent_id', 'path', 'user_id'))
+    links = {(group.parent_id, group.id) for group in groups if group.parent_id is not None}
+    rows = set(Childs.objects.filter(to_todogroup__user=user).values_list('from_todogroup_id', 'to_todogroup_id'))
+    paths = expected_paths(groups)
+    return {
+        'foreign_todos': list(TodoItem.objects.filter(user=user).exclude(group=None).exclude(group__user=user).values_list('id', flat=True)),
+        'foreign_childs': list(TodoGroup.objects.filter(user=user).exclude(parent=None).exclude(parent__user=user).values_list('id', flat=True)),
+        'missing_childs': sorted(child for _, child in links - rows),
+        'stray_childs': sorted(rows - links),
+        'paths': sorted(group.id for group in groups if group.path != paths[group.id]),
+    }
+
+def repair(user, problems):
+    # Fixes what check() found, trusting TodoItem.group and TodoGroup.parent
+    # over the child rows and paths derived from them.
+    with transaction.atomic():
+        move_todos(problems['foreign_todos'], None)
+        for child in TodoGroup.objects.filter(id__in=problems['foreign_childs']):
+            grouptree.set_parent(child, None)
+        for parent, child in problems['stray_childs']:
+            Childs.objects.filter(from_todogroup_id=parent, to_todogroup_id=child).delete()
+        Childs.objects.filter(to_todogroup_id__in=problems['foreign_childs']).delete()
+        missing = TodoGroup.objects.filter(id__in=problems['missing_childs']).exclude(parent=None)
+        Childs.objects.bulk_create([Childs(from_todogroup_id=group.parent_id, to_todogroup_id=group.id) for group in missing], ignore_conflicts=True)
+
+        groups = list(TodoGroup.objects.filter(user=user).only('id', 'parent_id', 'path'))
+        paths = expected_paths(groups)
+        stale = [group for group in groups if group.path != paths[group.id]]
+        for group in stale:
+            group.path = paths[group.id]
+        TodoGroup.objects.bulk_update(stale, ['path'])
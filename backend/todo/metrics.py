@@ -0,0 +1,224 @@
+import contextvars
+import hmac
+import itertools
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+
+
+logger = logging.getLogger('todo.metrics')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# The sample of the request being handled. Contextvars follow the request
+# into sync_to_async threads, so queries run there are counted too.
+current = contextvars.ContextVar('todo_request_metrics', default=None)
+
+
+class Sample:
+    __slots__ = ('route', 'method', 'status', 'duration', 'queries', 'sql_time', 'serializer_time', 'size')
+
+    def __init__(self, method):
+        self.route = None
+        self.method = method
+        self.status = None
+        self.duration = 0.0
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.size = None
+
+
+class RingBuffer:
+    # Fixed-size buffer of the latest samples. next() on an itertools.count
+    # is atomic under the GIL, so every writer claims its own slot without
+    # taking a lock; only readers, which are rare, serialise.
+    def __init__(self, size):
+        self.size = size
+        self.slots = [None] * size
+        self.sequence = itertools.count()
+
+    def append(self, sample):
+        n = next(self.sequence)
+        self.slots[n % self.size] = (n, sample)
+
+    def since(self, last):
+        # Samples numbered after last, oldest first, and how many of those
+        # were overwritten before anyone read them.
+        entries = sorted((slot for slot in self.slots if slot is not None and slot[0] > last), key=lambda slot: slot[0])
+        if not entries:
+            return [], last, 0
+        newest = entries[-1][0]
+        return [sample for _, sample in entries], newest, newest - last - len(entries)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Registry:
+    # Cumulative Prometheus series, folded in from the ring buffer on each
+    # scrape so that counters never go backwards however small the buffer.
+    def __init__(self, size):
+        self.buffer = RingBuffer(size)
+        self.lock = threading.Lock()
+        self.last = -1
+        self.dropped = 0
+        self.requests = {}
+        self.histograms = {}
+        self.totals = {}
+
+    def record(self, sample):
+        self.buffer.append(sample)
+
+    def histogram(self, name, labels, buckets):
+        key = (name, labels)
+        if key not in self.histograms:
+            self.histograms[key] = Histogram(buckets)
+        return self.histograms[key]
+
+    def collect(self):
+        samples, self.last, dropped = self.buffer.since(self.last)
+        self.dropped += dropped
+        for sample in samples:
+            labels = (('route', sample.route), ('method', sample.method))
+            status = labels + (('status', str(sample.status)),)
+            self.requests[status] = self.requests.get(status, 0) + 1
+            self.histogram('todo_request_duration_seconds', labels, DURATION_BUCKETS).observe(sample.duration)
+            self.histogram('todo_request_queries', labels, QUERY_BUCKETS).observe(sample.queries)
+            if sample.size is not None:
+                self.histogram('todo_response_size_bytes', labels, SIZE_BUCKETS).observe(sample.size)
+            for name, value in (('todo_request_sql_seconds_total', sample.sql_time), ('todo_request_serializer_seconds_total', sample.serializer_time)):
+                self.totals[(name, labels)] = self.totals.get((name, labels), 0) + value
+
+    def export(self):
+        with self.lock:
+            self.collect()
+            lines = ['# TYPE todo_requests_total counter']
+            lines += [f'todo_requests_total{format_labels(labels)} {value}' for labels, value in sorted(self.requests.items())]
+            for name in ('todo_request_duration_seconds', 'todo_request_queries', 'todo_response_size_bytes'):
+                lines.append(f'# TYPE {name} histogram')
+                for (metric, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if metric != name:
+                        continue
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f'{name}_bucket{format_labels(labels + (("le", str(bound)),))} {count}')
+                    lines.append(f'{name}_bucket{format_labels(labels + (("le", "+Inf"),))} {histogram.count}')
+                    lines.append(f'{name}_sum{format_labels(labels)} {histogram.sum}')
+                    lines.append(f'{name}_count{format_labels(labels)} {histogram.count}')
+            for name in ('todo_request_sql_seconds_total', 'todo_request_serializer_seconds_total'):
+                lines.append(f'# TYPE {name} counter')
+                lines += [f'{name}{format_labels(labels)} {value}' for (metric, labels), value in sorted(self.totals.items()) if metric == name]
+            lines += ['# TYPE todo_metrics_dropped_samples_total counter', f'todo_metrics_dropped_samples_total {self.dropped}']
+            return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(labels):
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels) + '}'
+
+
+registry = Registry(getattr(settings, 'TODO_METRICS_BUFFER_SIZE', 10000))
+
+
+def record_query(execute, sql, params, many, context):
+    # Installed on every connection by todo/signals.py.
+    sample = current.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    began = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        sample.queries += 1
+        sample.sql_time += time.perf_counter() - began
+
+def add_serializer_time(seconds):
+    sample = current.get()
+    if sample is not None:
+        sample.serializer_time += seconds
+
+
+class MetricsMiddleware:
+    # Times every request and records its route, status, SQL queries,
+    # serializer time and response size. Requests issuing more than
+    # TODO_METRICS_MAX_QUERIES queries are logged with their route, which
+    # is how an N+1 in a list view shows up.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        sample = Sample(request.method)
+        token = current.set(sample)
+        began = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        self.finish(request, response, sample, time.perf_counter() - began)
+        return response
+
+    async def __acall__(self, request):
+        sample = Sample(request.method)
+        token = current.set(sample)
+        began = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        self.finish(request, response, sample, time.perf_counter() - began)
+        return response
+
+    def finish(self, request, response, sample, duration):
+        match = request.resolver_match
+        sample.route = '/' + match.route if match is not None else 'unmatched'
+        sample.status = response.status_code
+        sample.duration = duration
+        if not response.streaming:
+            sample.size = len(response.content)
+        registry.record(sample)
+
+        limit = getattr(settings, 'TODO_METRICS_MAX_QUERIES', None)
+        if limit is not None and sample.queries > limit:
+            logger.warning('%s %s issued %d queries (limit %d) in %.1fms', sample.method, sample.route, sample.queries, limit, duration * 1000)
+
+
+def scrape_allowed(request):
+    # Staff sessions, or scrapers sending TODO_METRICS_TOKEN as a bearer
+    # token. Without a configured token only staff get through.
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_active and user.is_staff:
+        return True
+    token = getattr(settings, 'TODO_METRICS_TOKEN', None)
+    return bool(token) and hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode())
+
+def metrics_view(request):
+    if not scrape_allowed(request):
+        return HttpResponse('Authentication required\n', status=401, content_type='text/plain', headers={'WWW-Authenticate': 'Bearer'})
+    return HttpResponse(registry.export(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,71 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import middleware as auth
+from django.contrib.messages import middleware as messages
+from django.contrib.sessions import middleware as sessions
+from django.middleware import clickjacking, common, csrf, security
+
+
+# Django's MiddlewareMixin runs every process_request and process_response
+# under ASGI in a hop to the request's sync thread, fourteen hops a request
+# for the stack in settings.MIDDLEWARE. Most of those hooks only read
+# headers and set attributes, so these subclasses run them on the event
+# loop and hop only when a hook may reach the database: to load or save a
+# session the request used, to store its messages, or for CSRF tokens kept
+# in the session. Under WSGI they are the stock classes.
+
+class InlineMixin:
+    def blocks(self, request):
+        return False
+
+    async def __acall__(self, request):
+        response = None
+        if hasattr(self, 'process_request'):
+            if self.blocks(request):
+                response = await sync_to_async(self.process_request, thread_sensitive=True)(request)
+            else:
+                response = self.process_request(request)
+        response = response or await self.get_response(request)
+        if hasattr(self, 'process_response'):
+            if self.blocks(request):
+                response = await sync_to_async(self.process_response, thread_sensitive=True)(request, response)
+            else:
+                response = self.process_response(request, response)
+        return response
+
+
+class SecurityMiddleware(InlineMixin, security.SecurityMiddleware):
+    pass
+
+
+class SessionMiddleware(InlineMixin, sessions.SessionMiddleware):
+    # process_request only builds the lazy store; process_response saves
+    # it if the request read or wrote it.
+    def blocks(self, request):
+        session = getattr(request, 'session', None)
+        return session is not None and (session.accessed or settings.SESSION_SAVE_EVERY_REQUEST)
+
+
+class CommonMiddleware(InlineMixin, common.CommonMiddleware):
+    pass
+
+
+class CsrfViewMiddleware(InlineMixin, csrf.CsrfViewMiddleware):
+    def blocks(self, request):
+        return settings.CSRF_USE_SESSIONS
+
+
+class AuthenticationMiddleware(InlineMixin, auth.AuthenticationMiddleware):
+    pass
+
+
+class MessageMiddleware(InlineMixin, messages.MessageMiddleware):
+    # The storage reads and writes its backends only once messages were
+    # listed or added.
+    def blocks(self, request):
+        storage = getattr(request, '_messages', None)
+        return storage is not None and (storage.used or storage.added_new)
+
+
+class XFrameOptionsMiddleware(InlineMixin, clickjacking.XFrameOptionsMiddleware):
+    pass
@@ -0,0 +1,61 @@
+# Generated by Django 5.0.4 on 2026-10-18 17:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Subtask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.IntegerField()),
+                ('content', models.CharField(max_length=256)),
+                ('checked', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TodoGroup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=256)),
+                ('childs', models.ManyToManyField(blank=True, default=None, related_name='group_childs', to='todo.todogroup')),
+                ('parent', models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='group_parent', to='todo.todogroup')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TodoItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=256)),
+                ('content', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('date', models.DateField()),
+                ('checked', models.BooleanField(default=False)),
+                ('repeat', models.CharField(blank=True, default='', max_length=256)),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='todo.todogroup')),
+                ('subtasks', models.ManyToManyField(blank=True, to='todo.subtask')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='todogroup',
+            name='todos',
+            field=models.ManyToManyField(blank=True, to='todo.todoitem'),
+        ),
+        migrations.AddField(
+            model_name='subtask',
+            name='todo',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='todo.todoitem'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.4 on 2026-10-18 17:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='todoitem',
+            index=models.Index(fields=['user', 'date', 'checked'], name='todo_user_date_checked_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='todoitem',
+            index=models.Index(fields=['user', 'group', 'date'], name='todo_user_group_date_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.4 on 2026-10-18 17:24
+
+from django.db import migrations, models
+
+
+def backfill_paths(apps, schema_editor):
+    TodoGroup = apps.get_model('todo', 'TodoGroup')
+    parents = dict(TodoGroup.objects.values_list('id', 'parent_id'))
+    paths = {}
+
+    def path_of(id):
+        # Walk up iteratively until a known path or a root, then fill in
+        # the chain on the way back down.
+        chain = []
+        while id is not None and id not in paths and id not in chain:
+            chain.append(id)
+            id = parents[id]
+        path = paths.get(id, '/')
+        for id in reversed(chain):
+            path = paths[id] = path + f'{id}/'
+        return path
+
+    groups = list(TodoGroup.objects.only('id'))
+    for group in groups:
+        group.path = path_of(group.id)
+    TodoGroup.objects.bulk_update(groups, ['path'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0002_todoitem_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='todogroup',
+            name='path',
+            field=models.TextField(blank=True, db_index=True, default=''),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations, models
+from django.db.models import F
+
+
+def spread_positions(apps, schema_editor):
+    Subtask = apps.get_model('todo', 'Subtask')
+    Subtask.objects.update(position=(F('position') + 1) * (1 << 16))
+
+
+def compact_positions(apps, schema_editor):
+    Subtask = apps.get_model('todo', 'Subtask')
+    subtasks = list(Subtask.objects.order_by('todo_id', 'position'))
+    index, todo_id = 0, None
+    for subtask in subtasks:
+        index = index + 1 if subtask.todo_id == todo_id else 0
+        todo_id = subtask.todo_id
+        subtask.position = index
+    Subtask.objects.bulk_update(subtasks, ['position'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0003_todogroup_path'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='subtask',
+            old_name='index',
+            new_name='position',
+        ),
+        migrations.AlterField(
+            model_name='subtask',
+            name='position',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(spread_positions, compact_positions),
+        migrations.AddIndex(
+            model_name='subtask',
+            index=models.Index(fields=['todo', 'position'], name='subtask_todo_position_idx'),
+        ),
+    ]
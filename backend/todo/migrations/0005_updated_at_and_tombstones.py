@@ -0,0 +1,61 @@
+# Generated by Django 5.0.4 on 2026-10-18 17:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0004_subtask_position'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('todo', 'Todo'), ('group', 'Group'), ('subtask', 'Subtask')], max_length=16)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='subtask',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='todogroup',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='todoitem',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='subtask',
+            index=models.Index(fields=['updated_at'], name='subtask_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='todogroup',
+            index=models.Index(fields=['user', 'updated_at'], name='group_user_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='todoitem',
+            index=models.Index(fields=['user', 'updated_at'], name='todo_user_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='tombstone',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['user', 'deleted_at'], name='tombstone_user_deleted_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+from django.db import migrations
+
+
+# The DDL and the backfill are written out here rather than taken from
+# todo/search.py, so later changes to that module leave this migration alone.
+
+SQLITE = [
+    "CREATE VIRTUAL TABLE todo_search USING fts5("
+    "owner, title, content, subtasks, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    """
+    INSERT INTO todo_search (rowid, owner, title, content, subtasks)
+    SELECT t.id, 'u' || t.user_id, t.title, t.content,
+           COALESCE((SELECT group_concat(s.content, ' ') FROM todo_subtask s WHERE s.todo_id = t.id), '')
+    FROM todo_todoitem t
+    """,
+]
+
+POSTGRESQL = [
+    'CREATE TABLE todo_search (todo_id bigint PRIMARY KEY, user_id integer NOT NULL, document tsvector NOT NULL)',
+    'CREATE INDEX todo_search_document_idx ON todo_search USING gin (document)',
+    'CREATE INDEX todo_search_user_idx ON todo_search (user_id)',
+    """
+    INSERT INTO todo_search (todo_id, user_id, document)
+    SELECT t.id, t.user_id,
+           setweight(to_tsvector('simple', t.title), 'A')
+           || setweight(to_tsvector('simple', t.content), 'B')
+           || setweight(to_tsvector('simple', COALESCE((SELECT string_agg(s.content, ' ') FROM todo_subtask s WHERE s.todo_id = t.id), '')), 'C')
+    FROM todo_todoitem t
+    """,
+]
+
+
+def create_index(apps, schema_editor):
+    # The index is a raw table (an FTS5 virtual table on SQLite) that the
+    # ORM does not manage; todo/search.py reads and writes it.
+    for statement in POSTGRESQL if schema_editor.connection.vendor == 'postgresql' else SQLITE:
+        schema_editor.execute(statement)
+
+def drop_index(apps, schema_editor):
+    schema_editor.execute('DROP TABLE todo_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0006_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
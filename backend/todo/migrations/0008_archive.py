@@ -0,0 +1,51 @@
+# Generated by Django 5.0.4 on 2026-10-18 19:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0007_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTodo',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=256)),
+                ('content', models.TextField()),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('date', models.DateField()),
+                ('checked', models.BooleanField(default=True)),
+                ('repeat', models.CharField(blank=True, default='', max_length=256)),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='todo.todogroup')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedSubtask',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('position', models.BigIntegerField(default=0)),
+                ('content', models.CharField(max_length=256)),
+                ('checked', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField()),
+                ('todo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subtasks', to='todo.archivedtodo')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedtodo',
+            index=models.Index(fields=['user', 'date'], name='archived_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedsubtask',
+            index=models.Index(fields=['todo', 'position'], name='archived_subtask_position_idx'),
+        ),
+    ]
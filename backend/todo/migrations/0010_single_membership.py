@@ -0,0 +1,53 @@
+# Generated by Django 5.0.4 on 2026-10-18 19:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F
+
+
+def adopt_memberships(apps, schema_editor):
+    # TodoItem.group becomes the only record of membership. Todos that were
+    # only listed through TodoGroup.todos join that group (the lowest id if
+    # several, and only one of their owner's), and its counters follow;
+    # memberships contradicting TodoItem.group are dropped with the table.
+    TodoItem = apps.get_model('todo', 'TodoItem')
+    TodoGroup = apps.get_model('todo', 'TodoGroup')
+    GroupCounter = apps.get_model('todo', 'GroupCounter')
+    Members = TodoGroup.todos.through
+
+    adopted = {}
+    rows = Members.objects.filter(todoitem__group=None, todogroup__user=F('todoitem__user')).order_by('todogroup_id')
+    for todo_id, group_id in rows.values_list('todoitem_id', 'todogroup_id').iterator():
+        adopted.setdefault(todo_id, group_id)
+
+    by_group = {}
+    for todo_id, group_id in adopted.items():
+        by_group.setdefault(group_id, []).append(todo_id)
+    for group_id, ids in by_group.items():
+        TodoItem.objects.filter(id__in=ids).update(group_id=group_id)
+        todos = TodoItem.objects.filter(id__in=ids)
+        completed = todos.filter(checked=True).count()
+        counter, _ = GroupCounter.objects.get_or_create(user_id=todos[0].user_id, group_id=group_id)
+        GroupCounter.objects.filter(id=counter.id).update(
+            pending=F('pending') + len(ids) - completed, completed=F('completed') + completed,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0009_jobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(adopt_memberships, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='todogroup',
+            name='todos',
+        ),
+        migrations.AlterField(
+            model_name='todoitem',
+            name='group',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='todos', to='todo.todogroup'),
+        ),
+    ]
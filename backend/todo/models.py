@@ -3,10 +3,19 @@ from django.contrib.auth.models import User
 
 class TodoGroup(models.Model):
     name = models.CharField(max_length=256)
-    todos = models.ManyToManyField('TodoItem', blank=True)
+    # Mirrors parent, so a group lists its children in one read; kept in
+    # step by todo/membership.py. A group's todos are TodoItem.group.
     childs = models.ManyToManyField('self', blank=True, default=None, symmetrical=False, related_name='group_childs')
     parent = models.ForeignKey('self', on_delete=models.CASCADE, blank=True, null=True, default=None, related_name='group_parent')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    path = models.TextField(default='', blank=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'updated_at'], name='group_user_updated_idx'),
+        ]
+
     def __str__(self):
         return self.name
     
@@ -15,18 +24,150 @@ class TodoItem(models.Model):
     title = models.CharField(max_length=256)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     date = models.DateField()
     checked = models.BooleanField(default=False)
-    group = models.ForeignKey('TodoGroup', on_delete=models.CASCADE, blank=True, null=True)
+    group = models.ForeignKey('TodoGroup', on_delete=models.CASCADE, blank=True, null=True, related_name='todos')
     subtasks = models.ManyToManyField('Subtask', blank=True)
     repeat = models.CharField(max_length=256, default='', blank=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'date', 'checked'], name='todo_user_date_checked_idx'),
+            models.Index(fields=['user', 'group', 'date'], name='todo_user_group_date_idx'),
+            models.Index(fields=['user', 'updated_at'], name='todo_user_updated_idx'),
+        ]
     
 
 class Subtask(models.Model):
     todo = models.ForeignKey('TodoItem', on_delete=models.CASCADE)
-    index = models.IntegerField()
+    # Sparse ordering key; the contiguous index exposed by the API is the
+    # rank of position within the todo (see selectors.subtask_queryset).
+    position = models.BigIntegerField(default=0)
     content = models.CharField(max_length=256)
     checked = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    GAP = 1 << 16
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['todo', 'position'], name='subtask_todo_position_idx'),
+            models.Index(fields=['updated_at'], name='subtask_updated_idx'),
+        ]
+
     def __str__(self):
-        return self.content
\ No newline at end of file
+        return self.content
+
+
+class Tombstone(models.Model):
+    # Records deletions so /sync/ can report them to clients that last
+    # synced before the row disappeared.
+    TODO = 'todo'
+    GROUP = 'group'
+    SUBTASK = 'subtask'
+    KINDS = [(TODO, 'Todo'), (GROUP, 'Group'), (SUBTASK, 'Subtask')]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=16, choices=KINDS)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'deleted_at'], name='tombstone_user_deleted_idx'),
+        ]
+
+class GroupCounter(models.Model):
+    # Pending and completed todos filed directly under a group, kept in
+    # step by the services (see todo/stats.py). Subgroups roll up at read
+    # time; todos without a group are the day totals minus these.
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    group = models.ForeignKey('TodoGroup', on_delete=models.CASCADE)
+    pending = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'group'], name='group_counter_unique'),
+        ]
+
+
+class DayCounter(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    date = models.DateField()
+    pending = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='day_counter_unique'),
+        ]
+
+
+class ArchivedTodo(models.Model):
+    # Cold tier for checked todos moved out of TodoItem by todo/archive.py.
+    # Rows keep the id they had as todos, so clients see the same ids
+    # whichever tier a todo is read from.
+    id = models.BigIntegerField(primary_key=True)
+    title = models.CharField(max_length=256)
+    content = models.TextField()
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    date = models.DateField()
+    checked = models.BooleanField(default=True)
+    group = models.ForeignKey('TodoGroup', on_delete=models.CASCADE, blank=True, null=True)
+    repeat = models.CharField(max_length=256, default='', blank=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'date'], name='archived_user_date_idx'),
+        ]
+
+
+class ArchivedSubtask(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    todo = models.ForeignKey('ArchivedTodo', on_delete=models.CASCADE, related_name='subtasks')
+    position = models.BigIntegerField(default=0)
+    content = models.CharField(max_length=256)
+    checked = models.BooleanField(default=False)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['todo', 'position'], name='archived_subtask_position_idx'),
+        ]
+
+
+class Job(models.Model):
+    # Work queued for `manage.py runworker` (see todo/jobs.py). done/total
+    # count the rows handled so far, for clients polling /jobs/<id>/.
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=32)
+    params = models.JSONField(default=dict)
+    status = models.CharField(max_length=16, choices=STATUSES, default=QUEUED)
+    done = models.IntegerField(default=0)
+    total = models.IntegerField(null=True)
+    error = models.TextField(default='', blank=True)
+    attempts = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped with every progress report; a running job that stops bumping
+    # it belongs to a worker that died.
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='job_status_idx'),
+            models.Index(fields=['user', 'id'], name='job_user_idx'),
+        ]
@@ -0,0 +1,201 @@
+import base64
+import heapq
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from rest_framework.response import Response
+
+from .compact import CompactSerializer, aiterate, dumps
+
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+STREAM_CHUNK_SIZE = 500
+
+TODO_ORDERING = ('date', 'id')
+GROUP_ORDERING = ('id',)
+
+
+def encode_cursor(values):
+    raw = json.dumps([str(value) for value in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(cursor, ordering):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise ValueError('Invalid cursor')
+    return values
+
+def after_cursor(values, ordering):
+    # Lexicographic "greater than" over the ordering columns, e.g. for
+    # (date, id): date > d OR (date = d AND id > i).
+    condition = Q()
+    for i in reversed(range(len(ordering))):
+        step = Q(**{ordering[i] + '__gt': values[i]})
+        if i < len(ordering) - 1:
+            step |= Q(**{ordering[i]: values[i]}) & condition
+        condition = step
+    return condition
+
+def parse_limit(value):
+    if value is None:
+        return DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError('Invalid limit')
+    if limit < 1:
+        raise ValueError('Invalid limit')
+    return min(limit, MAX_LIMIT)
+
+
+def page_queryset(queryset, ordering, cursor=None):
+    queryset = queryset.order_by(*ordering)
+    if cursor is not None:
+        queryset = queryset.filter(after_cursor(decode_cursor(cursor, ordering), ordering))
+    return queryset
+
+def row_value(row, field):
+    # Compact serializers page over dicts, the others over model instances.
+    # A date comes back as its ISO string either way once in the cursor.
+    return row[field] if isinstance(row, dict) else getattr(row, field)
+
+def page_rows(rows, ordering, limit):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([row_value(rows[-1], field) for field in ordering])
+    return rows, next_cursor
+
+def keyset_page(queryset, ordering, cursor=None, limit=DEFAULT_LIMIT, fetch=list):
+    queryset = page_queryset(queryset, ordering, cursor)
+    return page_rows(fetch(queryset[:limit + 1]), ordering, limit)
+
+async def akeyset_page(queryset, ordering, cursor=None, limit=DEFAULT_LIMIT, afetch=None):
+    queryset = page_queryset(queryset, ordering, cursor)[:limit + 1]
+    rows = await afetch(queryset) if afetch is not None else [row async for row in queryset]
+    return page_rows(rows, ordering, limit)
+
+def is_compact(serializer_class):
+    return issubclass(serializer_class, CompactSerializer)
+
+def json_array(rows):
+    yield b'['
+    first = True
+    for data in rows:
+        if not first:
+            yield b','
+        first = False
+        yield dumps(data)
+    yield b']'
+
+async def ajson_array(rows):
+    yield b'['
+    first = True
+    async for data in rows:
+        if not first:
+            yield b','
+        first = False
+        yield dumps(data)
+    yield b']'
+
+def stream_json(queryset, serializer_class, ordering):
+    queryset = queryset.order_by(*ordering)
+    if is_compact(serializer_class):
+        return json_array(serializer_class.stream(queryset, STREAM_CHUNK_SIZE))
+    return json_array(serializer_class(row).data for row in queryset.iterator(chunk_size=STREAM_CHUNK_SIZE))
+
+def astream_json(queryset, serializer_class, ordering):
+    queryset = queryset.order_by(*ordering)
+    if is_compact(serializer_class):
+        return ajson_array(serializer_class.astream(queryset, STREAM_CHUNK_SIZE))
+    return ajson_array(serializer_class(row).data async for row in queryset.aiterator(chunk_size=STREAM_CHUNK_SIZE))
+
+
+def paginated_response(request, queryset, serializer_class, ordering):
+    params = request.query_params
+
+    if params.get('stream') == '1':
+        return StreamingHttpResponse(stream_json(queryset, serializer_class, ordering), content_type='application/json')
+
+    compact = is_compact(serializer_class)
+    if 'cursor' not in params and 'limit' not in params:
+        return Response(serializer_class.rows(queryset) if compact else serializer_class(queryset, many=True).data)
+
+    try:
+        limit = parse_limit(params.get('limit'))
+        rows, next_cursor = keyset_page(queryset, ordering, params.get('cursor'), limit, serializer_class.rows if compact else list)
+    except ValueError as error:
+        return Response({'error': str(error)}, status=400)
+    except ValidationError:
+        return Response({'error': 'Invalid cursor'}, status=400)
+
+    return Response({'results': rows if compact else serializer_class(rows, many=True).data, 'next': next_cursor})
+
+async def apaginated_response(request, queryset, serializer_class, ordering):
+    params = request.query_params
+
+    if params.get('stream') == '1':
+        return StreamingHttpResponse(astream_json(queryset, serializer_class, ordering), content_type='application/json')
+
+    compact = is_compact(serializer_class)
+    if 'cursor' not in params and 'limit' not in params:
+        if compact:
+            return Response(await serializer_class.arows(queryset))
+        return Response(serializer_class([row async for row in queryset], many=True).data)
+
+    try:
+        limit = parse_limit(params.get('limit'))
+        rows, next_cursor = await akeyset_page(queryset, ordering, params.get('cursor'), limit, serializer_class.arows if compact else None)
+    except ValueError as error:
+        return Response({'error': str(error)}, status=400)
+    except ValidationError:
+        return Response({'error': 'Invalid cursor'}, status=400)
+
+    return Response({'results': rows if compact else serializer_class(rows, many=True).data, 'next': next_cursor})
+
+
+# Several tiers of the same rows, as (queryset, compact serializer) pairs
+# with ids unique across them, read as one list: each tier is ordered,
+# paged or streamed on its own and the rows merged by ordering. A page
+# fetches limit + 1 rows per tier with the same cursor, which is enough
+# for the merged page to be exact.
+
+def sort_key(ordering):
+    return lambda row: tuple(row_value(row, field) for field in ordering)
+
+def merge_rows(tiers, ordering):
+    return sorted((row for rows in tiers for row in rows), key=sort_key(ordering))
+
+def stream_tiers(tiers, ordering):
+    streams = [serializer_class.stream(queryset.order_by(*ordering), STREAM_CHUNK_SIZE) for queryset, serializer_class in tiers]
+    return heapq.merge(*streams, key=sort_key(ordering))
+
+async def apaginated_tiers(request, tiers, ordering):
+    params = request.query_params
+
+    if params.get('stream') == '1':
+        rows = aiterate(stream_tiers(tiers, ordering), STREAM_CHUNK_SIZE)
+        return StreamingHttpResponse(ajson_array(rows), content_type='application/json')
+
+    if 'cursor' not in params and 'limit' not in params:
+        return Response(merge_rows([await serializer_class.arows(queryset) for queryset, serializer_class in tiers], ordering))
+
+    try:
+        limit = parse_limit(params.get('limit'))
+        pages = [
+            await serializer_class.arows(page_queryset(queryset, ordering, params.get('cursor'))[:limit + 1])
+            for queryset, serializer_class in tiers
+        ]
+        rows, next_cursor = page_rows(merge_rows(pages, ordering), ordering, limit)
+    except ValueError as error:
+        return Response({'error': str(error)}, status=400)
+    except ValidationError:
+        return Response({'error': 'Invalid cursor'}, status=400)
+
+    return Response({'results': rows, 'next': next_cursor})
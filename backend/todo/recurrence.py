@@ -0,0 +1,143 @@
+import calendar
+import datetime
+import functools
+
+
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY')
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+SHORTHANDS = {
+    'daily': 'FREQ=DAILY',
+    'weekly': 'FREQ=WEEKLY',
+    'monthly': 'FREQ=MONTHLY',
+    'yearly': 'FREQ=YEARLY',
+}
+
+# Bounds the occurrence cache; each entry holds one rule's dates inside
+# one window.
+CACHE_SIZE = 4096
+
+
+class Rule:
+    def __init__(self, freq, interval=1, count=None, until=None, byday=None):
+        self.freq = freq
+        self.interval = interval
+        self.count = count
+        self.until = until
+        self.byday = byday
+
+    def __repr__(self):
+        return f'Rule(freq={self.freq!r}, interval={self.interval}, count={self.count}, until={self.until}, byday={self.byday})'
+
+
+def parse_until(value):
+    value = value.rstrip('Z').split('T')[0].replace('-', '')
+    return datetime.datetime.strptime(value, '%Y%m%d').date()
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def parse(text):
+    # Accepts a subset of RFC 5545 RRULE (FREQ, INTERVAL, COUNT, UNTIL and
+    # BYDAY for weekly rules) plus the shorthands in SHORTHANDS. An empty
+    # string means the todo does not repeat.
+    text = text.strip()
+    if not text:
+        return None
+    text = SHORTHANDS.get(text.lower(), text)
+    if text.upper().startswith('RRULE:'):
+        text = text[len('RRULE:'):]
+
+    parts = {}
+    for part in text.split(';'):
+        key, separator, value = part.partition('=')
+        if not separator or not value:
+            raise ValueError(f'Invalid rule part: {part}')
+        parts[key.strip().upper()] = value.strip().upper()
+
+    freq = parts.pop('FREQ', None)
+    if freq not in FREQUENCIES:
+        raise ValueError('FREQ must be one of ' + ', '.join(FREQUENCIES))
+    try:
+        interval = int(parts.pop('INTERVAL', 1))
+        count = int(parts.pop('COUNT')) if 'COUNT' in parts else None
+        until = parse_until(parts.pop('UNTIL')) if 'UNTIL' in parts else None
+    except ValueError:
+        raise ValueError('Invalid INTERVAL, COUNT or UNTIL')
+    if interval < 1 or (count is not None and count < 1):
+        raise ValueError('INTERVAL and COUNT must be positive')
+
+    byday = None
+    if 'BYDAY' in parts:
+        if freq != 'WEEKLY':
+            raise ValueError('BYDAY is only supported with FREQ=WEEKLY')
+        days = parts.pop('BYDAY').split(',')
+        if not days or any(day not in WEEKDAYS for day in days):
+            raise ValueError('Invalid BYDAY')
+        byday = tuple(sorted({WEEKDAYS.index(day) for day in days}))
+
+    if parts:
+        raise ValueError('Unsupported rule parts: ' + ', '.join(sorted(parts)))
+    return Rule(freq, interval, count, until, byday)
+
+
+def _fixed_step(rule, start, window_start):
+    # DAILY and plain WEEKLY rules: the n-th occurrence is start + n * step,
+    # so the first one inside the window is found arithmetically.
+    step = rule.interval * (7 if rule.freq == 'WEEKLY' else 1)
+    n = max(0, -(-(window_start - start).days // step))
+    while True:
+        yield n, start + datetime.timedelta(days=n * step)
+        n += 1
+
+def _by_weekday(rule, start, window_start):
+    # WEEKLY;BYDAY: every interval-th week counted from start's week, on the
+    # listed weekdays, never before start itself.
+    first_week = start - datetime.timedelta(days=start.weekday())
+    first_count = sum(1 for day in rule.byday if day >= start.weekday())
+    weeks = max(0, (window_start - first_week).days // (7 * rule.interval))
+    n = 0 if weeks == 0 else first_count + (weeks - 1) * len(rule.byday)
+    while True:
+        monday = first_week + datetime.timedelta(weeks=weeks * rule.interval)
+        for day in rule.byday:
+            date = monday + datetime.timedelta(days=day)
+            if date >= start:
+                yield n, date
+                n += 1
+        weeks += 1
+
+def _by_month(rule, start, window_start):
+    # MONTHLY and YEARLY rules keep start's day of month; months or years
+    # without that day are skipped and do not count, as in RFC 5545.
+    months = rule.interval * (12 if rule.freq == 'YEARLY' else 1)
+    n = 0
+    step = 0
+    while True:
+        total = start.month - 1 + step * months
+        year, month = start.year + total // 12, total % 12 + 1
+        if start.day <= calendar.monthrange(year, month)[1]:
+            yield n, datetime.date(year, month, start.day)
+            n += 1
+        step += 1
+
+def occurrences(rule, start, window_start, window_end):
+    # Lazily yields the rule's dates inside [window_start, window_end],
+    # start included when it falls in the window.
+    if rule.freq == 'WEEKLY' and rule.byday:
+        candidates = _by_weekday(rule, start, window_start)
+    elif rule.freq in ('DAILY', 'WEEKLY'):
+        candidates = _fixed_step(rule, start, window_start)
+    else:
+        candidates = _by_month(rule, start, window_start)
+
+    for n, date in candidates:
+        if rule.count is not None and n >= rule.count:
+            return
+        if date > window_end or (rule.until is not None and date > rule.until):
+            return
+        if date >= window_start:
+            yield date
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def expand(repeat, start, window_start, window_end):
+    rule = parse(repeat)
+    if rule is None:
+        return ()
+    return tuple(occurrences(rule, start, window_start, window_end))
@@ -0,0 +1,120 @@
+import re
+
+from django.db import connection
+
+from .models import TodoItem, Subtask
+
+
+# Full-text index over todo titles, contents and subtask contents, one
+# document per todo in todo_search (see migration 0007). SQLite keeps it in
+# an FTS5 table, PostgreSQL in a tsvector column with a GIN index. The
+# services reindex a todo whenever any of its text changes.
+#
+# On SQLite the owner is an indexed column holding a single u<id> token, so
+# the user filter is part of the MATCH: FTS5 intersects it with the terms
+# before ranking instead of ranking every user's matches and discarding
+# most of them.
+
+TODOS = TodoItem._meta.db_table
+SUBTASKS = Subtask._meta.db_table
+MAX_TERMS = 8
+
+TERM = re.compile(r'\w+')
+
+SQLITE = {
+    'insert': f'''
+        INSERT INTO todo_search (rowid, owner, title, content, subtasks)
+        SELECT t.id, 'u' || t.user_id, t.title, t.content,
+               COALESCE((SELECT group_concat(s.content, ' ') FROM {SUBTASKS} s WHERE s.todo_id = t.id), '')
+        FROM {TODOS} t WHERE {{where}}
+    ''',
+    'delete': 'DELETE FROM todo_search WHERE rowid IN ({ids})',
+    'delete_user': "DELETE FROM todo_search WHERE rowid IN (SELECT rowid FROM todo_search WHERE todo_search MATCH 'owner : u' || %s)",
+    # bm25 weights follow the column order: owner, title, content, subtasks.
+    'search': '''
+        SELECT rowid FROM todo_search
+        WHERE todo_search MATCH %s
+        ORDER BY bm25(todo_search, 0.0, 10.0, 4.0, 1.0), rowid
+        LIMIT %s OFFSET %s
+    ''',
+}
+
+POSTGRESQL = {
+    'insert': f'''
+        INSERT INTO todo_search (todo_id, user_id, document)
+        SELECT t.id, t.user_id,
+               setweight(to_tsvector('simple', t.title), 'A')
+               || setweight(to_tsvector('simple', t.content), 'B')
+               || setweight(to_tsvector('simple', COALESCE((SELECT string_agg(s.content, ' ') FROM {SUBTASKS} s WHERE s.todo_id = t.id), '')), 'C')
+        FROM {TODOS} t WHERE {{where}}
+    ''',
+    'delete': 'DELETE FROM todo_search WHERE todo_id IN ({ids})',
+    'delete_user': 'DELETE FROM todo_search WHERE user_id = %s',
+    'search': '''
+        SELECT todo_id FROM todo_search, to_tsquery('simple', %s) query
+        WHERE document @@ query AND user_id = %s
+        ORDER BY ts_rank(document, query) DESC, todo_id
+        LIMIT %s OFFSET %s
+    ''',
+}
+
+
+def statements():
+    return POSTGRESQL if connection.vendor == 'postgresql' else SQLITE
+
+def terms(query):
+    return [term.lower() for term in TERM.findall(query)][:MAX_TERMS]
+
+def search_params(user, terms):
+    # Every term must match, as a prefix so results show up while typing.
+    # Terms are \w+ only, so nothing in them can be read as query syntax.
+    if connection.vendor == 'postgresql':
+        return [' & '.join(f'{term}:*' for term in terms), user.id]
+    return [f'owner : u{user.id} AND {{title content subtasks}} : (' + ' '.join(f'"{term}"*' for term in terms) + ')']
+
+
+def placeholders(ids):
+    return ', '.join(['%s'] * len(ids))
+
+def index(ids):
+    # (Re)writes the documents of the given todos.
+    ids = list(ids)
+    if not ids:
+        return
+    sql = statements()
+    with connection.cursor() as cursor:
+        cursor.execute(sql['delete'].format(ids=placeholders(ids)), ids)
+        cursor.execute(sql['insert'].format(where=f't.id IN ({placeholders(ids)})'), ids)
+
+def index_user(user_id):
+    sql = statements()
+    with connection.cursor() as cursor:
+        cursor.execute(sql['delete_user'], [user_id])
+        cursor.execute(sql['insert'].format(where='t.user_id = %s'), [user_id])
+
+def index_all():
+    sql = statements()
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM todo_search')
+        cursor.execute(sql['insert'].format(where='1 = 1'))
+
+def remove(ids):
+    ids = list(ids)
+    if ids:
+        with connection.cursor() as cursor:
+            cursor.execute(statements()['delete'].format(ids=placeholders(ids)), ids)
+
+def remove_user(user_id):
+    with connection.cursor() as cursor:
+        cursor.execute(statements()['delete_user'], [user_id])
+
+
+def search(user, query, offset=0, limit=20):
+    # Ids of the user's todos matching every term of query, best first.
+    # Fetches one extra row so the caller can tell whether there is more.
+    query = terms(query)
+    if not query:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(statements()['search'], search_params(user, query) + [limit + 1, offset])
+        return [row[0] for row in cursor.fetchall()]
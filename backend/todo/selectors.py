@@ -0,0 +1,138 @@
+import datetime
+
+from asgiref.sync import sync_to_async
+from django.db.models import F, Prefetch, Window
+from django.db.models.functions import RowNumber
+
+from .models import TodoItem, TodoGroup, Subtask, ArchivedTodo, ArchivedSubtask
+from . import recurrence, search
+
+
+def subtask_queryset():
+    index = Window(RowNumber(), partition_by=[F('todo')], order_by=F('position').asc()) - 1
+    return Subtask.objects.annotate(index=index).order_by('position')
+
+def todo_queryset():
+    subtasks = Prefetch('subtasks', queryset=subtask_queryset())
+    return TodoItem.objects.select_related('group').prefetch_related(subtasks)
+
+def todo_list(user):
+    return todo_queryset().filter(user=user)
+
+def todo_get(id):
+    return todo_queryset().get(id=id)
+
+def todo_filter(user, **filters):
+    return filter_todos(todo_list(user), **filters)
+
+def filter_todos(todos, date=None, date_from=None, date_to=None, overdue=None, checked=None, q=None, group=None):
+    # Shared by both tiers; archived todos have the same fields.
+    today = datetime.date.today()
+
+    if date is not None:
+        todos = todos.filter(date=today + datetime.timedelta(days=date))
+    if date_from is not None:
+        todos = todos.filter(date__gte=date_from)
+    if date_to is not None:
+        todos = todos.filter(date__lte=date_to)
+    if overdue:
+        todos = todos.filter(date__lt=today, checked=False)
+    if checked is not None:
+        todos = todos.filter(checked=checked)
+    if q:
+        todos = todos.filter(title__icontains=q)
+    if group:
+        todos = todos.filter(group__in=group)
+    return todos
+
+def archived_subtask_queryset():
+    index = Window(RowNumber(), partition_by=[F('todo')], order_by=F('position').asc()) - 1
+    return ArchivedSubtask.objects.annotate(index=index).order_by('position')
+
+def archived_queryset():
+    subtasks = Prefetch('subtasks', queryset=archived_subtask_queryset())
+    return ArchivedTodo.objects.select_related('group').prefetch_related(subtasks)
+
+def archived_list(user):
+    return archived_queryset().filter(user=user)
+
+async def aarchived_get(id):
+    return await archived_queryset().aget(id=id)
+
+def archived_filter(user, **filters):
+    return filter_todos(archived_list(user), **filters)
+
+def search_rows(ids, todos, limit):
+    # ids come ranked from the index and todos in any order; the extra id
+    # fetched past limit only says whether there is another page.
+    by_id = {todo.id: todo for todo in todos}
+    return [by_id[id] for id in ids[:limit] if id in by_id], len(ids) > limit
+
+def todo_search(user, query, offset=0, limit=20):
+    ids = search.search(user, query, offset, limit)
+    return search_rows(ids, todo_list(user).filter(id__in=ids[:limit]), limit)
+
+async def atodo_search(user, query, offset=0, limit=20):
+    ids = await sync_to_async(search.search)(user, query, offset, limit)
+    return search_rows(ids, [todo async for todo in todo_list(user).filter(id__in=ids[:limit])], limit)
+
+async def atodo_get(id):
+    return await todo_queryset().aget(id=id)
+
+def window_querysets(user, window_start, window_end, **filters):
+    # Occurrences are never checked, so a checked filter drops the
+    # recurring queryset.
+    filters.update(date=None, date_from=window_start, date_to=window_end)
+    todos = todo_filter(user, **filters)
+    recurring = None
+    if not filters.get('checked') and not filters.get('overdue'):
+        recurring = todo_filter(user, **dict(filters, date_from=None, checked=None)).exclude(repeat='')
+    return todos, recurring
+
+def window_rows(todos, recurring, window_start, window_end):
+    rows = [(todo, todo.date, False) for todo in todos]
+    for todo in recurring:
+        for date in recurrence.expand(todo.repeat, todo.date, window_start, window_end):
+            if date != todo.date:
+                rows.append((todo, date, True))
+
+    rows.sort(key=lambda row: (row[1], row[0].id))
+    return rows
+
+def archived_window(user, window_start, window_end, **filters):
+    # Archived todos are checked and never recur, so they only ever show up
+    # on their own date.
+    return archived_filter(user, **dict(filters, date=None, date_from=window_start, date_to=window_end))
+
+def todo_window(user, window_start, window_end, include_archived=False, **filters):
+    # Real todos dated inside the window plus virtual occurrences of
+    # recurring todos, as (todo, date, virtual) sorted by date and id.
+    todos, recurring = window_querysets(user, window_start, window_end, **filters)
+    todos = list(todos)
+    if include_archived:
+        todos += archived_window(user, window_start, window_end, **filters)
+    return window_rows(todos, recurring or [], window_start, window_end)
+
+async def atodo_window(user, window_start, window_end, include_archived=False, **filters):
+    todos, recurring = window_querysets(user, window_start, window_end, **filters)
+    todos = [todo async for todo in todos]
+    if include_archived:
+        todos += [todo async for todo in archived_window(user, window_start, window_end, **filters)]
+    recurring = [todo async for todo in recurring] if recurring is not None else []
+    return window_rows(todos, recurring, window_start, window_end)
+
+
+def group_queryset():
+    return TodoGroup.objects.prefetch_related(
+        Prefetch('childs', queryset=TodoGroup.objects.only('id').order_by('id')),
+        Prefetch('todos', queryset=TodoItem.objects.only('id', 'group_id').order_by('id')),
+    )
+
+def group_list(user):
+    return group_queryset().filter(user=user)
+
+def group_get(id):
+    return group_queryset().get(id=id)
+
+async def agroup_get(id):
+    return await group_queryset().aget(id=id)
@@ -1,5 +1,8 @@
+import time
+
 from rest_framework import serializers
 from .models import TodoItem, TodoGroup, Subtask
+from . import metrics, recurrence
 from django.contrib.auth.models import User
 
 
@@ -17,17 +20,39 @@ def inline_serializer(*, fields, data=None, **kwargs):
 class StringListField(serializers.ListField):
     child = serializers.CharField()
 
+class PrimaryKeyListField(serializers.ListField):
+    # Validates a list of ids with one query, where PrimaryKeyRelatedField
+    # with many=True looks each one up on its own, and returns the ids.
+    child = serializers.IntegerField()
+
+    def __init__(self, queryset, **kwargs):
+        self.queryset = queryset
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, list) and all(type(id) is int for id in data):
+            # JSON bodies already hold ints; skip the per-item field.
+            ids = list(dict.fromkeys(data))
+        else:
+            ids = list(dict.fromkeys(super().to_internal_value(data)))
+        found = set(self.queryset.filter(pk__in=ids).values_list('pk', flat=True))
+        missing = [id for id in ids if id not in found]
+        if missing:
+            raise serializers.ValidationError(f'Invalid pk "{missing[0]}" - object does not exist.')
+        return ids
+
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'password']
+        extra_kwargs = {'password': {'write_only': True}}
 
 class GroupInputSerializer(serializers.Serializer):
     name = serializers.CharField(max_length=256)
-    childs = serializers.PrimaryKeyRelatedField(queryset=TodoGroup.objects.all(), many=True)
+    childs = PrimaryKeyListField(queryset=TodoGroup.objects.all())
     parent = serializers.PrimaryKeyRelatedField(queryset=TodoGroup.objects.all(), required=False)
-    todos = serializers.PrimaryKeyRelatedField(queryset=TodoItem.objects.all(), many=True)
+    todos = PrimaryKeyListField(queryset=TodoItem.objects.all())
 
 class TodoInputSerializer(serializers.Serializer):
     title = serializers.CharField(max_length=256)
@@ -37,34 +62,94 @@ class TodoInputSerializer(serializers.Serializer):
     checked = serializers.BooleanField()
     group = serializers.PrimaryKeyRelatedField(queryset=TodoGroup.objects.all(), required=False)
     subtasks = StringListField()
+    repeat = serializers.CharField(max_length=256, required=False, allow_blank=True)
+
+    def validate_repeat(self, value):
+        try:
+            recurrence.parse(value)
+        except ValueError as error:
+            raise serializers.ValidationError(str(error))
+        return value
+
+class TodoFilterSerializer(serializers.Serializer):
+    date = serializers.IntegerField(required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    overdue = serializers.BooleanField(required=False, allow_null=True)
+    checked = serializers.BooleanField(required=False, allow_null=True)
+    q = serializers.CharField(max_length=256, required=False)
+    group = serializers.ListField(child=serializers.IntegerField(), required=False)
+    include_archived = serializers.BooleanField(required=False, default=False)
+
+class TodoSearchSerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=256)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+    cursor = serializers.CharField(required=False)
+
+class StatsFilterSerializer(serializers.Serializer):
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
 
 class SubtaskInputSerializer(serializers.Serializer):
     content = serializers.CharField(max_length=256)
 
 
+class BatchActionSerializer(serializers.Serializer):
+    target = serializers.ChoiceField(choices=['todo', 'group', 'subtask'])
+    id = serializers.IntegerField(required=False)
+    action = serializers.CharField(max_length=64)
+    content = serializers.JSONField(required=False, allow_null=True)
+
+class BatchInputSerializer(serializers.Serializer):
+    actions = BatchActionSerializer(many=True)
+
+
+class TimedSerializer(serializers.Serializer):
+    # Output serializers report the time spent building each row to the
+    # request's metrics. Only top-level ones, so nesting is not counted twice.
+    def to_representation(self, instance):
+        began = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.add_serializer_time(time.perf_counter() - began)
+
+
 class SubtaskOutputSerializer(serializers.Serializer):
     id = serializers.IntegerField()
     index = serializers.IntegerField()
     checked = serializers.BooleanField()
     content = serializers.CharField(max_length=256)
 
-class GroupOutputSerializer(serializers.Serializer):
+class GroupOutputSerializer(TimedSerializer):
     id = serializers.IntegerField()
     name = serializers.CharField(max_length=256)
     childs = serializers.PrimaryKeyRelatedField(queryset=TodoGroup.objects.all(), many=True)
     parent = serializers.PrimaryKeyRelatedField(queryset=TodoGroup.objects.all())
     todos = serializers.PrimaryKeyRelatedField(queryset=TodoItem.objects.all(), many=True)
 
-class TodoOutputSerializer(serializers.Serializer):
+class TodoOutputSerializer(TimedSerializer):
     id = serializers.IntegerField()
     title = serializers.CharField(max_length=256)
     content = serializers.CharField()
     created_at = serializers.DateTimeField()
     date = serializers.DateField()
     checked = serializers.BooleanField()
+    repeat = serializers.CharField(max_length=256)
     group = inline_serializer(fields={
         'id': serializers.IntegerField(),
         'name': serializers.CharField(max_length=256)
     })
     subtasks = SubtaskOutputSerializer(many=True)
 
+
+class JobOutputSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    kind = serializers.CharField(max_length=32)
+    status = serializers.CharField(max_length=16)
+    done = serializers.IntegerField()
+    total = serializers.IntegerField(allow_null=True)
+    error = serializers.CharField(allow_blank=True)
+    created_at = serializers.DateTimeField()
+    started_at = serializers.DateTimeField(allow_null=True)
+    finished_at = serializers.DateTimeField(allow_null=True)
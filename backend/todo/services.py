@@ -1,4 +1,22 @@
-from .models import TodoItem, TodoGroup, Subtask
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import TodoItem, TodoGroup, Subtask, Tombstone
+from . import grouptree, membership, search, stats
+from .caching import bump_version
+from .feed import bus
+from .syncing import record_deleted
+
+
+def notify(user_id):
+    # Cached reads see the new version right away; feed subscribers are
+    # woken only once the change is committed and visible to them.
+    bump_version(user_id)
+    transaction.on_commit(lambda: bus.publish(user_id))
 
 
 class Service():
@@ -10,220 +28,538 @@ class Service():
 
         object.full_clean()
         object.save()
+        cls.changed(object)
         
         return object
     
     @classmethod
     def delete(cls, id):
-        cls.model.objects.get(id=id).delete()
+        object = cls.model.objects.get(id=id)
+        object.delete()
+        cls.changed(object)
+
+    @classmethod
+    def check_many(cls, objects, checked=True):
+        cls.model.objects.filter(id__in=[object.id for object in objects]).update(checked=checked, updated_at=timezone.now())
+        for object in objects:
+            object.checked = checked
+        for user_id in {cls.owner_id(object) for object in objects}:
+            notify(user_id)
+
+    # Async counterparts for the async views. Django's async ORM has no
+    # transaction.atomic, so each write runs whole, with its on_commit
+    # version bumps, in one hop to the sync thread.
+    @classmethod
+    async def acreate(cls, **kwargs):
+        return await sync_to_async(cls.create)(**kwargs)
+
+    @classmethod
+    async def adelete(cls, id):
+        await sync_to_async(cls.delete)(id)
+
+    @classmethod
+    async def aperform(cls, object, action, content):
+        return await sync_to_async(cls.perform)(object, action, content)
+
+    @staticmethod
+    def owner_id(object):
+        return object.user_id
+
+    @classmethod
+    def changed(cls, object):
+        notify(cls.owner_id(object))
+
+    @staticmethod
+    def performed(action):
+        return {'success': action + ' performed successfully', 'status': True}
+
+    @staticmethod
+    def invalid():
+        return {'error': 'Invalid action', 'status': False}
 
 
 class TodoItemService(Service):
     model = TodoItem
 
-    @staticmethod
-    def rename(todo, new_title):
+    @classmethod
+    def rename(cls, todo, new_title):
         todo.title = new_title
-        todo.save()
+        # Only the title: a full save from a stale instance could undo a
+        # concurrent check and leave the counters behind.
+        with transaction.atomic():
+            todo.save(update_fields=['title', 'updated_at'])
+            search.index([todo.id])
+        cls.changed(todo)
     
-    @staticmethod
-    def check(todo):
-        todo.checked = True
-        todo.save()
+    @classmethod
+    def set_checked(cls, todo, checked):
+        # The filtered UPDATE says whether the todo really flipped, which
+        # keeps the counters right when the same todo is checked twice.
+        with transaction.atomic():
+            if TodoItem.objects.filter(id=todo.id, checked=not checked).update(checked=checked, updated_at=timezone.now()):
+                stats.todo_checked(todo, checked)
+            todo.checked = checked
+            cls.changed(todo)
+
+    @classmethod
+    def check(cls, todo):
+        cls.set_checked(todo, True)
     
-    @staticmethod
-    def uncheck(todo):
-        todo.checked = False
-        todo.save()
+    @classmethod
+    def uncheck(cls, todo):
+        cls.set_checked(todo, False)
 
-    @staticmethod
-    def move_todo(old_group, new_group, todo_id):
-        TodoGroupService.remove_todo(old_group, todo_id)
-        TodoGroupService.add_todo(new_group, todo_id)
+    @classmethod
+    def check_many(cls, todos, checked=True):
+        with transaction.atomic():
+            flipping = TodoItem.objects.select_for_update().filter(id__in=[todo.id for todo in todos], checked=not checked)
+            rows = list(flipping.values_list('user_id', 'group_id', 'date'))
+            super().check_many(todos, checked)
+            stats.todos_checked(rows, checked)
 
-    @staticmethod
-    def add_subtask(todo, content):
-        subtask = Subtask.objects.create(todo=todo, content=content, index=len(todo.subtasks.all()))
-        todo.subtasks.add(subtask)
+    @classmethod
+    def delete_many(cls, todos):
+        # Deletes todos, with their subtasks and memberships, in a fixed
+        # number of queries. What the todo_deleted signal does per row (a
+        # tombstone, a counter update and an index write) happens here once
+        # for all of them, so the rows are removed without the signal.
+        ids = [todo.id for todo in todos]
+        if not ids:
+            return
+        with transaction.atomic():
+            Subtask.objects.filter(todo_id__in=ids).delete()
+            TodoItem.subtasks.through.objects.filter(todoitem_id__in=ids).delete()
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {TodoItem._meta.db_table} WHERE id IN ({", ".join(["%s"] * len(ids))})', ids)
+
+            by_user = {}
+            for todo in todos:
+                by_user.setdefault(todo.user_id, []).append(todo.id)
+            for user_id, user_ids in by_user.items():
+                record_deleted(user_id, Tombstone.TODO, user_ids)
+                notify(user_id)
+            stats.todos_removed(todos)
+            search.remove(ids)
+
+    @classmethod
+    def move_todo(cls, old_group, new_group, todo_id):
+        # A todo is in one group at most, so old_group is implied.
+        new_group = TodoGroupService.get_group(new_group)
+        with transaction.atomic():
+            todo = TodoItem.objects.only('user_id').get(id=todo_id)
+            membership.move_todos([todo_id], new_group)
+            cls.changed(todo)
+
+    @classmethod
+    def perform(cls, todo, action, content):
+        if action == 'rename':
+            cls.rename(todo, content)
+        elif action == 'check':
+            cls.check(todo)
+        elif action == 'uncheck':
+            cls.uncheck(todo)
+        elif action == 'move':
+            cls.move_todo(content['old_group'], content['new_group'], todo.id)
+        else:
+            return cls.invalid()
+        return cls.performed(action)
+
+    @classmethod
+    def add_subtask(cls, todo, content):
+        with transaction.atomic():
+            last = Subtask.objects.filter(todo=todo).aggregate(last=Max('position'))['last'] or 0
+            subtask = Subtask.objects.create(todo=todo, content=content, position=last + Subtask.GAP)
+            todo.subtasks.add(subtask)
+            search.index([todo.id])
+        cls.changed(todo)
+
+    @classmethod
+    async def aadd_subtask(cls, todo, content):
+        await sync_to_async(cls.add_subtask)(todo, content)
     
     @classmethod
     def create(cls, **validated_data):
         subtasks = validated_data.pop('subtasks')
-        group = validated_data.pop('group', None)
-        todo = super().create(**validated_data)
+        group = validated_data.get('group', None)
 
-        for i in range(len(subtasks)):
-            subtask = Subtask.objects.create(todo=todo, content=subtasks[i], index=i)
-            todo.subtasks.add(subtask)
-            
-        if group is not None:
-            group = TodoGroup.objects.get(id=todo.group.id)
-            TodoGroupService.add_todo(group, todo.id)
+        with transaction.atomic():
+            todo = super().create(**validated_data)
+            stats.todo_added(todo)
+            SubtaskService.sync(todo, subtasks)
+            search.index([todo.id])
+
+            if group is not None:
+                TodoGroupService.touch(group)
 
         return todo
 
     @classmethod
     def update(cls, id, **validated_data):
         subtasks = validated_data.pop('subtasks')
-        todo = cls.model.objects.filter(id=id)
-        todo.update(**validated_data)
-        todo = cls.model.objects.get(id=id)
-
-        for i in range(1,len(subtasks)+1):
-            if len(todo.subtasks) > i:
-                if todo.subtasks[i].content != subtasks[i]:
-                    todo.subtasks[i].content = subtasks[i]
-                    todo.subtasks[i].index = i
-                    todo.subtasks[i].save()
-            else:
-                subtask = Subtask.objects.create(todo=todo, content=subtasks[i], index=i)
-                todo.subtasks.add(subtask)
+
+        with transaction.atomic():
+            old = cls.model.objects.select_for_update().get(id=id)
+            cls.model.objects.filter(id=id).update(**validated_data, updated_at=timezone.now())
+            todo = cls.model.objects.get(id=id)
+            stats.todo_changed(old, todo)
+            if old.group_id != todo.group_id:
+                membership.touch([old.group_id, todo.group_id])
+            SubtaskService.sync(todo, subtasks)
+            search.index([todo.id])
+            cls.changed(todo)
 
         return todo
 
+    @classmethod
+    async def aupdate(cls, id, **validated_data):
+        return await sync_to_async(cls.update)(id, **validated_data)
+
 
 class TodoGroupService(Service):
     model = TodoGroup
 
-    @staticmethod
-    def rename_group(group, new_name):
+    @classmethod
+    def rename_group(cls, group, new_name):
         group.name = new_name
         group.save()
+        cls.changed(group)
 
-    @staticmethod
-    def add_todo(group, todo_id):
-        todo = TodoItem.objects.get(id=todo_id)
-        group.todos.add(todo)
+    @classmethod
+    def add_todo(cls, group, todo_id):
+        membership.move_todos([todo_id], group)
+        cls.changed(group)
     
+    @classmethod
+    def remove_todo(cls, group, todo_id):
+        membership.move_todos([todo_id], None, source=group)
+        cls.changed(group)
+
+    @classmethod
+    def touch(cls, group):
+        # Membership lives in other rows, which do not bump updated_at.
+        membership.touch([group.id])
+        cls.changed(group)
+
     @staticmethod
-    def remove_todo(group, todo_id):
-        group.todos.remove(todo_id)
+    def get_group(group):
+        if group is None or isinstance(group, TodoGroup):
+            return group
+        return TodoGroup.objects.get(id=group)
 
     @classmethod
     def add_group(cls, group, group_to_add):
+        group = cls.get_group(group)
+        group_to_add = cls.get_group(group_to_add)
         verify = cls.verify_group(group, group_to_add)
         if verify['status']:
-            group.childs.add(group_to_add)
-            group_to_add.parent = group
-            group_to_add.save()
+            membership.add_childs(group, [group_to_add])
+            cls.touch(group)
             return verify
         else: return verify
 
-    @staticmethod
-    def remove_group(group, group_to_remove):
-        group.childs.remove(group_to_remove)
-        group_to_remove.parent = None
-        group_to_remove.save()
+    @classmethod
+    def remove_group(cls, group, group_to_remove):
+        group = cls.get_group(group)
+        group_to_remove = cls.get_group(group_to_remove)
+        membership.remove_childs(group, [group_to_remove])
+        cls.touch(group)
     
     @classmethod
     def move_group(cls, old_group, new_group, group):
+        old_group = cls.get_group(old_group)
+        new_group = cls.get_group(new_group)
         verify = cls.verify_group(new_group, group)
         if verify['status']:
-            TodoGroupService.remove_group(old_group, group)
-            TodoGroupService.add_group(new_group, group)
+            if old_group is not None:
+                cls.remove_group(old_group, group)
+            cls.add_group(new_group, group)
             return verify
         else: return verify
 
+    @classmethod
+    def perform(cls, group, action, content):
+        if action == 'rename':
+            cls.rename_group(group, content)
+        elif action == 'add_todo':
+            cls.add_todo(group, content)
+        elif action == 'remove_todo':
+            cls.remove_todo(group, content)
+        elif action == 'add_group':
+            return cls.add_group(group, content)
+        elif action == 'remove_group':
+            cls.remove_group(group, content)
+        elif action == 'move_group':
+            return cls.move_group(content['old_group'], content['new_group'], group)
+        else:
+            return cls.invalid()
+        return cls.performed(action)
+
     @classmethod
     def verify_group(cls, parent_group, child_group):
         if parent_group is None:
             return {'success': 'Group verified successfully', 'status': True}
+        elif parent_group.id == child_group.id:
+            return {'error': 'Group cannot be parent of itself', 'status': False}
+        elif parent_group.id == child_group.parent_id:
+            return {'error': 'Group allready has this parent', 'status': False}
+        elif grouptree.contains(child_group, parent_group):
+            return {'error': 'Child group found in parent family', 'status': False}
         else:
-            if parent_group == child_group:
-                return {'error': 'Group cannot be parent of itself', 'status': False}
-            elif parent_group == child_group.parent:
-                return {'error': 'Group allready has this parent', 'status': False}
-            elif parent_group.parent == child_group:
-                return {'error': 'Child group found in parent family', 'status': False}
-            else:
-                return cls.verify_group(parent_group.parent, child_group)
+            return {'success': 'Group verified successfully', 'status': True}
 
     @classmethod
     def create(cls, **validated_data):
         todos = validated_data.pop('todos')
         childs = validated_data.pop('childs')
-        parent = validated_data.pop('parent', None) 
-        group = super().create(**validated_data, parent=parent)
-
-        group.todos.set(todos)
+        parent = validated_data.pop('parent', None)
+        touched = set()
+        with transaction.atomic():
+            group = super().create(**validated_data)
+            # Another user's group does not take it in, so it starts at the root.
+            if parent is not None and membership.add_childs(parent, [group], touched):
+                touched.add(parent.id)
+            else:
+                grouptree.set_parent(group, None)
+            membership.move_todos(todos, group, touched=touched)
+            membership.add_childs(group, childs, touched)
+            membership.touch(touched - {group.id})
+        return group
 
-        if parent is not None:
-            cls.add_group(parent, group.id)
+    @classmethod
+    def delete(cls, group):
+        # The subtree's todos go in a fixed number of queries first, so the
+        # cascade that takes the groups has none left to signal for.
+        group = cls.get_group(group)
+        with transaction.atomic():
+            TodoItemService.delete_many(list(grouptree.subtree_todos(group)))
+            group.delete()
+            cls.changed(group)
 
-        for child in childs:
-            cls.add_group(group, child.id)
+    @classmethod
+    def save_group(cls, group, name, parent, touched=None):
+        # Renames group and moves it under parent with one write of its
+        # row. A parent that would put group inside itself is ignored.
+        group.name = name
+        old_parent_id = group.parent_id
+        if parent is None and old_parent_id is not None:
+            membership.remove_childs(group.parent, [group])
+        elif parent is not None and parent.id != old_parent_id:
+            membership.add_childs(parent, [group], touched)
+        if group.parent_id == old_parent_id:
+            group.save(update_fields=['name', 'updated_at'])
+        else:
+            membership.touch({old_parent_id, group.parent_id}, touched)
 
-        return group
-    
     @classmethod
-    def update(cls, id, **validated_data):
+    def update(cls, group, changes=None, **validated_data):
+        # The group row is written once, the other groups the save changed
+        # are touched together, and the owner is notified once. changes are
+        # membership.changes for todos and childs when already known.
+        group = cls.get_group(group)
         todos = validated_data.pop('todos')
         childs = validated_data.pop('childs')
-        group = cls.model.objects.get(id=id)
-        cls.rename_group(group, validated_data.get('name'))
-        cls.change_parent(group, validated_data.pop('parent', None))
-
-        group.todos.clear()
-        group.todos.set(todos)
-
-        group.childs.clear()
-
-        for child in childs:
-            cls.add_group(group, child.id)
-
+        (added, removed), (adopted, dropped) = changes or membership.changes(group, todos, childs)
+        touched = set()
+        with transaction.atomic():
+            cls.save_group(group, validated_data.get('name'), validated_data.get('parent'), touched)
+            # Only what differs from the stored membership is written.
+            membership.move_todos(removed, None, source=group, touched=touched)
+            membership.move_todos(added, group, touched=touched)
+            membership.remove_childs(group, dropped)
+            membership.add_childs(group, adopted, touched)
+            membership.touch(touched - {group.id})
+            cls.changed(group)
         return group
 
+    @classmethod
+    async def aupdate(cls, group, changes=None, **validated_data):
+        return await sync_to_async(cls.update)(group, changes, **validated_data)
+
 class SubtaskService(Service):
     model = Subtask
 
     @staticmethod
-    def rename(subtask, new_content):
+    def owner_id(subtask):
+        return subtask.todo.user_id
+
+    @classmethod
+    def rename(cls, subtask, new_content):
         subtask.content = new_content
-        subtask.save()
+        with transaction.atomic():
+            subtask.save()
+            search.index([subtask.todo_id])
+        cls.changed(subtask)
     
-    @staticmethod
-    def check(subtask):
+    @classmethod
+    def check(cls, subtask):
         subtask.checked = True
         subtask.save()
+        cls.changed(subtask)
     
-    @staticmethod
-    def uncheck(subtask):
+    @classmethod
+    def uncheck(cls, subtask):
         subtask.checked = False
         subtask.save()
+        cls.changed(subtask)
     
     @staticmethod
-    def move(subtask_to_move, index):
-        old_index = subtask_to_move.index
+    def sync(todo, contents):
+        # Turns the stored subtasks into contents, in order, with a fixed
+        # number of queries: one read, one bulk update, one delete and one
+        # bulk insert. A row whose content is still submitted keeps its id
+        # and checked state wherever it moves; contents without one take
+        # over the remaining rows in order, as renames, and only the rest
+        # are inserted.
+        with transaction.atomic():
+            existing = list(Subtask.objects.filter(todo=todo).order_by('position', 'id'))
+
+            by_content = {}
+            for subtask in existing:
+                by_content.setdefault(subtask.content, deque()).append(subtask)
+            rows = [by_content[content].popleft() if by_content.get(content) else None for content in contents]
+            matched = {row.id for row in rows if row is not None}
+            remaining = deque(subtask for subtask in existing if subtask.id not in matched)
+            for i, content in enumerate(contents):
+                if rows[i] is None:
+                    rows[i] = remaining.popleft() if remaining else Subtask(todo=todo, content=content)
+
+            now = timezone.now()
+            changed, added = [], []
+            positions = SubtaskService.sync_positions([row.position if row.pk else None for row in rows])
+            for row, content, position in zip(rows, contents, positions):
+                if row.pk is None:
+                    row.position = position
+                    added.append(row)
+                elif row.content != content or row.position != position:
+                    row.content = content
+                    row.position = position
+                    row.updated_at = now
+                    changed.append(row)
+            if changed:
+                Subtask.objects.bulk_update(changed, ['content', 'position', 'updated_at'])
+
+            removed = [subtask.id for subtask in remaining]
+            if removed:
+                Subtask.objects.filter(id__in=removed).delete()
+                record_deleted(todo.user_id, Tombstone.SUBTASK, removed)
+                TodoItem.objects.filter(id=todo.id).update(updated_at=now)
+
+            if added:
+                todo.subtasks.add(*Subtask.objects.bulk_create(added))
+
+            notify(todo.user_id)
 
-        if old_index == index:
-            return
-        todo = TodoItem.objects.get(id=subtask_to_move.todo.id)
-        for subtask in todo.subtasks.all().order_by('index'):
-            if old_index > index:
-                if subtask.index >= index and subtask.index < old_index:
-                    subtask.index += 1
-                    subtask.save()
-                else:
-                    print(subtask.index, subtask.content)
+    @staticmethod
+    def sync_positions(positions):
+        # New position keys for rows holding positions, None for a new row.
+        # Keys still in order, with room below them for the new rows before
+        # them, are kept; the others are spread out between those.
+        kept, pending = [], 0
+        for i, position in enumerate(positions):
+            if position is not None and (not kept or position - positions[kept[-1]] > pending):
+                kept.append(i)
+                pending = 0
             else:
-                if subtask.index > old_index and subtask.index <= index:
-                    subtask.index -= 1
-                    subtask.save()
-                else:
-                    print(subtask.index, subtask.content)
-
-        subtask_to_move.index = index
-        subtask_to_move.save()
+                pending += 1
+        if not kept:
+            return [(i + 1) * Subtask.GAP for i in range(len(positions))]
+
+        result = list(positions)
+        for i in range(kept[0]):
+            result[i] = positions[kept[0]] - (kept[0] - i) * Subtask.GAP
+        for start, end in zip(kept, kept[1:]):
+            step = (positions[end] - positions[start]) // (end - start)
+            for i in range(start + 1, end):
+                result[i] = positions[start] + (i - start) * step
+        for i in range(kept[-1] + 1, len(positions)):
+            result[i] = positions[kept[-1]] + (i - kept[-1]) * Subtask.GAP
+        return result
 
     @staticmethod
-    def remove(subtask):
-        index = subtask.index
-        subtask.delete()
-        todo = TodoItem.objects.get(id=subtask.todo.id)
-        for subtask in todo.subtasks.all():
-            if subtask.index > index:
-                subtask.index -= 1
-                subtask.save()
+    def renumber(todo_id):
+        subtasks = list(Subtask.objects.filter(todo_id=todo_id).order_by('position', 'id').only('id'))
+        now = timezone.now()
+        for i, subtask in enumerate(subtasks):
+            subtask.position = (i + 1) * Subtask.GAP
+            subtask.updated_at = now
+        Subtask.objects.bulk_update(subtasks, ['position', 'updated_at'])
+
+    @classmethod
+    def position_for(cls, subtask, index):
+        # Positions of the subtasks that will surround subtask once it sits
+        # at index, ignoring its current slot.
+        # An index past either end clamps to that end.
+        siblings = Subtask.objects.filter(todo_id=subtask.todo_id).exclude(id=subtask.id).order_by('position')
+        index = max(index, 0)
+        start = max(index - 1, 0)
+        neighbours = list(siblings.values_list('position', flat=True)[start:index + 1])
+
+        if index == 0:
+            before, after = None, neighbours[0] if neighbours else None
+        elif not neighbours:
+            before, after = siblings.values_list('position', flat=True).last(), None
+        else:
+            before = neighbours[0] if neighbours else None
+            after = neighbours[1] if len(neighbours) > 1 else None
+
+        if before is None and after is None:
+            return Subtask.GAP
+        if before is None:
+            return after - Subtask.GAP
+        if after is None:
+            return before + Subtask.GAP
+        if after - before < 2:
+            return None
+        return (before + after) // 2
+
+    @classmethod
+    def move(cls, subtask_to_move, index):
+        with transaction.atomic():
+            position = cls.position_for(subtask_to_move, index)
+            if position is None:
+                # Gap exhausted between the neighbours: spread the todo's
+                # keys out again, which is rare enough to amortise to O(1).
+                cls.renumber(subtask_to_move.todo_id)
+                position = cls.position_for(subtask_to_move, index)
+
+            Subtask.objects.filter(id=subtask_to_move.id).update(position=position, updated_at=timezone.now())
+            subtask_to_move.position = position
+            cls.changed(subtask_to_move)
+
+    @classmethod
+    def remove(cls, subtask):
+        id = subtask.id
+        with transaction.atomic():
+            subtask.delete()
+            record_deleted(cls.owner_id(subtask), Tombstone.SUBTASK, [id])
+            # The remaining subtasks' indexes shift, so the todo counts as changed.
+            TodoItem.objects.filter(id=subtask.todo_id).update(updated_at=timezone.now())
+            search.index([subtask.todo_id])
+        cls.changed(subtask)
+
+    @classmethod
+    async def aremove(cls, subtask):
+        await sync_to_async(cls.remove)(subtask)
+
+    @classmethod
+    def delete(cls, id):
+        cls.remove(Subtask.objects.select_related('todo').get(id=id))
+
+    @classmethod
+    def perform(cls, subtask, action, content):
+        if action == 'rename':
+            cls.rename(subtask, content)
+        elif action == 'check':
+            cls.check(subtask)
+        elif action == 'uncheck':
+            cls.uncheck(subtask)
+        elif action == 'remove':
+            cls.remove(subtask)
+        elif action == 'move':
+            cls.move(subtask, int(content))
+        else:
+            return cls.invalid()
+        return cls.performed(action)
     
     @classmethod
     def create(cls, **validated_data):
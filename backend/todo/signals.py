@@ -0,0 +1,54 @@
+from django.contrib.auth.models import User
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache
+from .metrics import record_query
+from . import search, stats
+from .models import TodoItem, TodoGroup, Tombstone
+
+
+def deleting_user(origin):
+    return isinstance(origin, User) or getattr(origin, 'model', None) is User
+
+# Todos and groups also disappear through cascades (a group takes its
+# subgroups and todos with it), so their tombstones, counter updates and
+# search documents are handled here rather than in the services.
+
+@receiver(post_delete, sender=TodoItem)
+def todo_deleted(sender, instance, origin=None, **kwargs):
+    if not deleting_user(origin):
+        Tombstone.objects.create(user_id=instance.user_id, kind=Tombstone.TODO, object_id=instance.id)
+        stats.todo_removed(instance)
+        search.remove([instance.id])
+
+@receiver(post_delete, sender=TodoGroup)
+def group_deleted(sender, instance, origin=None, **kwargs):
+    if not deleting_user(origin):
+        Tombstone.objects.create(user_id=instance.user_id, kind=Tombstone.GROUP, object_id=instance.id)
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def token_changed(sender, instance, **kwargs):
+    token_cache.evict(instance.key)
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    # Covers password changes and deactivation.
+    token_cache.evict_user(instance.id)
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    # The search index has no foreign keys, so nothing cascades into it.
+    search.remove_user(instance.id)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    # Feeds per-request query counts and SQL time to todo/metrics.py.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
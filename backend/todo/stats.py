@@ -0,0 +1,175 @@
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+
+from .models import TodoItem, TodoGroup, GroupCounter, DayCounter
+
+
+# Counter upkeep. Every change is a (pending, completed) delta applied with
+# an F() update inside the caller's transaction, so concurrent writers add
+# up instead of overwriting each other.
+
+def _add(model, pending, completed, **key):
+    if not pending and not completed:
+        return
+    updated = model.objects.filter(**key).update(pending=F('pending') + pending, completed=F('completed') + completed)
+    if not updated and (pending > 0 or completed > 0):
+        # First todo for this key. A row can only be missing when adding;
+        # removals of a group being deleted must not bring it back.
+        model.objects.bulk_create([model(**key)], ignore_conflicts=True)
+        model.objects.filter(**key).update(pending=F('pending') + pending, completed=F('completed') + completed)
+
+def _apply(user_id, group_id, date, pending, completed):
+    if group_id is not None:
+        _add(GroupCounter, pending, completed, user_id=user_id, group_id=group_id)
+    _add(DayCounter, pending, completed, user_id=user_id, date=date)
+
+def _delta(checked, sign):
+    return (0, sign) if checked else (sign, 0)
+
+
+def todo_added(todo):
+    _apply(todo.user_id, todo.group_id, todo.date, *_delta(todo.checked, 1))
+
+def todo_removed(todo):
+    _apply(todo.user_id, todo.group_id, todo.date, *_delta(todo.checked, -1))
+
+def todo_changed(old, new):
+    # An update may move a todo to another group or day and check it.
+    if (old.group_id, old.date, old.checked) != (new.group_id, new.date, new.checked):
+        todo_removed(old)
+        todo_added(new)
+
+def todo_checked(todo, checked):
+    # todo flipped to checked; one pending becomes completed or back.
+    sign = 1 if checked else -1
+    _apply(todo.user_id, todo.group_id, todo.date, -sign, sign)
+
+def todos_checked(rows, checked):
+    # rows of (user_id, group_id, date) for todos that flipped together.
+    sign = 1 if checked else -1
+    groups, days = {}, {}
+    for user_id, group_id, date in rows:
+        if group_id is not None:
+            groups[(user_id, group_id)] = groups.get((user_id, group_id), 0) + 1
+        days[(user_id, date)] = days.get((user_id, date), 0) + 1
+    for (user_id, group_id), count in groups.items():
+        _add(GroupCounter, -sign * count, sign * count, user_id=user_id, group_id=group_id)
+    for (user_id, date), count in days.items():
+        _add(DayCounter, -sign * count, sign * count, user_id=user_id, date=date)
+
+def _apply_many(todos, sign):
+    # Bulk inserts and removals: one update per group and day touched,
+    # not per todo.
+    groups, days = {}, {}
+    for todo in todos:
+        pending, completed = _delta(todo.checked, sign)
+        keys = [(days, (todo.user_id, todo.date))]
+        if todo.group_id is not None:
+            keys.append((groups, (todo.user_id, todo.group_id)))
+        for totals, key in keys:
+            total = totals.setdefault(key, [0, 0])
+            total[0] += pending
+            total[1] += completed
+    for (user_id, group_id), (pending, completed) in groups.items():
+        _add(GroupCounter, pending, completed, user_id=user_id, group_id=group_id)
+    for (user_id, date), (pending, completed) in days.items():
+        _add(DayCounter, pending, completed, user_id=user_id, date=date)
+
+def todos_added(todos):
+    _apply_many(todos, 1)
+
+def todos_removed(todos):
+    _apply_many(todos, -1)
+
+def todos_moved(rows, new_group_id):
+    # rows of (user_id, group_id, checked) for todos moved together from
+    # their groups to new_group_id.
+    totals = {}
+    for user_id, group_id, checked in rows:
+        pending, completed = _delta(checked, 1)
+        for key, sign in (((user_id, group_id), -1), ((user_id, new_group_id), 1)):
+            if key[1] is not None:
+                total = totals.setdefault(key, [0, 0])
+                total[0] += sign * pending
+                total[1] += sign * completed
+    for (user_id, group_id), (pending, completed) in totals.items():
+        _add(GroupCounter, pending, completed, user_id=user_id, group_id=group_id)
+
+
+def rebuild(user):
+    # Recomputes the user's counters from their todos and returns how many
+    # rows were wrong, missing or left over.
+    counts = {'pending': Count('id', filter=Q(checked=False)), 'completed': Count('id', filter=Q(checked=True))}
+    todos = TodoItem.objects.filter(user=user).order_by()
+
+    with transaction.atomic():
+        expected_groups = {row['group']: (row['pending'], row['completed']) for row in todos.exclude(group=None).values('group').annotate(**counts)}
+        expected_days = {row['date']: (row['pending'], row['completed']) for row in todos.values('date').annotate(**counts)}
+        current_groups = {row[0]: row[1:] for row in GroupCounter.objects.filter(user=user).values_list('group', 'pending', 'completed')}
+        current_days = {row[0]: row[1:] for row in DayCounter.objects.filter(user=user).values_list('date', 'pending', 'completed')}
+        drift = sum(
+            1 for expected, current in ((expected_groups, current_groups), (expected_days, current_days))
+            for key in expected.keys() | current.keys() if expected.get(key, (0, 0)) != current.get(key, (0, 0))
+        )
+
+        GroupCounter.objects.filter(user=user).delete()
+        DayCounter.objects.filter(user=user).delete()
+        GroupCounter.objects.bulk_create([
+            GroupCounter(user=user, group_id=group, pending=pending, completed=completed)
+            for group, (pending, completed) in expected_groups.items()
+        ])
+        DayCounter.objects.bulk_create([
+            DayCounter(user=user, date=date, pending=pending, completed=completed)
+            for date, (pending, completed) in expected_days.items()
+        ])
+    return drift
+
+
+def summary(user, date_from=None, date_to=None):
+    # Reads only counter and group rows: O(groups + days), whatever the
+    # number of todos. Each group reports its own todos and, as total_*,
+    # those of its whole subtree.
+    groups = list(TodoGroup.objects.filter(user=user).order_by('id').values('id', 'name', 'parent', 'path'))
+    own = {row[0]: row[1:] for row in GroupCounter.objects.filter(user=user).values_list('group', 'pending', 'completed')}
+
+    days = DayCounter.objects.filter(user=user).order_by('date')
+    totals = days.aggregate(pending=Coalesce(Sum('pending'), 0), completed=Coalesce(Sum('completed'), 0))
+    if date_from is not None:
+        days = days.filter(date__gte=date_from)
+    if date_to is not None:
+        days = days.filter(date__lte=date_to)
+
+    rolled = {group['id']: [0, 0] for group in groups}
+    for group in groups:
+        pending, completed = own.get(group['id'], (0, 0))
+        for ancestor in group['path'].strip('/').split('/') if group['path'] else [group['id']]:
+            subtree = rolled.get(int(ancestor))
+            if subtree is not None:
+                subtree[0] += pending
+                subtree[1] += completed
+
+    return {
+        'total': totals,
+        'ungrouped': {
+            'pending': totals['pending'] - sum(pending for pending, _ in own.values()),
+            'completed': totals['completed'] - sum(completed for _, completed in own.values()),
+        },
+        'groups': [
+            {
+                'id': group['id'],
+                'name': group['name'],
+                'parent': group['parent'],
+                'pending': own.get(group['id'], (0, 0))[0],
+                'completed': own.get(group['id'], (0, 0))[1],
+                'total_pending': rolled[group['id']][0],
+                'total_completed': rolled[group['id']][1],
+            }
+            for group in groups
+        ],
+        'days': [
+            {'date': date.isoformat(), 'pending': pending, 'completed': completed}
+            for date, pending, completed in days.values_list('date', 'pending', 'completed')
+            if pending or completed
+        ],
+    }
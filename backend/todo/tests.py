@@ -1,3 +1,1625 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+
+from django.conf import settings
+from django.test import TestCase, TransactionTestCase, AsyncClient, override_settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .models import TodoItem, TodoGroup, Subtask, ArchivedTodo, ArchivedSubtask, Job, Tombstone
+from .pagination import TODO_ORDERING, GROUP_ORDERING
+from .selectors import todo_filter, todo_list, group_list
+from .serializers import TodoOutputSerializer, GroupOutputSerializer
+from .caching import get_cache, get_version_cache, shared_versions
+from .authentication import TokenCache, token_cache
+from .services import TodoItemService, TodoGroupService, SubtaskService
+from . import archive, compact, datasets, feed, grouptree, hashing, jobs, membership, metrics, recurrence, search, stats, transfer
+
+
+# The suite keeps versions in process whatever the environment sets, so
+# clear_caches() never empties a real TODO_VERSION_CACHE_DIR. Fixtures
+# drive routes well past the query limit on purpose; the query counts
+# that matter are pinned with assertNumQueries instead of logged.
+test_settings = override_settings(
+    CACHES={
+        **settings.CACHES,
+        'versions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'versions', 'TIMEOUT': None},
+    },
+    TODO_METRICS_MAX_QUERIES=None,
+)
+
+def shared_version_cache(test):
+    # A file cache in a directory of the test's own, as TODO_VERSION_CACHE_DIR
+    # configures one.
+    directory = test.enterContext(tempfile.TemporaryDirectory())
+    test.enterContext(override_settings(CACHES={
+        **settings.CACHES,
+        'versions': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory, 'TIMEOUT': None},
+    }))
+    return directory
+
+def clear_caches():
+    get_cache().clear()
+    get_version_cache().clear()
+
+def make_todos(user, count, group=None, subtasks=3):
+    for i in range(count):
+        todo = TodoItem.objects.create(title=f'todo {i}', content='', date=datetime.date.today(), user=user, group=group)
+        for j in range(subtasks):
+            subtask = Subtask.objects.create(todo=todo, content=f'subtask {j}', position=(j + 1) * Subtask.GAP)
+            todo.subtasks.add(subtask)
+    stats.rebuild(user)
+
+
+def streamed_content(response):
+    # Async views stream from an async iterator.
+    if response.is_async:
+        async def read():
+            return b''.join([chunk async for chunk in response.streaming_content])
+        return async_to_sync(read)()
+    return b''.join(response.streaming_content)
+
+
+@test_settings
+class APITestCase(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def count_queries(self, url, cached=False):
+        if not cached:
+            get_cache().clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+
+class TodoQueryCountTest(APITestCase):
+    def test_list_queries_do_not_grow_with_todos(self):
+        group = TodoGroup.objects.create(name='group', user=self.user)
+        make_todos(self.user, 2, group)
+        few = self.count_queries('/todos/')
+        make_todos(self.user, 50, group)
+        many = self.count_queries('/todos/')
+        self.assertEqual(few, many)
+
+    def test_list_subtasks_are_ordered(self):
+        todo = TodoItem.objects.create(title='todo', content='', date=datetime.date.today(), user=self.user)
+        for index in (2, 0, 1):
+            todo.subtasks.add(Subtask.objects.create(todo=todo, content=str(index), position=index))
+        response = self.client.get('/todos/')
+        self.assertEqual([s['index'] for s in response.json()[0]['subtasks']], [0, 1, 2])
+
+    def test_group_list_queries_do_not_grow_with_groups(self):
+        parent = TodoGroup.objects.create(name='parent', user=self.user)
+        TodoGroup.objects.create(name='child', user=self.user, parent=parent)
+        few = self.count_queries('/groups/')
+        for i in range(20):
+            child = TodoGroup.objects.create(name=f'child {i}', user=self.user, parent=parent)
+            parent.childs.add(child)
+        make_todos(self.user, 20, parent)
+        many = self.count_queries('/groups/')
+        self.assertEqual(few, many)
+
+
+    def test_group_delete_queries_do_not_grow_with_todos(self):
+        counts = []
+        for size in (2, 20):
+            group = TodoGroupService.create(name=f'group {size}', childs=[], todos=[], user=self.user)
+            make_todos(self.user, size, group)
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.delete(f'/groups/{group.id}/')
+            self.assertEqual(response.status_code, 204)
+            counts.append(len(context.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(Tombstone.objects.filter(kind=Tombstone.TODO).count(), 22)
+        self.assertEqual(stats.rebuild(self.user), 0)
+
+class TodoPaginationTest(APITestCase):
+    def test_cursor_walks_every_todo_once(self):
+        make_todos(self.user, 7, subtasks=0)
+        ids, url = [], '/todos/?limit=3'
+        while url:
+            page = self.client.get(url).json()
+            ids += [todo['id'] for todo in page['results']]
+            url = f"/todos/?limit=3&cursor={page['next']}" if page['next'] else None
+        self.assertEqual(sorted(ids), list(TodoItem.objects.values_list('id', flat=True).order_by('id')))
+        self.assertEqual(len(ids), len(set(ids)))
+
+    def test_page_queries_do_not_grow_with_todos(self):
+        make_todos(self.user, 5)
+        few = self.count_queries('/todos/?limit=2')
+        make_todos(self.user, 50)
+        many = self.count_queries('/todos/?limit=2')
+        self.assertEqual(few, many)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/todos/?cursor=nonsense')
+        self.assertEqual(response.status_code, 400)
+
+    def test_stream_matches_list(self):
+        make_todos(self.user, 4)
+        listed = self.client.get('/todos/').json()
+        response = self.client.get('/todos/?stream=1')
+        streamed = json.loads(streamed_content(response))
+        self.assertEqual(sorted(listed, key=lambda todo: todo['id']), sorted(streamed, key=lambda todo: todo['id']))
+
+
+class TodoFilterTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.group = TodoGroup.objects.create(name='group', user=self.user)
+        today = datetime.date.today()
+        for delta, checked, group in ((-3, False, None), (-2, True, self.group), (0, False, self.group), (4, False, None)):
+            TodoItem.objects.create(title=f'day {delta}', content='', date=today + datetime.timedelta(days=delta), checked=checked, group=group, user=self.user)
+
+    def titles(self, query):
+        response = self.client.get('/todos/filter/?' + query)
+        self.assertEqual(response.status_code, 200)
+        return sorted(todo['title'] for todo in response.json())
+
+    def test_filters(self):
+        today = datetime.date.today()
+        self.assertEqual(self.titles('date=0'), ['day 0'])
+        self.assertEqual(self.titles('overdue=1'), ['day -3'])
+        self.assertEqual(self.titles('checked=1'), ['day -2'])
+        self.assertEqual(self.titles('checked=0&q=DAY -'), ['day -3'])
+        self.assertEqual(self.titles(f'group={self.group.id}&group=0'), ['day -2', 'day 0'])
+        self.assertEqual(self.titles(f'date_from={today}&date_to={today + datetime.timedelta(days=4)}'), ['day 0', 'day 4'])
+        self.assertEqual(len(self.titles('')), 4)
+
+    @skipUnless(connection.vendor == 'sqlite', 'reads SQLite query plans')
+    def test_filter_combinations_use_an_index(self):
+        today = datetime.date.today()
+        combinations = [
+            {},
+            {'date': 0},
+            {'date_from': today, 'date_to': today},
+            {'overdue': True},
+            {'checked': True},
+            {'date': 0, 'checked': False},
+            {'q': 'day'},
+            {'group': [self.group.id]},
+            {'group': [self.group.id], 'date_from': today},
+            {'group': [self.group.id], 'checked': False, 'q': 'day'},
+        ]
+        for filters in combinations:
+            with self.subTest(filters=filters):
+                plan = todo_filter(self.user, **filters).order_by(*TODO_ORDERING).explain()
+                todo_plan = [line for line in plan.splitlines() if 'todo_todoitem' in line]
+                self.assertTrue(todo_plan)
+                self.assertTrue(all('SEARCH' in line and 'INDEX' in line for line in todo_plan), plan)
+
+
+class GroupTreeTest(APITestCase):
+    def make_chain(self, depth):
+        groups = [None]
+        for i in range(depth):
+            groups.append(TodoGroupService.create(name=str(i), user=self.user, todos=[], childs=[], parent=groups[-1]))
+        return groups[1:]
+
+    def test_ancestors_and_descendants(self):
+        a, b, c = self.make_chain(3)
+        self.assertEqual(grouptree.ancestors(c), [b.id, a.id])
+        self.assertEqual(grouptree.descendants(a), [b.id, c.id])
+        self.assertTrue(grouptree.in_subtree(a, c))
+        self.assertFalse(grouptree.in_subtree(c, a))
+
+    def test_cycle_check_without_paths_is_one_query(self):
+        groups = self.make_chain(100)
+        TodoGroup.objects.update(path='')
+        leaf, root = TodoGroup.objects.get(id=groups[-1].id), TodoGroup.objects.get(id=groups[0].id)
+        with self.assertNumQueries(1):
+            verify = TodoGroupService.verify_group(leaf, root)
+        self.assertFalse(verify['status'])
+
+    @skipUnless(connection.vendor == 'sqlite', 'PostgreSQL cannot index paths over about 2.7KB')
+    def test_cycle_check_with_paths_needs_no_query(self):
+        groups = self.make_chain(1000)
+        with self.assertNumQueries(0):
+            verify = TodoGroupService.verify_group(groups[-1], groups[0])
+        self.assertFalse(verify['status'])
+
+    def test_paths_follow_moves(self):
+        a, b, c = self.make_chain(3)
+        other = TodoGroupService.create(name='other', user=self.user, todos=[], childs=[])
+        TodoGroupService.move_group(a, other, b)
+        c.refresh_from_db()
+        self.assertEqual(c.path, f'/{other.id}/{b.id}/{c.id}/')
+        self.assertEqual(set(grouptree.subtree(other).values_list('id', flat=True)), {other.id, b.id, c.id})
+        self.assertEqual(list(grouptree.subtree(a).values_list('id', flat=True)), [a.id])
+
+    def test_subtree_todos(self):
+        a, b, c = self.make_chain(3)
+        make_todos(self.user, 2, c, subtasks=0)
+        make_todos(self.user, 1, a, subtasks=0)
+        with self.assertNumQueries(1):
+            self.assertEqual(grouptree.subtree_todo_count(a), 3)
+        self.assertEqual(grouptree.subtree_todo_count(b), 2)
+
+    def test_add_and_move_group(self):
+        a, b = self.make_chain(2)
+        other = TodoGroup.objects.create(name='other', user=self.user)
+        self.assertFalse(TodoGroupService.add_group(b, a.id)['status'])
+        self.assertTrue(TodoGroupService.move_group(a, other, b)['status'])
+        b.refresh_from_db()
+        self.assertEqual(b.parent_id, other.id)
+
+    def test_tree_endpoint(self):
+        a, b, c = self.make_chain(3)
+        response = self.client.get('/groups/tree/')
+        self.assertEqual(response.json(), [
+            {'id': a.id, 'name': '0', 'children': [
+                {'id': b.id, 'name': '1', 'children': [
+                    {'id': c.id, 'name': '2', 'children': []}]}]}])
+
+
+class MembershipTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.group = TodoGroupService.create(name='group', childs=[], todos=[], user=self.user)
+        self.childs = [TodoGroupService.create(name=f'child {i}', childs=[], todos=[], parent=self.group, user=self.user) for i in range(3)]
+        make_todos(self.user, 20, self.group, subtasks=0)
+        self.todos = list(TodoItem.objects.filter(group=self.group).order_by('id').values_list('id', flat=True))
+
+    def save(self, todos, childs, group=None, **fields):
+        group = group or self.group
+        response = self.client.put(f'/groups/{group.id}/', {'name': group.name, 'todos': todos, 'childs': childs, **fields}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def group_ids(self, ids):
+        return list(TodoItem.objects.filter(id__in=ids).order_by('id').values_list('group_id', flat=True))
+
+    def test_unchanged_save_writes_no_membership_rows(self):
+        before = dict(TodoItem.objects.values_list('id', 'updated_at'))
+        with CaptureQueriesContext(connection) as context:
+            self.save(self.todos, [child.id for child in self.childs])
+        writes = [query['sql'] for query in context.captured_queries if query['sql'].startswith(('INSERT', 'DELETE', 'UPDATE "todo_todoitem"'))]
+        self.assertEqual(writes, [])
+        self.assertEqual(dict(TodoItem.objects.values_list('id', 'updated_at')), before)
+
+    def test_save_queries(self):
+        # One write of the group row, one notify, and per direction of
+        # todos moved one select, one counter update and one todo update.
+        group = TodoGroupService.create(name='big', childs=[], todos=[], user=self.user)
+        make_todos(self.user, 100, group, subtasks=0)
+        inside = list(TodoItem.objects.filter(group=group).values_list('id', flat=True))
+        make_todos(self.user, 100, subtasks=0)
+        outside = list(TodoItem.objects.filter(group=None).values_list('id', flat=True))
+
+        for todos, queries in ((inside, 7), (outside, 17)):
+            with mock.patch('todo.services.bump_version') as bump, self.assertNumQueries(queries):
+                self.save(todos, [], group=group)
+            bump.assert_called_once_with(self.user.id)
+        self.assertEqual(self.group_ids(outside), [group.id] * 100)
+        self.assertEqual(self.group_ids(inside), [None] * 100)
+        self.assertEqual(stats.rebuild(self.user), 0)
+
+    def test_save_moves_only_the_difference(self):
+        other = TodoGroupService.create(name='other', childs=[], todos=[], user=self.user)
+        make_todos(self.user, 2, other, subtasks=0)
+        moved = list(TodoItem.objects.filter(group=other).values_list('id', flat=True))
+        self.save(self.todos[1:] + moved[:1], [self.childs[0].id])
+
+        self.assertEqual(self.group_ids(self.todos[:1] + moved), [None, self.group.id, other.id])
+        self.assertEqual(sorted(self.client.get(f'/groups/{self.group.id}/').json()['todos']), sorted(self.todos[1:] + moved[:1]))
+        self.assertEqual(list(self.group.childs.values_list('id', flat=True)), [self.childs[0].id])
+        self.assertEqual([TodoGroup.objects.get(id=child.id).path for child in self.childs[1:]], [f'/{child.id}/' for child in self.childs[1:]])
+        self.assertEqual(stats.rebuild(self.user), 0)
+        self.assertFalse(any(membership.check(self.user).values()))
+
+    def test_save_moves_the_group(self):
+        other = TodoGroupService.create(name='other', childs=[], todos=[], user=self.user)
+        child = self.childs[0]
+        self.save([], [], group=child, name='renamed', parent=other.id)
+        child.refresh_from_db()
+        self.assertEqual((child.name, child.parent_id, child.path), ('renamed', other.id, f'/{other.id}/{child.id}/'))
+        self.assertEqual(list(other.childs.values_list('id', flat=True)), [child.id])
+
+        # A group cannot go under its own child; the rest of the save applies.
+        self.save(self.todos[:1], [child.id], group=other, name='kept', parent=child.id)
+        other.refresh_from_db()
+        self.assertEqual((other.name, other.parent_id, other.path), ('kept', None, f'/{other.id}/'))
+        self.assertEqual(self.group_ids(self.todos[:1]), [other.id])
+
+        self.save([], [], group=child)
+        self.assertEqual(TodoGroup.objects.get(id=child.id).path, f'/{child.id}/')
+        self.assertFalse(any(membership.check(self.user).values()))
+
+    def test_a_todo_and_a_group_have_one_parent(self):
+        other = TodoGroupService.create(name='other', childs=[], todos=[], user=self.user)
+        TodoGroupService.add_todo(other, self.todos[0])
+        self.save(self.todos[:1], [self.childs[0].id], group=other)
+        self.assertEqual(self.group_ids(self.todos[:1]), [other.id])
+        self.assertEqual(sorted(self.group.childs.values_list('id', flat=True)), [child.id for child in self.childs[1:]])
+        self.assertEqual(TodoGroup.objects.get(id=self.childs[0].id).path, f'/{other.id}/{self.childs[0].id}/')
+        self.assertEqual(stats.rebuild(self.user), 0)
+
+        # Other users' todos and groups are left where they are.
+        stranger = User.objects.create_user(username='stranger', password='password')
+        theirs = TodoItemService.create(title='theirs', content='content', date=datetime.date.today(), subtasks=[], user=stranger)
+        their_group = TodoGroupService.create(name='theirs', childs=[], todos=[], user=stranger)
+        self.save([theirs.id], [their_group.id], group=other)
+        self.assertEqual(self.group_ids([theirs.id]), [None])
+        self.assertIsNone(TodoGroup.objects.get(id=their_group.id).parent_id)
+
+    def test_checker(self):
+        Childs = TodoGroup.childs.through
+        stranger = User.objects.create_user(username='stranger', password='password')
+        their_group = TodoGroupService.create(name='theirs', childs=[], todos=[], user=stranger)
+        Childs.objects.filter(to_todogroup=self.childs[0]).delete()
+        Childs.objects.create(from_todogroup=self.childs[1], to_todogroup=self.childs[2])
+        TodoGroup.objects.filter(id=self.childs[1].id).update(path='/wrong/')
+        TodoItem.objects.filter(id=self.todos[0]).update(group=their_group)
+        stats.rebuild(self.user)
+
+        self.assertEqual(membership.check(self.user), {
+            'foreign_todos': [self.todos[0]],
+            'foreign_childs': [],
+            'missing_childs': [self.childs[0].id],
+            'stray_childs': [(self.childs[1].id, self.childs[2].id)],
+            'paths': [self.childs[1].id],
+        })
+        with self.assertRaises(CommandError):
+            call_command('check_membership', stdout=io.StringIO())
+        output = io.StringIO()
+        call_command('check_membership', user=['user'], fix=True, stdout=output)
+        self.assertIn('user: 1 stray childs', output.getvalue())
+        self.assertFalse(any(membership.check(self.user).values()))
+        self.assertEqual(self.group_ids(self.todos[:1]), [None])
+        self.assertEqual(stats.rebuild(self.user), 0)
+        call_command('check_membership', stdout=io.StringIO())
+
+
+class SubtaskOrderingTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        make_todos(self.user, 1, subtasks=5)
+        self.todo = TodoItem.objects.get()
+
+    def contents(self):
+        subtasks = self.client.get(f'/todos/{self.todo.id}/').json()['subtasks']
+        self.assertEqual([subtask['index'] for subtask in subtasks], list(range(len(subtasks))))
+        return [subtask['content'][-1] for subtask in subtasks]
+
+    def subtask(self, content):
+        return Subtask.objects.get(todo=self.todo, content=f'subtask {content}')
+
+    def test_move_writes_one_row(self):
+        subtask = self.subtask(4)
+        with CaptureQueriesContext(connection) as context:
+            SubtaskService.move(subtask, 1)
+        updates = [query for query in context.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.contents(), ['0', '4', '1', '2', '3'])
+
+    def test_move_to_ends(self):
+        SubtaskService.move(self.subtask(2), 0)
+        self.assertEqual(self.contents(), ['2', '0', '1', '3', '4'])
+        SubtaskService.move(self.subtask(0), 4)
+        self.assertEqual(self.contents(), ['2', '1', '3', '4', '0'])
+
+    def test_move_clamps_index_to_ends(self):
+        SubtaskService.move(self.subtask(1), 10)
+        self.assertEqual(self.contents(), ['0', '2', '3', '4', '1'])
+        SubtaskService.move(self.subtask(3), -2)
+        self.assertEqual(self.contents(), ['3', '0', '2', '4', '1'])
+
+        response = self.client.post(f'/subtask/{self.subtask(2).id}/', {'action': 'move', 'content': -1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.contents(), ['2', '3', '0', '4', '1'])
+
+    def test_remove_keeps_index_contiguous(self):
+        SubtaskService.remove(self.subtask(1))
+        self.assertEqual(self.contents(), ['0', '2', '3', '4'])
+
+    def test_renumbers_when_gap_runs_out(self):
+        for _ in range(40):
+            SubtaskService.move(self.subtask(4), 1)
+            SubtaskService.move(self.subtask(3), 1)
+        self.assertEqual(self.contents(), ['0', '3', '4', '1', '2'])
+
+
+class SubtaskSyncTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        make_todos(self.user, 1, subtasks=0)
+        self.todo = TodoItem.objects.get()
+
+    def stored(self):
+        return list(Subtask.objects.filter(todo=self.todo).order_by('position').values_list('content', flat=True))
+
+    def sync_queries(self, contents):
+        with CaptureQueriesContext(connection) as context:
+            SubtaskService.sync(self.todo, contents)
+        self.assertEqual(self.stored(), contents)
+        self.assertEqual(self.todo.subtasks.count(), len(contents))
+        return len(context.captured_queries)
+
+    def test_query_count_does_not_grow_with_subtasks(self):
+        self.assertLessEqual(self.sync_queries([str(i) for i in range(10)]), 10)
+        self.assertLessEqual(self.sync_queries([str(i) for i in range(100, 300)]), 10)
+        self.assertLessEqual(self.sync_queries(['a', 'b']), 10)
+        self.assertEqual(self.sync_queries(['a', 'b']), 3)
+
+    def test_keeps_checked_state_of_unchanged_rows(self):
+        SubtaskService.sync(self.todo, ['a', 'b', 'c'])
+        Subtask.objects.filter(content='a').update(checked=True)
+        SubtaskService.sync(self.todo, ['a', 'x'])
+        self.assertEqual(list(Subtask.objects.order_by('position').values_list('content', 'checked')), [('a', True), ('x', False)])
+
+    def test_rows_follow_their_content(self):
+        SubtaskService.sync(self.todo, ['a', 'b', 'c'])
+        Subtask.objects.filter(content='a').update(checked=True)
+        ids = dict(Subtask.objects.values_list('content', 'id'))
+
+        with CaptureQueriesContext(connection) as context:
+            SubtaskService.sync(self.todo, ['new', 'a', 'b', 'c'])
+        self.assertFalse(any(query['sql'].startswith('UPDATE') for query in context.captured_queries))
+        rows = list(Subtask.objects.order_by('position').values_list('content', 'checked', 'id'))
+        self.assertEqual([row[:2] for row in rows], [('new', False), ('a', True), ('b', False), ('c', False)])
+        self.assertEqual([row[2] for row in rows[1:]], [ids['a'], ids['b'], ids['c']])
+
+        SubtaskService.sync(self.todo, ['new', 'a', 'c'])
+        rows = list(Subtask.objects.order_by('position').values_list('content', 'checked', 'id'))
+        self.assertEqual([row[:2] for row in rows], [('new', False), ('a', True), ('c', False)])
+        self.assertEqual([row[2] for row in rows[1:]], [ids['a'], ids['c']])
+        self.assertEqual(list(Tombstone.objects.filter(kind=Tombstone.SUBTASK).values_list('object_id', flat=True)), [ids['b']])
+
+        # Reordered rows keep their ids too.
+        SubtaskService.sync(self.todo, ['c', 'new', 'a'])
+        self.assertEqual(list(Subtask.objects.order_by('position').values_list('content', 'checked')), [('c', False), ('new', False), ('a', True)])
+        self.assertEqual(Subtask.objects.get(content='c').id, ids['c'])
+
+    def test_sync_positions(self):
+        gap = Subtask.GAP
+        self.assertEqual(SubtaskService.sync_positions([None, None]), [gap, 2 * gap])
+        self.assertEqual(SubtaskService.sync_positions([None, gap, 2 * gap]), [0, gap, 2 * gap])
+        self.assertEqual(SubtaskService.sync_positions([gap, None, 2 * gap, None]), [gap, gap + gap // 2, 2 * gap, 3 * gap])
+        self.assertEqual(SubtaskService.sync_positions([3 * gap, gap, 2 * gap]), [3 * gap, 4 * gap, 5 * gap])
+        # No room between two keys: the later one moves.
+        self.assertEqual(SubtaskService.sync_positions([1, None, 2]), [1, 1 + gap, 1 + 2 * gap])
+
+    def test_create_and_update_endpoints(self):
+        group = TodoGroup.objects.create(name='group', user=self.user)
+        todo = {'title': 'new', 'content': 'content', 'created_at': '2024-01-01T00:00:00Z', 'date': '2024-01-02', 'checked': False, 'group': group.id, 'subtasks': ['a', 'b']}
+        self.assertEqual(self.client.post('/todos/', todo, format='json').status_code, 201)
+        created = TodoItem.objects.get(title='new')
+        self.assertEqual(created.group, group)
+        self.assertEqual(list(group.todos.all()), [created])
+
+        todo['subtasks'] = ['b', 'c', 'd']
+        self.assertEqual(self.client.put(f'/todos/{created.id}/', todo, format='json').status_code, 200)
+        subtasks = self.client.get(f'/todos/{created.id}/').json()['subtasks']
+        self.assertEqual([(subtask['index'], subtask['content']) for subtask in subtasks], [(0, 'b'), (1, 'c'), (2, 'd')])
+
+
+class BatchTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        make_todos(self.user, 50, subtasks=1)
+        self.todos = list(TodoItem.objects.order_by('id'))
+
+    def batch(self, actions):
+        return self.client.post('/batch/', {'actions': actions}, format='json')
+
+    def test_check_many_todos_in_constant_queries(self):
+        actions = [{'target': 'todo', 'id': todo.id, 'action': 'check'} for todo in self.todos]
+        with CaptureQueriesContext(connection) as context:
+            response = self.batch(actions)
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(len(context.captured_queries), 10)
+        self.assertEqual(TodoItem.objects.filter(checked=True).count(), 50)
+
+    def test_mixed_actions(self):
+        group = TodoGroup.objects.create(name='group', user=self.user)
+        subtask = Subtask.objects.filter(todo=self.todos[0]).get()
+        response = self.batch([
+            {'target': 'todo', 'id': self.todos[0].id, 'action': 'rename', 'content': 'renamed'},
+            {'target': 'todo', 'id': self.todos[0].id, 'action': 'move', 'content': {'old_group': None, 'new_group': group.id}},
+            {'target': 'subtask', 'id': subtask.id, 'action': 'check'},
+            {'target': 'subtask', 'action': 'create', 'content': {'todo': self.todos[0].id, 'content': 'new'}},
+            {'target': 'group', 'action': 'create', 'content': {'name': 'child', 'childs': [], 'todos': [], 'parent': group.id}},
+            {'target': 'todo', 'id': self.todos[1].id, 'action': 'delete'},
+        ])
+        self.assertEqual(response.status_code, 200, response.json())
+        todo = TodoItem.objects.get(id=self.todos[0].id)
+        self.assertEqual((todo.title, todo.group), ('renamed', group))
+        self.assertTrue(Subtask.objects.get(id=subtask.id).checked)
+        self.assertEqual(todo.subtasks.count(), 2)
+        self.assertEqual(TodoGroup.objects.get(name='child').parent, group)
+        self.assertFalse(TodoItem.objects.filter(id=self.todos[1].id).exists())
+
+    def test_failure_rolls_back_everything(self):
+        other = User.objects.create_user(username='other', password='password')
+        make_todos(other, 1)
+        response = self.batch([
+            {'target': 'todo', 'id': self.todos[0].id, 'action': 'rename', 'content': 'renamed'},
+            {'target': 'todo', 'id': TodoItem.objects.get(user=other).id, 'action': 'check'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([result['status'] for result in response.json()['results']], [True, False])
+        self.assertEqual(TodoItem.objects.get(id=self.todos[0].id).title, 'todo 0')
+
+
+class ResponseCacheTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        make_todos(self.user, 3)
+
+    def test_unchanged_list_is_not_modified_without_queries(self):
+        etag = self.client.get('/todos/')['ETag']
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/todos/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(context.captured_queries), 0)
+
+    def test_repeated_list_is_served_from_cache(self):
+        first = self.client.get('/groups/')
+        self.assertGreater(self.count_queries('/todos/', cached=True), 0)
+        self.assertEqual(self.count_queries('/todos/', cached=True), 0)
+        self.assertEqual(self.client.get('/groups/').json(), first.json())
+
+    def test_service_mutations_invalidate(self):
+        todo = TodoItem.objects.first()
+        etag = self.client.get('/todos/')['ETag']
+        self.client.post(f'/todos/{todo.id}/action/', {'action': 'rename', 'content': 'renamed'}, format='json')
+        response = self.client.get('/todos/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('renamed', [todo['title'] for todo in response.json()])
+
+        subtask = Subtask.objects.filter(todo=todo).first()
+        self.client.post(f'/subtask/{subtask.id}/', {'action': 'check', 'content': ''}, format='json')
+        subtasks = self.client.get('/todos/').json()
+        self.assertTrue(any(s['checked'] for t in subtasks for s in t['subtasks']))
+
+    def test_versions_are_per_user(self):
+        other = User.objects.create_user(username='other', password='password')
+        etag = self.client.get('/todos/')['ETag']
+        make_todos(other, 1)
+        TodoItemService.check(TodoItem.objects.get(user=other))
+        self.assertEqual(self.client.get('/todos/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_versions_are_shared_between_processes(self):
+        self.assertFalse(shared_versions())
+        directory = shared_version_cache(self)
+        self.assertTrue(shared_versions())
+        etag = self.client.get('/todos/')['ETag']
+        subprocess.run(
+            [sys.executable, 'manage.py', 'shell', '-c', f'from todo.caching import bump_version; bump_version({self.user.id})'],
+            cwd=settings.BASE_DIR, env={**os.environ, 'TODO_VERSION_CACHE_DIR': directory}, check=True, capture_output=True,
+        )
+        self.assertEqual(self.client.get('/todos/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class SyncTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        make_todos(self.user, 5, subtasks=2)
+        self.group = TodoGroupService.create(name='group', user=self.user, todos=[], childs=[])
+        self.cursor = self.client.get('/sync/').json()['cursor']
+        TodoItem.objects.update(updated_at=timezone.now() - datetime.timedelta(minutes=1))
+        Subtask.objects.update(updated_at=timezone.now() - datetime.timedelta(minutes=1))
+        TodoGroup.objects.update(updated_at=timezone.now() - datetime.timedelta(minutes=1))
+
+    def sync(self):
+        response = self.client.get('/sync/', {'since': self.cursor})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_initial_sync_returns_everything(self):
+        data = self.client.get('/sync/').json()
+        self.assertEqual(len(data['todos']), 5)
+        self.assertEqual(len(data['groups']), 1)
+
+    def test_returns_only_changes(self):
+        self.assertEqual(self.sync()['todos'], [])
+        todos = list(TodoItem.objects.order_by('id'))
+        TodoItemService.check_many(todos[:2])
+        SubtaskService.check(Subtask.objects.filter(todo=todos[3]).first())
+        # Joining a group changes the todo's own group field too.
+        TodoGroupService.add_todo(self.group, todos[4].id)
+        data = self.sync()
+        self.assertEqual(sorted(todo['id'] for todo in data['todos']), [todos[0].id, todos[1].id, todos[3].id, todos[4].id])
+        self.assertEqual([group['id'] for group in data['groups']], [self.group.id])
+
+    def test_reports_deletes(self):
+        todos = list(TodoItem.objects.order_by('id'))
+        subtask = Subtask.objects.filter(todo=todos[1]).first()
+        subtask_id = subtask.id
+        TodoItemService.delete(todos[0].id)
+        SubtaskService.remove(subtask)
+        TodoGroupService.delete(self.group.id)
+        data = self.sync()
+        self.assertEqual(data['deleted'], {'todo': [todos[0].id], 'group': [self.group.id], 'subtask': [subtask_id]})
+        self.assertEqual([todo['id'] for todo in data['todos']], [todos[1].id])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/sync/', {'since': 'nope'}).status_code, 400)
+
+
+class RecurrenceTest(TestCase):
+    def dates(self, repeat, start, window_start, window_end):
+        return [str(date) for date in recurrence.expand(repeat, datetime.date.fromisoformat(start), datetime.date.fromisoformat(window_start), datetime.date.fromisoformat(window_end))]
+
+    def test_parse(self):
+        self.assertIsNone(recurrence.parse(''))
+        self.assertEqual(recurrence.parse('weekly').freq, 'WEEKLY')
+        self.assertEqual(recurrence.parse('RRULE:FREQ=WEEKLY;BYDAY=FR,MO').byday, (0, 4))
+        for invalid in ('FREQ=HOURLY', 'FREQ=DAILY;INTERVAL=0', 'FREQ=MONTHLY;BYDAY=MO', 'FREQ=DAILY;FOO=1', 'nonsense'):
+            with self.assertRaises(ValueError):
+                recurrence.parse(invalid)
+
+    def test_daily_jumps_to_window(self):
+        self.assertEqual(self.dates('FREQ=DAILY;INTERVAL=3', '2024-01-01', '2024-03-01', '2024-03-07'), ['2024-03-01', '2024-03-04', '2024-03-07'])
+        self.assertEqual(self.dates('FREQ=DAILY;COUNT=3', '2024-01-01', '2024-01-02', '2024-12-31'), ['2024-01-02', '2024-01-03'])
+        self.assertEqual(self.dates('FREQ=DAILY;UNTIL=20240103', '2024-01-01', '2024-01-01', '2024-12-31'), ['2024-01-01', '2024-01-02', '2024-01-03'])
+
+    def test_weekly_by_day(self):
+        # 2024-01-03 is a Wednesday.
+        self.assertEqual(self.dates('FREQ=WEEKLY;BYDAY=MO,WE,FR', '2024-01-03', '2024-01-01', '2024-01-09'), ['2024-01-03', '2024-01-05', '2024-01-08'])
+        self.assertEqual(self.dates('FREQ=WEEKLY;INTERVAL=2;BYDAY=MO;COUNT=3', '2024-01-01', '2024-01-10', '2024-03-01'), ['2024-01-15', '2024-01-29'])
+
+    def test_monthly_and_yearly_skip_missing_days(self):
+        self.assertEqual(self.dates('monthly', '2024-01-31', '2024-01-01', '2024-05-31'), ['2024-01-31', '2024-03-31', '2024-05-31'])
+        self.assertEqual(self.dates('yearly', '2024-02-29', '2024-01-01', '2032-12-31'), ['2024-02-29', '2028-02-29', '2032-02-29'])
+
+
+class RecurringFilterTest(APITestCase):
+    def test_window_returns_virtual_occurrences(self):
+        today = datetime.date.today()
+        TodoItem.objects.create(title='daily', content='', date=today, repeat='daily', checked=True, user=self.user)
+        TodoItem.objects.create(title='once', content='', date=today + datetime.timedelta(days=1), user=self.user)
+        response = self.client.get('/todos/filter/', {'date_from': today, 'date_to': today + datetime.timedelta(days=2)})
+        rows = [(todo['title'], todo['date'], todo['checked'], todo.get('virtual', False)) for todo in response.json()]
+        self.assertEqual(rows, [
+            ('daily', str(today), True, False),
+            ('daily', str(today + datetime.timedelta(days=1)), False, True),
+            ('once', str(today + datetime.timedelta(days=1)), False, False),
+            ('daily', str(today + datetime.timedelta(days=2)), False, True),
+        ])
+        self.assertEqual(len(self.client.get('/todos/filter/', {'date': 5, 'checked': 0}).json()), 1)
+        self.assertEqual(len(self.client.get('/todos/filter/', {'date': 5, 'checked': 1}).json()), 0)
+
+    def test_invalid_repeat_is_rejected(self):
+        todo = {'title': 'new', 'content': 'content', 'created_at': '2024-01-01T00:00:00Z', 'date': '2024-01-02', 'checked': False, 'subtasks': [], 'repeat': 'FREQ=HOURLY'}
+        self.assertEqual(self.client.post('/todos/', todo, format='json').status_code, 400)
+
+
+@test_settings
+class CachedTokenAuthenticationTest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        clear_caches()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_second_request_skips_token_query(self):
+        self.assertEqual(self.client.get('/testuser/').status_code, 200)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get('/testuser/').status_code, 200)
+        self.assertFalse([query for query in context.captured_queries if 'authtoken_token' in query['sql']])
+
+    def test_logout_invalidates(self):
+        self.client.get('/testuser/')
+        self.assertEqual(self.client.post('/logout/').status_code, 200)
+        self.assertEqual(self.client.get('/testuser/').status_code, 401)
+
+    def test_password_change_and_rotation_invalidate(self):
+        self.client.get('/testuser/')
+        self.user.set_password('changed')
+        self.user.save()
+        self.assertIsNone(token_cache.get(self.token.key))
+
+        self.client.get('/testuser/')
+        self.token.delete()
+        Token.objects.create(user=self.user)
+        self.assertEqual(self.client.get('/testuser/').status_code, 401)
+
+    def test_cache_is_bounded_and_expires(self):
+        cache = TokenCache(max_size=2, ttl=60)
+        for key in 'abc':
+            cache.set(key, self.user, None)
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+        expired = TokenCache(max_size=2, ttl=-1)
+        expired.set('a', self.user, None)
+        self.assertIsNone(expired.get('a'))
+
+
+class DatasetTest(TestCase):
+    def test_generated_rows_keep_service_invariants(self):
+        user, = datasets.generate(users=1, todos=50, subtasks=2, groups=10, depth=4, recurring=0.5)
+        groups = {group.id: group for group in TodoGroup.objects.filter(user=user)}
+        for group in groups.values():
+            parent = groups.get(group.parent_id)
+            self.assertEqual(group.path, grouptree.path_for(parent, group.id))
+            self.assertEqual(sorted(group.childs.values_list('id', flat=True)), sorted(child.id for child in groups.values() if child.parent_id == group.id))
+        self.assertGreaterEqual(max(group.path.count('/') - 1 for group in groups.values()), 4)
+
+        self.assertFalse(any(membership.check(user).values()))
+        for todo in TodoItem.objects.filter(user=user).prefetch_related('subtasks'):
+            self.assertEqual({subtask.todo_id for subtask in todo.subtasks.all()} - {todo.id}, set())
+            self.assertEqual(todo.subtasks.count(), Subtask.objects.filter(todo=todo).count())
+        for todo in TodoItem.objects.filter(user=user).exclude(repeat=''):
+            recurrence.parse(todo.repeat)
+
+    def test_command_refuses_to_mix_datasets(self):
+        call_command('generate_dataset', users=1, todos=1, groups=1, prefix='gen', stdout=io.StringIO())
+        with self.assertRaises(CommandError):
+            call_command('generate_dataset', users=1, todos=1, groups=1, prefix='gen', stdout=io.StringIO())
+        call_command('generate_dataset', users=2, todos=1, groups=1, prefix='gen', clear=True, stdout=io.StringIO())
+        self.assertEqual(User.objects.filter(username__startswith='gen').count(), 2)
+
+
+class StatsTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.parent = TodoGroupService.create(name='parent', childs=[], todos=[], user=self.user)
+        self.child = TodoGroupService.create(name='child', childs=[], todos=[], user=self.user, parent=self.parent)
+        self.today = datetime.date.today()
+
+    def create(self, group=None, date=None):
+        return TodoItemService.create(title='todo', content='content', date=date or self.today, group=group, subtasks=[], user=self.user)
+
+    def stats(self, url='/stats/'):
+        get_cache().clear()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        data['groups'] = {group['name']: group for group in data['groups']}
+        return data
+
+    def counts(self, row, prefix=''):
+        return row[prefix + 'pending'], row[prefix + 'completed']
+
+    def test_counters_follow_service_writes(self):
+        todo = self.create(self.child)
+        other = self.create(self.parent)
+        self.create()
+        TodoItemService.check(todo)
+        TodoItemService.check(todo)
+        data = self.stats()
+        self.assertEqual(self.counts(data['total']), (2, 1))
+        self.assertEqual(self.counts(data['ungrouped']), (1, 0))
+        self.assertEqual(self.counts(data['groups']['child']), (0, 1))
+        self.assertEqual(self.counts(data['groups']['parent']), (1, 0))
+        self.assertEqual(self.counts(data['groups']['parent'], 'total_'), (1, 1))
+
+        TodoItemService.move_todo(self.child.id, None, todo.id)
+        TodoItemService.uncheck(TodoItem.objects.get(id=todo.id))
+        TodoItemService.update(other.id, date=self.today + datetime.timedelta(days=1), checked=True, subtasks=[])
+        data = self.stats()
+        self.assertEqual(self.counts(data['ungrouped']), (2, 0))
+        self.assertEqual(self.counts(data['groups']['parent'], 'total_'), (0, 1))
+        self.assertEqual([day['date'] for day in data['days']], [self.today.isoformat(), (self.today + datetime.timedelta(days=1)).isoformat()])
+
+        TodoItemService.delete(other.id)
+        self.assertEqual(stats.rebuild(self.user), 0)
+
+    def test_batch_check_and_group_delete(self):
+        todos = [self.create(self.child) for _ in range(5)]
+        TodoItemService.check_many(todos[:3])
+        TodoItemService.check_many(todos[:4])
+        self.assertEqual(self.counts(self.stats()['groups']['child']), (1, 4))
+        TodoGroupService.delete(self.parent.id)
+        data = self.stats()
+        self.assertEqual(self.counts(data['total']), (0, 0))
+        self.assertEqual(data['groups'], {})
+        self.assertEqual(stats.rebuild(self.user), 0)
+
+    def test_date_range(self):
+        self.create(date=self.today - datetime.timedelta(days=3))
+        self.create()
+        data = self.stats(f'/stats/?date_from={self.today}')
+        self.assertEqual([day['date'] for day in data['days']], [self.today.isoformat()])
+        self.assertEqual(self.counts(data['total']), (2, 0))
+        self.assertEqual(self.client.get('/stats/?date_from=nope').status_code, 400)
+
+    def test_queries_do_not_grow_with_todos(self):
+        self.create(self.child)
+        few = self.count_queries('/stats/')
+        for _ in range(30):
+            self.create(self.child)
+        self.assertEqual(self.count_queries('/stats/'), few)
+
+    def test_rebuild_repairs_drift(self):
+        etag = self.client.get('/stats/')['ETag']
+        for _ in range(3):
+            TodoItem.objects.create(title='todo', content='content', date=self.today, group=self.child, user=self.user)
+        output = io.StringIO()
+        call_command('rebuild_stats', user=['user'], stdout=output)
+        self.assertIn('2 counter rows fixed', output.getvalue())
+        self.assertEqual(self.client.get('/stats/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.counts(self.stats()['groups']['parent'], 'total_'), (3, 0))
+        with self.assertRaises(CommandError):
+            call_command('rebuild_stats', user=['nobody'], stdout=io.StringIO())
+
+
+class SearchTest(APITestCase):
+    def create(self, title, content='notes', subtasks=()):
+        return TodoItemService.create(title=title, content=content, date=datetime.date.today(), subtasks=list(subtasks), user=self.user)
+
+    def search(self, query, **params):
+        get_cache().clear()
+        response = self.client.get('/todos/search/', dict(params, q=query))
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def titles(self, query):
+        return [todo['title'] for todo in self.search(query)['results']]
+
+    def test_ranks_title_matches_first(self):
+        self.create('call the plumber', 'about the sink')
+        self.create('groceries', 'plumber tape', ['milk'])
+        self.create('weekend', 'later', ['phone plumber'])
+        self.create('unrelated')
+        self.assertEqual(self.titles('plumber'), ['call the plumber', 'groceries', 'weekend'])
+        self.assertEqual(self.titles('PLUMB'), ['call the plumber', 'groceries', 'weekend'])
+        self.assertEqual(self.titles('plumber milk'), ['groceries'])
+        self.assertEqual(self.titles('"plumber" -(*'), ['call the plumber', 'groceries', 'weekend'])
+        self.assertEqual(self.titles('!!'), [])
+
+    def test_index_follows_services(self):
+        todo = self.create('draft', subtasks=['alpha'])
+        TodoItemService.rename(todo, 'final')
+        self.assertEqual(self.titles('draft'), [])
+        self.assertEqual(self.titles('final alpha'), ['final'])
+
+        TodoItemService.add_subtask(todo, 'bravo')
+        subtask = Subtask.objects.get(todo=todo, content='alpha')
+        SubtaskService.rename(subtask, 'charlie')
+        self.assertEqual(self.titles('bravo charlie'), ['final'])
+        SubtaskService.remove(Subtask.objects.get(todo=todo, content='bravo'))
+        self.assertEqual(self.titles('bravo'), [])
+
+        TodoItemService.update(todo.id, title='updated', content='delta', subtasks=['echo'])
+        self.assertEqual(self.titles('updated delta echo'), ['updated'])
+        TodoItemService.delete(todo.id)
+        self.assertEqual(self.titles('updated'), [])
+
+    def test_is_per_user_and_paginated(self):
+        other = User.objects.create_user(username='other', password='password')
+        TodoItemService.create(title='report', content='notes', date=datetime.date.today(), subtasks=[], user=other)
+        for i in range(5):
+            self.create(f'report {i}')
+        first = self.search('report', limit=3)
+        second = self.search('report', limit=3, cursor=first['next'])
+        self.assertEqual(len(first['results']), 3)
+        self.assertEqual(len(second['results']), 2)
+        self.assertIsNone(second['next'])
+        ids = [todo['id'] for todo in first['results'] + second['results']]
+        self.assertEqual(sorted(ids), sorted(TodoItem.objects.filter(user=self.user).values_list('id', flat=True)))
+
+        other.delete()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM todo_search')
+            self.assertEqual(cursor.fetchone()[0], 5)
+        self.assertEqual(self.client.get('/todos/search/', {'q': 'report', 'cursor': 'nope'}).status_code, 400)
+        self.assertEqual(self.client.get('/todos/search/').status_code, 400)
+
+    def test_generated_datasets_are_indexed(self):
+        user, = datasets.generate(users=1, todos=20, groups=2, depth=1, prefix='search')
+        word = TodoItem.objects.filter(user=user).first().title.split()[0]
+        self.assertEqual(
+            len(search.search(user, word, limit=100)),
+            TodoItem.objects.filter(user=user).filter(Q(title__contains=word) | Q(content__contains=word) | Q(subtasks__content__contains=word)).distinct().count(),
+        )
+
+
+class CompactSerializerTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        parent = TodoGroupService.create(name='h\u00f6me "quoted"', childs=[], todos=[], user=self.user)
+        child = TodoGroupService.create(name='child', childs=[], todos=[], user=self.user, parent=parent)
+        today = datetime.date.today()
+        TodoItemService.create(title='plain', content='x', date=today, subtasks=[], user=self.user)
+        TodoItemService.create(title='caf\u00e9 \u2028 \u2029 \U0001f600', content='tab\tnew\nline\x01 back\\slash "q" </script>', date=today, subtasks=['a', 'b\u2028', ''], group=child, user=self.user, repeat='weekly')
+        todo = TodoItemService.create(title='checked', content='y', date=today - datetime.timedelta(days=400), subtasks=['one', 'two', 'three'], group=parent, user=self.user)
+        TodoItemService.check(todo)
+        SubtaskService.move(Subtask.objects.get(todo=todo, content='three'), 0)
+        make_todos(self.user, 5, child)
+
+    def reference(self, queryset, serializer_class):
+        return JSONRenderer().render(serializer_class(queryset, many=True).data)
+
+    def test_rows_match_serializers(self):
+        todos = todo_list(self.user).order_by(*TODO_ORDERING)
+        groups = group_list(self.user).order_by(*GROUP_ORDERING)
+        expected_todos = self.reference(todos, TodoOutputSerializer)
+        expected_groups = self.reference(groups, GroupOutputSerializer)
+        self.assertEqual(compact.dumps(compact.CompactTodoSerializer.rows(todos)), expected_todos)
+        self.assertEqual(compact.dumps(compact.CompactGroupSerializer.rows(groups)), expected_groups)
+        with mock.patch.object(compact, 'orjson', None):
+            self.assertEqual(compact.dumps(compact.CompactTodoSerializer.rows(todos)), expected_todos)
+
+    def test_dumps_matches_renderer(self):
+        values = [
+            True, 0, -2 ** 63, 2 ** 70, 'a\u2028b', {'nested': [{'x': ErrorDetail('bad', code='invalid')}]},
+            {1: 'int key'}, [datetime.date(2024, 1, 2), datetime.datetime(2024, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc)],
+        ]
+        for value in values:
+            self.assertEqual(compact.dumps(value), JSONRenderer().render(value), value)
+
+    def test_endpoints_match_serializers(self):
+        self.assertEqual(self.client.get('/todos/').content, self.reference(todo_list(self.user), TodoOutputSerializer))
+        self.assertEqual(self.client.get('/groups/').content, self.reference(group_list(self.user), GroupOutputSerializer))
+        todos = todo_list(self.user).order_by(*TODO_ORDERING)
+        self.assertEqual(streamed_content(self.client.get('/todos/?stream=1')), self.reference(todos, TodoOutputSerializer))
+
+        first = self.client.get('/todos/?limit=3').json()
+        second = self.client.get(f'/todos/?limit=3&cursor={first["next"]}').json()
+        self.assertEqual(first['results'] + second['results'], json.loads(self.reference(todos[:6], TodoOutputSerializer)))
+
+    def test_queries_do_not_grow_with_rows(self):
+        few = self.count_queries('/todos/')
+        make_todos(self.user, 30)
+        self.assertEqual(self.count_queries('/todos/'), few)
+
+
+class TransferTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user(username='other', password='password')
+        parent = TodoGroupService.create(name='parent', childs=[], todos=[], user=self.user)
+        child = TodoGroupService.create(name='child', childs=[], todos=[], user=self.user, parent=parent)
+        today = datetime.date.today()
+        TodoItemService.create(title='plain', content='a, "quoted"\nline', date=today, subtasks=['one', 'two'], user=self.user)
+        TodoItemService.create(title='grouped', content='content', date=today, group=child, repeat='weekly', subtasks=[], user=self.user)
+        todo = TodoItemService.create(title='done', content='content', date=today, group=parent, subtasks=['three'], user=self.user)
+        TodoItemService.check(todo)
+        SubtaskService.check(Subtask.objects.get(content='three'))
+
+    def snapshot(self, user):
+        groups = {
+            group.name: group.parent.name if group.parent else None
+            for group in TodoGroup.objects.filter(user=user).select_related('parent')
+        }
+        todos = sorted(
+            (todo.title, todo.content, todo.date, todo.checked, todo.repeat, todo.group.name if todo.group else None,
+             [(subtask.content, subtask.checked) for subtask in Subtask.objects.filter(todo=todo).order_by('position')])
+            for todo in TodoItem.objects.filter(user=user).select_related('group')
+        )
+        return groups, todos
+
+    def export(self, format):
+        response = self.client.get('/export/', {'format': format})
+        self.assertEqual(response.status_code, 200)
+        return streamed_content(response)
+
+    def test_round_trip_through_the_api(self):
+        for format, content_type in (('jsonl', 'application/x-ndjson'), ('csv', 'text/csv')):
+            with self.subTest(format=format):
+                body = self.export(format)
+                client = APIClient()
+                client.force_authenticate(self.other)
+                response = client.post('/import/', body, content_type=content_type)
+                self.assertEqual(response.status_code, 201, response.content)
+                self.assertEqual(response.json(), {'groups': 2, 'todos': 3, 'subtasks': 3})
+                self.assertEqual(self.snapshot(self.other), self.snapshot(self.user))
+
+                # The same invariants the services keep.
+                self.assertEqual(stats.rebuild(self.other), 0)
+                self.assertEqual(len(search.search(self.other, 'quoted')), 1)
+                child = TodoGroup.objects.get(user=self.other, name='child')
+                self.assertEqual(child.path, grouptree.path_for(child.parent, child.id))
+                self.assertEqual(list(child.parent.childs.all()), [child])
+                self.assertEqual(list(child.todos.values_list('title', flat=True)), ['grouped'])
+                TodoItem.objects.filter(user=self.other).delete()
+                TodoGroup.objects.filter(user=self.other).delete()
+
+    def test_commands(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        path = f'{directory}/todos.csv'
+        call_command('export_todos', 'user', output=path)
+        self.assertTrue(open(path).read().startswith('type,id,parent,title'))
+        client = APIClient()
+        client.force_authenticate(self.other)
+        etag = client.get('/todos/')['ETag']
+        output = io.StringIO()
+        call_command('import_todos', 'other', path, batch_size=2, stdout=output, stderr=io.StringIO())
+        self.assertIn('Imported 3 todos, 3 subtasks and 2 groups', output.getvalue())
+        self.assertEqual(self.snapshot(self.other), self.snapshot(self.user))
+        response = client.get('/todos/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, len(response.json())), (200, 3))
+
+        output = io.StringIO()
+        call_command('export_todos', 'user', stdout=output)
+        self.assertEqual(len(output.getvalue().splitlines()), 5)
+        with self.assertRaises(CommandError):
+            call_command('export_todos', 'nobody', stdout=io.StringIO())
+
+    def test_errors_keep_earlier_batches(self):
+        lines = [json.dumps({'type': 'todo', 'title': f'todo {i}', 'content': 'content', 'date': '2024-01-01'}) for i in range(3)]
+        lines.append(json.dumps({'type': 'todo', 'title': 'bad', 'content': 'content', 'date': 'someday'}))
+        progress = []
+        importer = transfer.Importer(self.other, batch_size=2, progress=lambda counts: progress.append(counts['todos']))
+        with self.assertRaises(transfer.TransferError) as context:
+            importer.run(transfer.read(lines))
+        self.assertEqual(context.exception.line, 4)
+        self.assertEqual(progress, [2])
+        self.assertEqual(TodoItem.objects.filter(user=self.other).count(), 2)
+
+        response = self.client.post('/import/', '{"type": "todo", "group": 5, "title": "t", "content": "c", "date": "2024-01-01"}', content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['line'], 1)
+        self.assertEqual(self.client.post('/import/', 'id,title\n', content_type='text/csv').status_code, 400)
+        response = self.client.post('/import/?format=jsonl', '{"type": "todo", "title": "t", "content": "c", "date": "2024-01-01"}', content_type='text/plain')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.client.get('/export/', {'format': 'xml'}).status_code, 400)
+
+    def test_malformed_subtasks(self):
+        good = json.dumps({'type': 'todo', 'title': 't', 'content': 'c', 'date': '2024-01-01'})
+        for subtasks in ([1], [['a']], [None], [{'checked': True}]):
+            with self.subTest(subtasks=subtasks):
+                bad = json.dumps({'type': 'todo', 'title': 't', 'content': 'c', 'date': '2024-01-01', 'subtasks': subtasks})
+                response = self.client.post('/import/', f'{good}\n{bad}\n', content_type='application/x-ndjson')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['line'], 2)
+
+        bad = json.dumps({'type': 'todo', 'title': 't', 'content': 'c', 'date': '2024-01-01', 'repeat': 1})
+        self.assertEqual(self.client.post('/import/', bad, content_type='application/x-ndjson').json()['error'], 'Invalid repeat')
+
+    def test_malformed_input(self):
+        good = json.dumps({'type': 'todo', 'title': 't', 'content': 'c', 'date': '2024-01-01'}).encode()
+        response = self.client.post('/import/', good + b'\n' + b'{"title": "\xff"}\n', content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Invalid UTF-8', 'line': 2, 'imported': {'groups': 0, 'todos': 0, 'subtasks': 0}})
+
+        header = 'type,id,parent,title,content,date,checked,repeat\n'
+        for row in ('todo,1,,t,' + 'x' * 200000 + ',2024-01-01,,\n', 'todo,1,,t,a\rb,2024-01-01,,\n'):
+            response = self.client.post('/import/', header + row, content_type='text/csv')
+            self.assertEqual(response.status_code, 400)
+            self.assertTrue(response.json()['error'].startswith('Invalid CSV'))
+            self.assertEqual(response.json()['line'], 2)
+
+    def test_queries_per_batch_do_not_grow_with_todos(self):
+        def count(todos):
+            lines = [
+                json.dumps({'type': 'todo', 'title': 'todo', 'content': 'content', 'date': '2024-01-01', 'subtasks': ['a', 'b']})
+                for _ in range(todos)
+            ]
+            with CaptureQueriesContext(connection) as context:
+                transfer.import_records(self.other, lines)
+            return len(context.captured_queries)
+        count(1)
+        self.assertEqual(count(5), count(50))
+
+
+class ArchiveTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.group = TodoGroupService.create(name='group', childs=[], todos=[], user=self.user)
+        self.today = datetime.date.today()
+
+    def create(self, title, days_ago=200, checked=True, repeat='', group=None, subtasks=()):
+        todo = TodoItemService.create(
+            title=title, content='content', date=self.today, repeat=repeat, group=group, subtasks=list(subtasks), user=self.user,
+        )
+        if checked:
+            TodoItemService.check(todo)
+        # Backdated behind the services' back, so the counters are rebuilt.
+        TodoItem.objects.filter(id=todo.id).update(
+            date=self.today - datetime.timedelta(days=days_ago), updated_at=timezone.now() - datetime.timedelta(days=days_ago),
+        )
+        stats.rebuild(self.user)
+        return todo
+
+    def get(self, url):
+        get_cache().clear()
+        response = self.client.get(url)
+        if response.streaming:
+            self.assertEqual(response.status_code, 200)
+            return streamed_content(response)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_moves_old_checked_todos_out_of_default_reads(self):
+        old = self.create('old', group=self.group, subtasks=['a', 'b'])
+        kept = [self.create('pending', checked=False), self.create('recurring', repeat='weekly'), self.create('recent', days_ago=10)]
+        before = {todo['id']: todo for todo in self.get('/todos/')}
+        cursor = self.get('/sync/')['cursor']
+
+        self.assertEqual(archive.archive(), 1)
+        self.assertEqual(list(ArchivedTodo.objects.values_list('id', flat=True)), [old.id])
+        self.assertEqual(list(ArchivedSubtask.objects.order_by('position').values_list('content', flat=True)), ['a', 'b'])
+        self.assertFalse(Subtask.objects.filter(todo_id=old.id).exists())
+        self.assertEqual(sorted(todo['id'] for todo in self.get('/todos/')), sorted(todo.id for todo in kept))
+        self.assertEqual(self.get(f'/groups/{self.group.id}/')['todos'], [])
+        self.assertEqual(search.search(self.user, 'old'), [])
+        self.assertEqual(self.get(f'/sync/?since={cursor}')['deleted']['todo'], [old.id])
+        self.assertEqual(stats.rebuild(self.user), 0)
+
+        # The archived row reads back exactly as the todo did.
+        merged = {todo['id']: todo for todo in self.get('/todos/filter/?include_archived=true')}
+        self.assertEqual(merged, before)
+        self.assertEqual(archive.archive(), 0)
+
+        TodoGroupService.delete(self.group.id)
+        self.assertFalse(ArchivedTodo.objects.exists())
+        self.assertFalse(ArchivedSubtask.objects.exists())
+
+    def test_detail_of_an_archived_todo(self):
+        old = self.create('old', subtasks=['a', 'b'])
+        before = self.get(f'/todos/{old.id}/')
+        archive.archive()
+
+        self.assertEqual(self.get(f'/todos/{old.id}/'), before)
+        body = {'title': 'new', 'content': 'content', 'date': str(self.today), 'checked': False, 'subtasks': []}
+        self.assertEqual(self.client.put(f'/todos/{old.id}/', body, format='json').status_code, 404)
+        self.assertEqual(self.client.post(f'/todos/{old.id}/', {'content': 'c'}, format='json').status_code, 404)
+        self.assertEqual(self.client.post(f'/todos/{old.id}/action/', {'action': 'uncheck'}, format='json').status_code, 404)
+        self.assertEqual(self.client.post(f'/subtask/{before["subtasks"][0]["id"]}/', {'action': 'check'}, format='json').status_code, 404)
+        self.assertEqual(self.client.delete(f'/todos/{old.id}/').status_code, 404)
+        self.assertTrue(ArchivedTodo.objects.filter(id=old.id).exists())
+        self.assertEqual(self.client.get('/todos/0/').status_code, 404)
+
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user(username='other', password='password'))
+        self.assertEqual(other.get(f'/todos/{old.id}/').status_code, 401)
+
+    def test_include_archived_merges_tiers(self):
+        todos = [self.create(f'todo {i}', days_ago=100 + i % 3, checked=i % 2 == 0, subtasks=['s']) for i in range(6)]
+        archive.archive()
+        self.assertEqual(ArchivedTodo.objects.count(), 3)
+        expected = [todo.id for todo in sorted(todos, key=lambda todo: (self.today - datetime.timedelta(days=100 + int(todo.title[-1]) % 3), todo.id))]
+
+        self.assertEqual([todo['id'] for todo in self.get('/todos/filter/?include_archived=true')], expected)
+        self.assertEqual(len(self.get('/todos/filter/')), 3)
+        self.assertEqual([todo['id'] for todo in json.loads(self.get('/todos/filter/?include_archived=true&stream=1'))], expected)
+
+        ids, url = [], '/todos/filter/?include_archived=true&limit=2'
+        while url:
+            page = self.get(url)
+            ids += [todo['id'] for todo in page['results']]
+            url = page['next'] and f'/todos/filter/?include_archived=true&limit=2&cursor={page["next"]}'
+        self.assertEqual(ids, expected)
+
+        window = f'date_from={self.today - datetime.timedelta(days=101)}&date_to={self.today}'
+        self.assertEqual(len(self.get(f'/todos/filter/?{window}')), 2)
+        self.assertEqual(len(self.get(f'/todos/filter/?{window}&include_archived=true')), 4)
+        archived = set(ArchivedTodo.objects.values_list('id', flat=True))
+        self.assertEqual([todo['id'] for todo in self.get('/todos/filter/?include_archived=true&checked=true')], [id for id in expected if id in archived])
+
+    def test_command(self):
+        for i in range(5):
+            self.create(f'todo {i}')
+        output = io.StringIO()
+        call_command('archive_todos', days=365, stdout=output)
+        self.assertIn('Archived 0 todos', output.getvalue())
+        etag = self.client.get('/todos/')['ETag']
+        output = io.StringIO()
+        call_command('archive_todos', user=['user'], batch_size=2, verbosity=2, stdout=output)
+        self.assertEqual(output.getvalue().splitlines()[:3], ['2 todos archived', '4 todos archived', '5 todos archived'])
+        self.assertEqual(ArchivedTodo.objects.count(), 5)
+        response = self.client.get('/todos/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.json()), (200, []))
+        with self.assertRaises(CommandError):
+            call_command('archive_todos', user=['nobody'], stdout=io.StringIO())
+
+
+@override_settings(TODO_JOB_INLINE_LIMIT=5, TODO_JOB_CHUNK_SIZE=3, TODO_JOB_CHUNK_PAUSE=0)
+class JobTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        # runworker needs versions the web workers share.
+        shared_version_cache(self)
+        self.group = TodoGroupService.create(name='group', childs=[], todos=[], user=self.user)
+        self.child = TodoGroupService.create(name='child', childs=[], todos=[], parent=self.group, user=self.user)
+        make_todos(self.user, 4, self.group, subtasks=1)
+        make_todos(self.user, 4, self.child, subtasks=1)
+        search.index_user(self.user.id)
+
+    def work(self):
+        # Closing connections between jobs would close the test's own,
+        # which is why Django's test client skips it between requests too.
+        with mock.patch('todo.management.commands.runworker.close_old_connections'):
+            call_command('runworker', once=True, stdout=io.StringIO())
+
+    def test_large_delete_runs_on_the_worker(self):
+        other = TodoGroupService.create(name='other', childs=[], todos=[], user=self.user)
+        make_todos(self.user, 2, other, subtasks=1)
+        search.index_user(self.user.id)
+        response = self.client.delete(f'/groups/{self.group.id}/')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Location'], f'/jobs/{response.json()["id"]}/')
+        self.assertEqual(response.json()['status'], Job.QUEUED)
+        self.assertEqual(TodoItem.objects.count(), 10)
+
+        self.work()
+        job = self.client.get(response['Location']).json()
+        self.assertEqual((job['status'], job['done'], job['total']), (Job.DONE, 10, 10))
+        self.assertEqual(list(TodoGroup.objects.values_list('id', flat=True)), [other.id])
+        self.assertEqual(TodoItem.objects.count(), 2)
+        self.assertEqual(Subtask.objects.count(), 2)
+        self.assertEqual(Tombstone.objects.filter(kind=Tombstone.TODO).count(), 8)
+        self.assertEqual(Tombstone.objects.filter(kind=Tombstone.GROUP).count(), 2)
+        self.assertEqual(stats.rebuild(self.user), 0)
+        self.assertEqual(len(search.search(self.user, 'todo')), 2)
+
+        # Running it again finds nothing left to do.
+        self.assertEqual(jobs.run(Job.objects.get(id=job['id'])).status, Job.DONE)
+
+    def test_small_delete_stays_inline(self):
+        response = self.client.delete(f'/groups/{self.child.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(TodoItem.objects.count(), 4)
+
+    def test_deep_delete_runs_on_the_worker(self):
+        # Groups count toward the limit as much as todos do.
+        parent = TodoGroupService.create(name='empty', childs=[], todos=[], user=self.user)
+        for i in range(5):
+            parent = TodoGroupService.create(name=f'empty {i}', childs=[], todos=[], parent=parent, user=self.user)
+        root = TodoGroup.objects.get(name='empty')
+        with self.assertNumQueries(1):
+            self.assertEqual(jobs.delete_size(root), 6)
+        self.assertEqual(jobs.delete_size(self.group), 10)
+        self.assertEqual(self.client.delete(f'/groups/{root.id}/').status_code, 202)
+
+    def test_large_update_runs_on_the_worker(self):
+        todos = list(TodoItem.objects.filter(group=self.child).values_list('id', flat=True))
+        children = [TodoGroupService.create(name=f'new {i}', childs=[], todos=[], user=self.user).id for i in range(4)]
+        response = self.client.put(f'/groups/{self.group.id}/', {'name': 'renamed', 'todos': todos, 'childs': children}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(TodoGroup.objects.get(id=self.group.id).name, 'group')
+
+        self.work()
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+        group = self.client.get(f'/groups/{self.group.id}/').json()
+        self.assertEqual(group['name'], 'renamed')
+        self.assertEqual(sorted(group['todos']), sorted(todos))
+        self.assertEqual(sorted(group['childs']), children)
+        self.assertTrue(all(grouptree.contains(self.group, child) for child in TodoGroup.objects.filter(id__in=children)))
+
+    def test_rebuild(self):
+        TodoItem.objects.filter(group=self.child).update(checked=True)
+        response = self.client.post('/jobs/', {'kind': 'rebuild'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.client.post('/jobs/', {'kind': 'delete_group'}, format='json').status_code, 400)
+
+        self.work()
+        self.assertEqual(stats.rebuild(self.user), 0)
+        self.assertEqual([job['status'] for job in self.client.get('/jobs/').json()], [Job.DONE])
+
+    def test_rebuild_invalidates_cached_stats(self):
+        response = self.client.get('/stats/')
+        etag = response['ETag']
+        self.assertEqual(response.json()['total']['pending'], 8)
+        TodoItem.objects.filter(group=self.child).update(checked=True)
+        self.assertEqual(self.client.get('/stats/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.post('/jobs/', {'kind': 'rebuild'}, format='json')
+        self.work()
+        response = self.client.get('/stats/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total']['pending'], 4)
+
+    def test_worker_needs_shared_versions(self):
+        with override_settings(TODO_VERSION_CACHE='todo'):
+            with self.assertRaises(CommandError):
+                self.work()
+
+    def test_failures_and_stale_jobs(self):
+        failed = jobs.enqueue(self.user, 'unknown')
+        with self.assertLogs('todo.jobs', 'ERROR'):
+            self.work()
+        failed.refresh_from_db()
+        self.assertEqual((failed.status, failed.attempts), (Job.FAILED, 1))
+        self.assertIn('unknown', failed.error)
+
+        job = jobs.enqueue(self.user, jobs.REBUILD)
+        self.assertEqual(jobs.claim().id, job.id)
+        self.assertIsNone(jobs.claim())
+        self.assertEqual(jobs.requeue_stale(), 0)
+        Job.objects.filter(id=job.id).update(updated_at=timezone.now() - datetime.timedelta(hours=1))
+        self.assertEqual(jobs.requeue_stale(), 1)
+        self.assertEqual(jobs.run_next().attempts, 2)
+
+    def test_owner_only(self):
+        job = jobs.enqueue(self.user, jobs.REBUILD)
+        other = User.objects.create_user(username='other', password='password')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(f'/jobs/{job.id}/').status_code, 401)
+        self.assertEqual(self.client.get('/jobs/').json(), [])
+
+
+@override_settings(TODO_METRICS_TOKEN='scrape')
+class MetricsTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.registry = metrics.Registry(100)
+        patcher = mock.patch.object(metrics, 'registry', self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def scrape(self):
+        response = self.client.get('/metrics/', headers={'Authorization': 'Bearer scrape'})
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def series(self, text, name, **labels):
+        prefix = name + metrics.format_labels(tuple(labels.items())) + ' '
+        return [float(line[len(prefix):]) for line in text.splitlines() if line.startswith(prefix)]
+
+    def test_records_route_queries_and_size(self):
+        make_todos(self.user, 3)
+        response = self.client.get('/todos/')
+        text = self.scrape()
+
+        labels = {'route': '/todos/', 'method': 'GET'}
+        self.assertEqual(self.series(text, 'todo_requests_total', **labels, status='200'), [1])
+        self.assertEqual(self.series(text, 'todo_request_queries_count', **labels), [1])
+        self.assertGreater(self.series(text, 'todo_request_queries_sum', **labels)[0], 0)
+        self.assertEqual(self.series(text, 'todo_response_size_bytes_sum', **labels), [len(response.content)])
+        self.assertGreater(self.series(text, 'todo_request_serializer_seconds_total', **labels)[0], 0)
+
+        # Scrapes are cumulative.
+        self.client.get('/todos/')
+        text = self.scrape()
+        self.assertEqual(self.series(text, 'todo_requests_total', **labels, status='200'), [2])
+
+    async def test_counts_queries_under_asgi(self):
+        token = await Token.objects.acreate(user=self.user)
+        await AsyncClient().get('/todos/', headers={'Authorization': f'Token {token.key}'})
+        text = self.registry.export()
+        self.assertGreater(self.series(text, 'todo_request_queries_sum', route='/todos/', method='GET')[0], 0)
+
+    def test_logs_requests_over_the_query_limit(self):
+        with override_settings(TODO_METRICS_MAX_QUERIES=0):
+            with self.assertLogs('todo.metrics', 'WARNING') as logs:
+                self.client.get('/todos/')
+        self.assertIn('GET /todos/ issued', logs.output[0])
+
+    def test_scrapes_need_staff_or_the_token(self):
+        client = APIClient()
+        self.assertEqual(client.get('/metrics/').status_code, 401)
+        self.assertEqual(client.get('/metrics/', headers={'Authorization': 'Bearer wrong'}).status_code, 401)
+        client.force_login(self.user)
+        self.assertEqual(client.get('/metrics/').status_code, 401)
+        User.objects.filter(id=self.user.id).update(is_staff=True)
+        self.assertEqual(client.get('/metrics/').status_code, 200)
+
+        with override_settings(TODO_METRICS_TOKEN=None):
+            self.assertEqual(APIClient().get('/metrics/', headers={'Authorization': 'Bearer '}).status_code, 401)
+
+    def test_overwritten_samples_are_counted(self):
+        registry = metrics.Registry(2)
+        for _ in range(5):
+            sample = metrics.Sample('GET')
+            sample.route, sample.status = '/todos/', 200
+            registry.record(sample)
+        text = registry.export()
+        self.assertEqual(self.series(text, 'todo_requests_total', route='/todos/', method='GET', status='200'), [2])
+        self.assertIn('todo_metrics_dropped_samples_total 3', text)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite profile')
+class SQLiteProfileTest(TransactionTestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_connections_are_tuned(self):
+        # The test database lives in memory, which has no WAL journal.
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        self.assertEqual(self.pragma('synchronous'), 1)
+
+    def test_transactions_take_the_write_lock_up_front(self):
+        with CaptureQueriesContext(connection) as context:
+            with transaction.atomic():
+                User.objects.count()
+        self.assertEqual(context.captured_queries[0]['sql'], 'BEGIN IMMEDIATE')
+
+
+@test_settings
+class ASGIViewTest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        clear_caches()
+        self.user = User.objects.create_user(username='user', password='password')
+        make_todos(self.user, 3)
+        self.todo = TodoItem.objects.first()
+        self.client = AsyncClient()
+        # AsyncClient(headers=...) does not reach the ASGI scope in Django
+        # 5.0, so headers go with each request.
+        self.auth = {'Authorization': f'Token {Token.objects.create(user=self.user).key}'}
+
+    async def test_list_detail_and_filter(self):
+        response = await self.client.get('/todos/', headers=self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 3)
+        self.assertEqual(len(response.json()[0]['subtasks']), 3)
+
+        response = await self.client.get(f'/todos/{self.todo.id}/', headers=self.auth)
+        self.assertEqual(response.json()['id'], self.todo.id)
+
+        response = await self.client.get('/todos/filter/', {'date': 0, 'limit': 2}, headers=self.auth)
+        self.assertEqual(len(response.json()['results']), 2)
+
+    async def test_action_and_revalidation(self):
+        etag = (await self.client.get('/todos/', headers=self.auth))['ETag']
+        response = await self.client.get('/todos/', headers={**self.auth, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        response = await self.client.post(f'/todos/{self.todo.id}/action/', {'action': 'check'}, content_type='application/json', headers=self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue((await TodoItem.objects.aget(id=self.todo.id)).checked)
+        response = await self.client.get('/todos/', headers={**self.auth, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    async def test_authentication(self):
+        response = await self.client.get('/todos/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+        self.assertEqual((await self.client.get('/todos/', headers={'Authorization': 'Token nope'})).status_code, 401)
+
+        other = await User.objects.acreate(username='other')
+        token = await Token.objects.acreate(user=other)
+        response = await self.client.get(f'/todos/{self.todo.id}/', headers={'Authorization': f'Token {token.key}'})
+        self.assertEqual(response.status_code, 401)
+
+    async def test_session_authentication(self):
+        # A request that reads its session takes todo.middleware's thread
+        # hop to save it.
+        await sync_to_async(self.client.force_login)(self.user)
+        response = await self.client.get('/todos/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 3)
+
+    @override_settings(TODO_ASYNC_MAX_ACTIVE=1, TODO_FEED_TIMEOUT=5)
+    async def test_active_slots(self):
+        responses = await asyncio.gather(*(self.client.get(f'/todos/{self.todo.id}/', headers=self.auth) for _ in range(4)))
+        self.assertEqual([response.status_code for response in responses], [200] * 4)
+
+        # A parked long-poll holds no slot.
+        cursor = (await self.client.get('/sync/', headers=self.auth)).json()['cursor']
+        poll = asyncio.ensure_future(self.client.get('/feed/', {'since': cursor}, headers=self.auth))
+        while not feed.bus.count():
+            await asyncio.sleep(0.01)
+        response = await asyncio.wait_for(self.client.get('/todos/', headers=self.auth), 2)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(poll.done())
+        poll.cancel()
+
+
+@test_settings
+class FeedTest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        clear_caches()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client = AsyncClient()
+        self.auth = {'Authorization': f'Token {Token.objects.create(user=self.user).key}'}
+
+    def create(self, title):
+        # TestCase never commits, so the publish is run by hand.
+        with self.captureOnCommitCallbacks(execute=True):
+            return TodoItemService.create(title=title, content='content', date=datetime.date.today(), subtasks=[], user=self.user)
+
+    async def cursor(self):
+        return (await self.client.get('/sync/', headers=self.auth)).json()['cursor']
+
+    async def test_bus_wakes_subscribers_from_other_threads(self):
+        subscription = feed.bus.subscribe(self.user.id)
+        self.assertFalse(await subscription.wait(0.01))
+        threading.Thread(target=feed.bus.publish, args=(self.user.id,)).start()
+        self.assertTrue(await subscription.wait(5))
+        feed.bus.unsubscribe(subscription)
+        self.assertEqual(feed.bus.count(), 0)
+
+    async def test_long_poll_answers_on_commit(self):
+        cursor = await self.cursor()
+        poll = asyncio.ensure_future(self.client.get('/feed/', {'since': cursor}, headers=self.auth))
+        while not feed.bus.count():
+            await asyncio.sleep(0.01)
+        self.assertFalse(poll.done())
+
+        await sync_to_async(self.create)('pushed')
+        response = await asyncio.wait_for(poll, 5)
+        self.assertEqual([todo['title'] for todo in response.json()['todos']], ['pushed'])
+        self.assertEqual(feed.bus.count(), 0)
+
+    async def test_long_poll_returns_pending_changes_and_times_out(self):
+        cursor = await self.cursor()
+        await asyncio.sleep(0.01)
+        await sync_to_async(self.create)('missed')
+        response = await self.client.get('/feed/', {'since': cursor}, headers=self.auth)
+        self.assertEqual([todo['title'] for todo in response.json()['todos']], ['missed'])
+
+        with override_settings(TODO_FEED_TIMEOUT=0.05):
+            response = await self.client.get('/feed/', {'since': await self.cursor()}, headers=self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((await self.client.get('/feed/', {'since': 'nope'}, headers=self.auth)).status_code, 400)
+
+    async def test_server_sent_events(self):
+        await sync_to_async(self.create)('first')
+        with override_settings(TODO_FEED_HEARTBEAT=0.05):
+            response = await self.client.get('/feed/', headers={**self.auth, 'Accept': 'text/event-stream'})
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            events = response.streaming_content
+
+            first = await events.__anext__()
+            self.assertTrue(first.startswith(b'id: '))
+            self.assertIn(b'event: changes\ndata: ', first)
+            payload = json.loads(first.split(b'data: ', 1)[1])
+            self.assertEqual([todo['title'] for todo in payload['todos']], ['first'])
+            self.assertEqual(first.split(b'\n', 1)[0], b'id: ' + payload['cursor'].encode())
+
+            self.assertEqual(await events.__anext__(), b': keepalive\n\n')
+            await sync_to_async(self.create)('second')
+            second = await events.__anext__()
+            self.assertIn(b'"second"', second)
+
+            # A disconnect cancels the task reading the stream.
+            reading = asyncio.ensure_future(events.__anext__())
+            await asyncio.sleep(0.01)
+            reading.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await reading
+        self.assertEqual(feed.bus.count(), 0)
+
+
+@test_settings
+class AuthViewTest(TestCase):
+    def test_register_then_login(self):
+        client = APIClient()
+        response = client.post('/register/', {'username': 'new', 'email': 'new@example.com', 'password': 'secret'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('password', response.json()['user'])
+        user = User.objects.get(username='new')
+        self.assertTrue(user.check_password('secret'))
+
+        response = client.post('/login/', {'username': 'new', 'password': 'secret'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['token'], Token.objects.get(user=user).key)
+        self.assertEqual(client.post('/login/', {'username': 'new', 'password': 'wrong'}, format='json').status_code, 400)
+        self.assertEqual(client.post('/login/', {'username': 'missing', 'password': 'wrong'}).status_code, 404)
+
+    def test_register_is_one_user_write(self):
+        with CaptureQueriesContext(connection) as context:
+            APIClient().post('/register/', {'username': 'new', 'password': 'secret'}, format='json')
+        writes = [query for query in context.captured_queries if 'auth_user' in query['sql'] and not query['sql'].startswith('SELECT')]
+        self.assertEqual(len(writes), 1)
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.PBKDF2PasswordHasher', 'django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_login_upgrades_an_outdated_hash(self):
+        user = User.objects.create(username='old', password=make_password('secret', hasher='md5'))
+        self.assertEqual(APIClient().post('/login/', {'username': 'old', 'password': 'secret'}, format='json').status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+        self.assertTrue(user.check_password('secret'))
+
+    def test_hash_storm_is_turned_away(self):
+        User.objects.create_user(username='user', password='password')
+        with mock.patch.object(hashing, 'slots', threading.BoundedSemaphore(1)):
+            hashing.slots.acquire()
+            response = APIClient().post('/login/', {'username': 'user', 'password': 'password'}, format='json')
+        self.assertEqual(response.status_code, 429)
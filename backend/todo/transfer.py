@@ -0,0 +1,390 @@
+import csv
+import datetime
+import io
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+
+from .models import TodoItem, TodoGroup, Subtask, ArchivedTodo
+from .compact import CompactTodoSerializer, CompactArchivedTodoSerializer, dumps
+from .services import notify
+from . import grouptree, recurrence, search, stats
+
+
+# Bulk export and import of a user's groups, todos and subtasks, behind
+# /export/, /import/ and the export_todos/import_todos commands.
+#
+# JSONL has one record per line: groups first, parents before children,
+# then todos with their subtasks nested. CSV flattens the same records
+# into COLUMNS, with each todo's subtasks on the rows right after it and
+# the name of a group in the title column. Ids are those of the source;
+# an import maps them to new rows, so a file can be loaded into any
+# account, any number of times. created_at is exported for reference but
+# set to the time of the import, as it is for todos created through the API.
+#
+# Both directions run in bounded memory: exports stream from server-side
+# cursors and imports write BATCH_SIZE todos per transaction, keeping only
+# the map of group ids across batches.
+
+JSONL = 'jsonl'
+CSV = 'csv'
+FORMATS = (JSONL, CSV)
+CONTENT_TYPES = {JSONL: 'application/x-ndjson', CSV: 'text/csv'}
+COLUMNS = ['type', 'id', 'parent', 'title', 'content', 'date', 'checked', 'repeat', 'created_at']
+
+BATCH_SIZE = 1000
+
+
+class TransferError(ValueError):
+    def __init__(self, message, line=None):
+        super().__init__(message)
+        self.line = line
+
+
+def format_for(name, default=JSONL):
+    # From a ?format= value, a file name or a content type.
+    name = (name or '').lower()
+    if name == CSV or name.endswith('.csv') or name.startswith('text/csv'):
+        return CSV
+    if name == JSONL or name.endswith('.jsonl') or name.endswith('ndjson'):
+        return JSONL
+    return default
+
+
+# Export
+
+def group_records(user):
+    groups = TodoGroup.objects.filter(user=user).order_by('path', 'id').values_list('id', 'name', 'parent_id')
+    for id, name, parent_id in groups.iterator(chunk_size=BATCH_SIZE):
+        yield {'type': 'group', 'id': id, 'name': name, 'parent': parent_id}
+
+def todo_records(user):
+    # Archived todos too: an export is the user's whole data, and imported
+    # ones are archived again by the next run if they still qualify.
+    tiers = [(TodoItem, CompactTodoSerializer), (ArchivedTodo, CompactArchivedTodoSerializer)]
+    for model, serializer_class in tiers:
+        yield from todo_tier(model.objects.filter(user=user).order_by('id'), serializer_class)
+
+def todo_tier(todos, serializer_class):
+    for todo in serializer_class.stream(todos, BATCH_SIZE):
+        yield {
+            'type': 'todo',
+            'id': todo['id'],
+            'title': todo['title'],
+            'content': todo['content'],
+            'created_at': todo['created_at'],
+            'date': todo['date'],
+            'checked': todo['checked'],
+            'repeat': todo['repeat'],
+            'group': todo['group']['id'] if todo['group'] is not None else None,
+            'subtasks': [{'content': subtask['content'], 'checked': subtask['checked']} for subtask in todo['subtasks']],
+        }
+
+def records(user):
+    yield from group_records(user)
+    yield from todo_records(user)
+
+def csv_rows(record):
+    if record['type'] == 'group':
+        yield ['group', record['id'], record['parent'], record['name'], '', '', '', '', '']
+        return
+    yield [
+        'todo', record['id'], record['group'], record['title'], record['content'], record['date'],
+        bool_text(record['checked']), record['repeat'], record['created_at'],
+    ]
+    for subtask in record['subtasks']:
+        yield ['subtask', '', record['id'], '', subtask['content'], '', bool_text(subtask['checked']), '', '']
+
+def bool_text(value):
+    return 'true' if value else 'false'
+
+def export_lines(user, format=JSONL):
+    # Yields the export as byte strings of about one record each.
+    if format == JSONL:
+        for record in records(user):
+            yield dumps(record) + b'\n'
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(COLUMNS)
+    for record in records(user):
+        writer.writerows(csv_rows(record))
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode()
+
+async def aexport_lines(user, format=JSONL):
+    # Like CompactSerializer.astream, drives the sync generator from a
+    # thread, BATCH_SIZE records per hop.
+    lines = export_lines(user, format)
+    next_chunk = sync_to_async(lambda: list(islice(lines, BATCH_SIZE)))
+    while True:
+        chunk = await next_chunk()
+        if chunk:
+            yield b''.join(chunk)
+        if len(chunk) < BATCH_SIZE:
+            break
+
+
+# Parsing. Both readers yield (line number, record) with the fields of the
+# JSONL records; values are checked in clean_group/clean_todo. Malformed
+# input, undecodable bytes included, is a TransferError on its line.
+
+def decode(lines):
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            try:
+                line = line.decode('utf-8')
+            except UnicodeDecodeError:
+                raise TransferError('Invalid UTF-8', number)
+        yield number, line
+
+def read_jsonl(lines):
+    for number, line in decode(lines):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise TransferError('Invalid JSON', number)
+        if not isinstance(record, dict):
+            raise TransferError('Expected an object', number)
+        yield number, record
+
+class NumberedLines:
+    # Decoded lines for csv.reader, remembering the number of the last one
+    # handed out: csv.Error is raised before line_num counts the line that
+    # caused it.
+    def __init__(self, lines):
+        self.lines = decode(lines)
+        self.number = 0
+
+    def __iter__(self):
+        for number, line in self.lines:
+            self.number = number
+            yield line
+
+def read_rows(reader, lines):
+    # csv.Error, e.g. for a field past csv.field_size_limit() or a bare
+    # carriage return, as a TransferError.
+    try:
+        if reader.fieldnames is None or not {'type', 'id', 'parent', 'title'} <= set(reader.fieldnames):
+            raise TransferError('Missing CSV header', 1)
+        yield from reader
+    except csv.Error as error:
+        raise TransferError(f'Invalid CSV: {error}', lines.number)
+
+def read_csv(lines):
+    lines = NumberedLines(lines)
+    reader = csv.DictReader(lines)
+
+    todo = None
+    for row in read_rows(reader, lines):
+        number = reader.line_num
+        kind = row.get('type')
+        if kind == 'subtask':
+            if todo is None or row.get('parent') != str(todo[1]['id']):
+                raise TransferError('Subtask rows must follow their todo', number)
+            todo[1]['subtasks'].append({'content': row.get('content'), 'checked': row.get('checked')})
+            continue
+        if todo is not None:
+            yield todo
+            todo = None
+        if kind == 'group':
+            yield number, {'type': 'group', 'id': row['id'], 'name': row['title'], 'parent': row['parent'] or None}
+        elif kind == 'todo':
+            todo = number, {
+                'type': 'todo', 'id': row['id'], 'title': row['title'], 'content': row.get('content'),
+                'date': row.get('date'), 'checked': row.get('checked'), 'repeat': row.get('repeat') or '',
+                'group': row['parent'] or None, 'subtasks': [],
+            }
+        else:
+            raise TransferError(f'Unknown record type {kind!r}', number)
+    if todo is not None:
+        yield todo
+
+def read(lines, format=JSONL):
+    return read_csv(lines) if format == CSV else read_jsonl(lines)
+
+
+def clean_id(value, field):
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise TransferError(f'Invalid {field}')
+
+def clean_text(value, field, max_length=None):
+    if not isinstance(value, str) or not value:
+        raise TransferError(f'{field} is required')
+    if max_length is not None and len(value) > max_length:
+        raise TransferError(f'{field} is longer than {max_length} characters')
+    return value
+
+def clean_bool(value, field):
+    if isinstance(value, bool):
+        return value
+    if value in (None, '', 'false', 'False', '0', 0):
+        return False
+    if value in ('true', 'True', '1', 1):
+        return True
+    raise TransferError(f'Invalid {field}')
+
+def clean_group(record):
+    if record.get('id') in (None, ''):
+        raise TransferError('id is required')
+    return {
+        'id': clean_id(record.get('id'), 'id'),
+        'name': clean_text(record.get('name'), 'name', 256),
+        'parent': clean_id(record.get('parent'), 'parent'),
+    }
+
+def clean_todo(record):
+    try:
+        date = datetime.date.fromisoformat(record.get('date') or '')
+    except (TypeError, ValueError):
+        raise TransferError('Invalid date')
+    repeat = record.get('repeat') or ''
+    if not isinstance(repeat, str):
+        raise TransferError('Invalid repeat')
+    try:
+        recurrence.parse(repeat)
+    except (TypeError, ValueError):
+        raise TransferError('Invalid repeat')
+    subtasks = record.get('subtasks') or []
+    if not isinstance(subtasks, list):
+        raise TransferError('subtasks must be a list')
+    return {
+        'title': clean_text(record.get('title'), 'title', 256),
+        'content': clean_text(record.get('content'), 'content'),
+        'date': date,
+        'checked': clean_bool(record.get('checked'), 'checked'),
+        'repeat': repeat,
+        'group': clean_id(record.get('group'), 'group'),
+        'subtasks': [clean_subtask(subtask) for subtask in subtasks],
+    }
+
+def clean_subtask(subtask):
+    # Plain strings are accepted too, as in the todo API.
+    if isinstance(subtask, str):
+        return clean_text(subtask, 'subtask', 256), False
+    if isinstance(subtask, dict):
+        return clean_text(subtask.get('content'), 'subtask', 256), clean_bool(subtask.get('checked'), 'checked')
+    raise TransferError('Invalid subtask')
+
+
+# Import
+
+class Importer:
+    def __init__(self, user, batch_size=BATCH_SIZE, progress=None):
+        self.user = user
+        self.batch_size = batch_size
+        self.progress = progress
+        # Source group id to the group created for it, and the source ids
+        # seen so far, written or not.
+        self.groups = {}
+        self.known = set()
+        self.pending_groups = []
+        self.pending_todos = []
+        self.counts = {'groups': 0, 'todos': 0, 'subtasks': 0}
+
+    def run(self, records):
+        # Writes the records and returns the counts. On a TransferError the
+        # batches before the faulty record stay imported, and self.counts
+        # says how much that was.
+        for number, record in records:
+            try:
+                self.add(record)
+            except TransferError as error:
+                error.line = error.line or number
+                raise
+        self.flush()
+        return self.counts
+
+    def add(self, record):
+        # References are checked here, where the line is known; flush only
+        # writes.
+        kind = record.get('type')
+        if kind == 'group':
+            group = clean_group(record)
+            if group['id'] in self.known:
+                raise TransferError(f'Duplicate group {group["id"]}')
+            self.check_group(group['parent'])
+            self.known.add(group['id'])
+            self.pending_groups.append(group)
+            if len(self.pending_groups) >= self.batch_size:
+                self.flush()
+        elif kind == 'todo':
+            todo = clean_todo(record)
+            self.check_group(todo['group'])
+            self.pending_todos.append(todo)
+            if len(self.pending_todos) >= self.batch_size:
+                self.flush()
+        else:
+            raise TransferError(f'Unknown record type {kind!r}')
+
+    def check_group(self, id):
+        if id is not None and id not in self.known:
+            raise TransferError(f'Unknown group {id}; groups must come before what refers to them')
+
+    def flush(self):
+        if not self.pending_groups and not self.pending_todos:
+            return
+        with transaction.atomic():
+            self.write_groups(self.pending_groups)
+            self.write_todos(self.pending_todos)
+            notify(self.user.id)
+        self.counts['groups'] += len(self.pending_groups)
+        self.counts['todos'] += len(self.pending_todos)
+        self.counts['subtasks'] += sum(len(todo['subtasks']) for todo in self.pending_todos)
+        self.pending_groups = []
+        self.pending_todos = []
+        if self.progress is not None:
+            self.progress(self.counts)
+
+    def write_groups(self, records):
+        if not records:
+            return
+        groups = TodoGroup.objects.bulk_create([TodoGroup(name=record['name'], user=self.user) for record in records])
+        for record, group in zip(records, groups):
+            parent = self.groups[record['parent']] if record['parent'] is not None else None
+            group.parent = parent
+            group.path = grouptree.path_for(parent, group.id)
+            self.groups[record['id']] = group
+        TodoGroup.objects.bulk_update(groups, ['parent', 'path'])
+
+        Childs = TodoGroup.childs.through
+        Childs.objects.bulk_create([
+            Childs(from_todogroup_id=group.parent_id, to_todogroup_id=group.id) for group in groups if group.parent_id
+        ])
+
+    def write_todos(self, records):
+        if not records:
+            return
+        todos = TodoItem.objects.bulk_create([
+            TodoItem(
+                title=record['title'], content=record['content'], date=record['date'], checked=record['checked'],
+                repeat=record['repeat'], group=self.groups[record['group']] if record['group'] is not None else None,
+                user=self.user,
+            )
+            for record in records
+        ])
+
+        subtasks = Subtask.objects.bulk_create([
+            Subtask(todo=todo, content=content, checked=checked, position=(i + 1) * Subtask.GAP)
+            for todo, record in zip(todos, records) for i, (content, checked) in enumerate(record['subtasks'])
+        ], batch_size=self.batch_size)
+        Links = TodoItem.subtasks.through
+        Links.objects.bulk_create([Links(todoitem_id=subtask.todo_id, subtask_id=subtask.id) for subtask in subtasks], batch_size=self.batch_size)
+
+        stats.todos_added(todos)
+        search.index([todo.id for todo in todos])
+
+
+def import_records(user, lines, format=JSONL, batch_size=BATCH_SIZE, progress=None):
+    return Importer(user, batch_size, progress).run(read(lines, format))
@@ -1,46 +1,107 @@
 import datetime
+import json
+
+from asgiref.sync import sync_to_async
 
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
-from rest_framework.authentication import TokenAuthentication, SessionAuthentication
+from rest_framework.authentication import SessionAuthentication
 from rest_framework.permissions import IsAuthenticated
 
-from django.shortcuts import render, get_object_or_404
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.shortcuts import render
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from django.db.models import Q
 from django.contrib.auth.models import User
 
-from .models import TodoItem, TodoGroup, Subtask
+from .models import TodoItem, TodoGroup, Subtask, Job
 from .services import TodoItemService, TodoGroupService, SubtaskService
-from .serializers import TodoInputSerializer, TodoOutputSerializer, GroupInputSerializer, GroupOutputSerializer, SubtaskInputSerializer, UserSerializer
-
-
-class LoginView(APIView):
-    def post(self, request):
-        user = get_object_or_404(User, username=request.data['username'])
-        if not user.check_password(request.data['password']):
-            return Response({'error': 'Invalid password'}, status=400)
-        token, created = Token.objects.get_or_create(user=user)
+from . import grouptree, jobs, membership, stats, transfer
+from .batch import run_batch
+from .asyncapi import AsyncAPIView
+from .compact import CompactTodoSerializer, CompactArchivedTodoSerializer, CompactGroupSerializer, dumps
+from .feed import bus
+from .caching import cached_response, acached_response, aget_version
+from .authentication import CachedTokenAuthentication
+from .hashing import HashingBusy, ahash_password, acheck_password
+from .syncing import parse_since, changes, has_changes
+from .selectors import todo_list, atodo_get, aarchived_get, todo_filter, archived_filter, atodo_window, atodo_search, group_list, agroup_get
+from .pagination import apaginated_response, apaginated_tiers, encode_cursor, decode_cursor, TODO_ORDERING, GROUP_ORDERING
+from .serializers import TodoInputSerializer, TodoOutputSerializer, TodoFilterSerializer, GroupInputSerializer, GroupOutputSerializer, SubtaskInputSerializer, BatchInputSerializer, TodoSearchSerializer, StatsFilterSerializer, UserSerializer, JobOutputSerializer
+
+
+def request_data(request):
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+    return request.POST
+
+def busy_response():
+    return JsonResponse({'error': 'Too many login attempts in progress, retry shortly'}, status=429, headers={'Retry-After': '1'})
+
+
+# Login and register are plain async Django views so that, under ASGI,
+# password hashing waits on the hashing pool without holding the event
+# loop or a worker thread.
+
+@method_decorator(csrf_exempt, name='dispatch')
+class LoginView(View):
+    async def post(self, request):
+        data = request_data(request)
+        if not data or 'username' not in data or 'password' not in data:
+            return JsonResponse({'error': 'username and password are required'}, status=400)
+
+        user = await User.objects.filter(username=data['username']).afirst()
+        if user is None:
+            return JsonResponse({'detail': 'Not found.'}, status=404)
+        try:
+            valid = await acheck_password(user, data['password'])
+        except HashingBusy:
+            return busy_response()
+        if not valid:
+            return JsonResponse({'error': 'Invalid password'}, status=400)
+
+        token, created = await Token.objects.aget_or_create(user=user)
         serializer = UserSerializer(user)
-        return Response({'token': token.key, 'user': serializer.data}, status=200)
+        return JsonResponse({'token': token.key, 'user': serializer.data}, status=200)
+
+@method_decorator(csrf_exempt, name='dispatch')
+class RegisterView(View):
+    async def post(self, request):
+        serializer = UserSerializer(data=request_data(request))
+        if not await sync_to_async(serializer.is_valid)():
+            return JsonResponse(serializer.errors, status=400)
+
+        data = serializer.validated_data
+        try:
+            password = await ahash_password(data['password'])
+        except HashingBusy:
+            return busy_response()
+
+        user = User(username=data['username'], email=data.get('email', ''), password=password)
+        await user.asave()
+        token = await Token.objects.acreate(user=user)
+        return JsonResponse({'token': token.key, 'user': UserSerializer(user).data}, status=201)
+
+class LogoutView(APIView):
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CachedTokenAuthentication, SessionAuthentication]
 
-class RegisterView(APIView):
     def post(self, request):
-        serializer = UserSerializer(data=request.data)
-        
-        if serializer.is_valid():
-            serializer.save()
-            user = User.objects.get(username=serializer.data['username'])
-            user.set_password(serializer.data['password'])
-            user.save()
-            token = Token.objects.create(user=user)
-            return Response({'token': token.key, 'user': serializer.data}, status=201)
-        return Response(serializer.errors, status=400)
+        Token.objects.filter(user=request.user).delete()
+        return Response({'success': 'Logged out successfully'}, status=200)
 
 class TestUserView(APIView): 
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    authentication_classes = [CachedTokenAuthentication, SessionAuthentication]
 
     def get(self, request):
         user = request.user
@@ -48,238 +109,417 @@ class TestUserView(APIView):
         return Response(serializer.data)
 
 
-class TodoItemListView(APIView):
-    permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication, SessionAuthentication]
+# The todo, group and subtask views are async and read through the async
+# ORM, one thread hop per query with its prefetches; writes take one hop
+# through the services' async counterparts. Under WSGI Django runs each of
+# them through async_to_sync, a few hundred microseconds a request.
 
-    def get(self, request):
-        todo_items = TodoItem.objects.filter(Q(user=request.user)).all()
-        serializer = TodoOutputSerializer(todo_items, many=True)
-        return Response(serializer.data)
+class TodoItemListView(AsyncAPIView):
+    async def get(self, request):
+        todo_items = todo_list(request.user)
+        return await acached_response(request, lambda: apaginated_response(request, todo_items, CompactTodoSerializer, TODO_ORDERING))
 
-    def post(self, request):
+    async def post(self, request):
         serializer = TodoInputSerializer(data=request.data)
-        if serializer.is_valid():
-            TodoItemService.create(**serializer.validated_data, user=request.user)
+        if await sync_to_async(serializer.is_valid)():
+            await TodoItemService.acreate(**serializer.validated_data, user=request.user)
             return Response(serializer.data, status=201)
         return Response(serializer.errors, status=400)
     
-class TodoItemFilterView(APIView):
-    permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication, SessionAuthentication]
-
-    def get(self, request):
-        delta = request.data.get('date', None)
-        group = request.data.get('group', None)
-        checked = True if request.data.get('checked', None) == '1' else False
-
-        todos = TodoItem.objects.filter(Q(user=request.user)).all()
-
-        if delta is not None:
-            day = datetime.date.today() + datetime.timedelta(days=int(delta))
-            todos = todos.filter(Q(date=day))
-        if group is not None:
-            todos = todos.filter(Q(group=group))
-        if checked is not None:
-            todos = todos.filter(Q(checked=checked))
-
-        serializer = TodoOutputSerializer(todos, many=True)
-        return Response(serializer.data)
+def date_window(filters):
+    if filters.get('date') is not None:
+        day = datetime.date.today() + datetime.timedelta(days=filters['date'])
+        return day, day
+    if filters.get('date_from') and filters.get('date_to'):
+        return filters['date_from'], filters['date_to']
+    return None
+
+def serialize_window(rows):
+    serialized = {}
+    data = []
+    for todo, date, virtual in rows:
+        if todo.id not in serialized:
+            serialized[todo.id] = TodoOutputSerializer(todo).data
+        if not virtual:
+            data.append(serialized[todo.id])
+            continue
+        occurrence = dict(serialized[todo.id], date=date.isoformat(), checked=False, virtual=True)
+        occurrence['subtasks'] = [dict(subtask, checked=False) for subtask in occurrence['subtasks']]
+        data.append(occurrence)
+    return data
+
+class TodoItemFilterView(AsyncAPIView):
+    async def get(self, request):
+        serializer = TodoFilterSerializer(data=request.query_params)
+        if not await sync_to_async(serializer.is_valid)():
+            return Response(serializer.errors, status=400)
+
+        filters = serializer.validated_data
+        include_archived = filters.pop('include_archived')
+        window = date_window(filters)
+        paged = any(key in request.query_params for key in ('cursor', 'limit', 'stream'))
+        if window is None or paged:
+            todos = todo_filter(request.user, **filters)
+            if include_archived:
+                # Both tiers, merged in TODO_ORDERING.
+                tiers = [(todos, CompactTodoSerializer), (archived_filter(request.user, **filters), CompactArchivedTodoSerializer)]
+                return await acached_response(request, lambda: apaginated_tiers(request, tiers, TODO_ORDERING))
+            return await acached_response(request, lambda: apaginated_response(request, todos, CompactTodoSerializer, TODO_ORDERING))
+
+        async def build():
+            return Response(serialize_window(await atodo_window(request.user, *window, include_archived=include_archived, **filters)))
+        return await acached_response(request, build)
     
-class TodoItemDetailView(APIView):
-    permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication, SessionAuthentication]
-
-    def get(self, request, id):
-        todo_item = TodoItem.objects.get(id=id)
-
-        if todo_item.user != request.user:
+class TodoItemSearchView(AsyncAPIView):
+    # Results come best match first, so the cursor is a position in the
+    # ranking rather than a keyset.
+    async def get(self, request):
+        serializer = TodoSearchSerializer(data=request.query_params)
+        if not await sync_to_async(serializer.is_valid)():
+            return Response(serializer.errors, status=400)
+
+        params = serializer.validated_data
+        try:
+            offset = int(decode_cursor(params['cursor'], ('offset',))[0]) if 'cursor' in params else 0
+        except ValueError:
+            return Response({'error': 'Invalid cursor'}, status=400)
+
+        async def build():
+            todos, more = await atodo_search(request.user, params['q'], offset, params['limit'])
+            return Response({
+                'results': TodoOutputSerializer(todos, many=True).data,
+                'next': encode_cursor([offset + params['limit']]) if more else None,
+            })
+        return await acached_response(request, build)
+
+class TodoItemDetailView(AsyncAPIView):
+    # Archived todos keep their ids, so one listed with include_archived
+    # still reads here; changing it answers 404 like any other missing todo.
+    async def get(self, request, id):
+        try:
+            todo_item = await atodo_get(id)
+        except TodoItem.DoesNotExist:
+            todo_item = await aarchived_get(id)
+
+        if todo_item.user_id != request.user.id:
             return Response({'error': 'Unauthorized'}, status=401)
         
         serializer = TodoOutputSerializer(todo_item)
         return Response(serializer.data)
     
-    def post(self, request, id):
-        todo_item = TodoItem.objects.get(id=id)
+    async def post(self, request, id):
+        todo_item = await TodoItem.objects.aget(id=id)
 
-        if todo_item.user != request.user:
+        if todo_item.user_id != request.user.id:
             return Response({'error': 'Unauthorized'}, status=401)
         
         serializer = SubtaskInputSerializer(data=request.data)
         if serializer.is_valid():
             content = request.data['content']
-            TodoItemService.add_subtask(todo_item, content)
+            await TodoItemService.aadd_subtask(todo_item, content)
             return Response({'success': 'Subtask added successfully'}, status=201)
         return Response(serializer.errors, status=400)
     
-    def put(self, request, id):
-        todo_item = TodoItem.objects.get(id=id)
+    async def put(self, request, id):
+        todo_item = await TodoItem.objects.aget(id=id)
 
-        if todo_item.user != request.user:
+        if todo_item.user_id != request.user.id:
             return Response({'error': 'Unauthorized'}, status=401)
         
         serializer = TodoInputSerializer(todo_item, data=request.data)
-        if serializer.is_valid():
-            TodoItemService.update(id, **serializer.validated_data)
+        if await sync_to_async(serializer.is_valid)():
+            await TodoItemService.aupdate(id, **serializer.validated_data)
             return Response({'success': 'Todo updated successfully'}, status=200)
         return Response(serializer.errors, status=400)
     
-    def delete(self, request, id):
-        todo_item = TodoItem.objects.get(id=id)
+    async def delete(self, request, id):
+        todo_item = await TodoItem.objects.aget(id=id)
 
-        if todo_item.user != request.user:
+        if todo_item.user_id != request.user.id:
             return Response({'error': 'Unauthorized'}, status=401)
         
-        todo_item.delete()
+        await TodoItemService.adelete(id)
         return Response({'success': 'Todo deleted successfully'},status=204)
     
-class TodoItemActionView(APIView):
-    permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication, SessionAuthentication]
+class TodoItemActionView(AsyncAPIView):
+    async def post(self, request, id):
+        todo = await TodoItem.objects.aget(id=id)
 
-    def post(self, request, id):
-        todo = TodoItem.objects.get(id=id)
-
-        if todo.user != request.user:
+        if todo.user_id != request.user.id:
             return Response({'error': 'Unauthorized'}, status=401)
 
-        action = request.data['action']
-        content = request.data['content']
-        if action == 'rename':
-            TodoItemService.rename(todo, content)
-        elif action == 'check':
-            TodoItemService.check(todo)
-        elif action == 'uncheck':
-            TodoItemService.uncheck(todo)
-        elif action == 'move':
-            old_group = content['old_group']
-            new_group = content['new_group']
-            TodoItemService.move(old_group, new_group, todo)
-        else:
-            return Response({'error': 'Invalid action'}, status=400)
-        return Response({'success': action +' performed successfully'}, status=200)
+        result = await TodoItemService.aperform(todo, request.data['action'], request.data.get('content'))
+        if not result['status']:
+            return Response({'error': result['error']}, status=400)
+        return Response({'success': result['success']}, status=200)
     
 
 
-class TodoGroupListView(APIView):
+class BatchView(APIView):
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CachedTokenAuthentication, SessionAuthentication]
+
+    def post(self, request):
+        serializer = BatchInputSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+
+        success, results = run_batch(request.user, serializer.validated_data['actions'])
+        return Response({'results': results}, status=200 if success else 400)
+
+
+class SyncView(APIView):
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    authentication_classes = [CachedTokenAuthentication, SessionAuthentication]
 
     def get(self, request):
-        todo_groups = TodoGroup.objects.filter(Q(user=request.user)).all()
-        serializer = GroupOutputSerializer(todo_groups, many=True)
-        return Response(serializer.data)
+        since = request.query_params.get('since')
+        try:
+            since = parse_since(since) if since else None
+        except ValueError:
+            return Response({'error': 'Invalid cursor'}, status=400)
+
+        return Response(sync_payload(request.user, since))
+
+
+def sync_payload(user, since):
+    result = changes(user, since)
+    return {
+        'cursor': result['cursor'],
+        'todos': CompactTodoSerializer.rows(result['todos']),
+        'groups': CompactGroupSerializer.rows(result['groups']),
+        'deleted': result['deleted'],
+    }
+
+def feed_event(payload):
+    # The cursor doubles as the event id, so a reconnecting EventSource
+    # resumes from it through Last-Event-ID.
+    return b'id: ' + payload['cursor'].encode() + b'\nevent: changes\ndata: ' + dumps(payload) + b'\n\n'
+
+class FeedView(AsyncAPIView):
+    # Pushes the caller's changes, in /sync/'s format, as they commit.
+    # Under ASGI a client accepting text/event-stream gets Server-Sent
+    # Events; otherwise the request long-polls: it answers at once if
+    # anything changed since the cursor, else when something does or after
+    # TODO_FEED_TIMEOUT seconds. A waiting client holds a parked coroutine
+    # and no database connection, nor one of the active slots.
+    limited = False
+
+    async def get(self, request):
+        cursor = request.query_params.get('since') or request.headers.get('Last-Event-ID')
+        try:
+            since = parse_since(cursor) if cursor else None
+            # Whether to answer right away is decided without the overlap,
+            # or every request within it would return at once.
+            exact = parse_since(cursor, overlap=datetime.timedelta(0)) if cursor else None
+        except ValueError:
+            return Response({'error': 'Invalid cursor'}, status=400)
+
+        if isinstance(request._request, ASGIRequest) and 'text/event-stream' in request.headers.get('Accept', ''):
+            response = StreamingHttpResponse(self.events(request.user, since, exact), content_type='text/event-stream')
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'
+            return response
+        return Response(await self.poll(request.user, since, exact))
+
+    async def poll(self, user, since, exact):
+        # Subscribed before looking, so a commit in between still wakes us.
+        subscription = bus.subscribe(user.id)
+        try:
+            if exact is not None and not await sync_to_async(has_changes)(user, exact):
+                await subscription.wait(getattr(settings, 'TODO_FEED_TIMEOUT', 25))
+            return await sync_to_async(sync_payload)(user, since)
+        finally:
+            bus.unsubscribe(subscription)
+
+    async def events(self, user, since, exact):
+        subscription = bus.subscribe(user.id)
+        heartbeat = getattr(settings, 'TODO_FEED_HEARTBEAT', 15)
+        try:
+            version = await aget_version(user.id)
+            pending = exact is None or await sync_to_async(has_changes)(user, exact)
+            while True:
+                if pending:
+                    version = await aget_version(user.id)
+                    payload = await sync_to_async(sync_payload)(user, since)
+                    since = parse_since(payload['cursor'])
+                    yield feed_event(payload)
+                if await subscription.wait(heartbeat):
+                    pending = True
+                else:
+                    # Writes served by other processes never reach this
+                    # bus, but they do bump the version in a shared cache,
+                    # which costs no query to check.
+                    pending = await aget_version(user.id) != version
+                    if not pending:
+                        yield b': keepalive\n\n'
+        finally:
+            bus.unsubscribe(subscription)
+
+
+class StatsView(AsyncAPIView):
+    # Dashboard counts come from the counter tables, so this costs the same
+    # for a user with ten todos as for one with a million.
+    async def get(self, request):
+        serializer = StatsFilterSerializer(data=request.query_params)
+        if not await sync_to_async(serializer.is_valid)():
+            return Response(serializer.errors, status=400)
+
+        async def build():
+            return Response(await sync_to_async(stats.summary)(request.user, **serializer.validated_data))
+        return await acached_response(request, build)
+
+
+def job_response(job):
+    # Large group writes run on the worker; clients poll the Location.
+    return Response(JobOutputSerializer(job).data, status=202, headers={'Location': f'/jobs/{job.id}/'})
+
+class JobListView(AsyncAPIView):
+    async def get(self, request):
+        recent = [job async for job in Job.objects.filter(user=request.user).order_by('-id')[:50]]
+        return Response(JobOutputSerializer(recent, many=True).data)
+
+    async def post(self, request):
+        # Only the rebuild is requested directly; the other kinds are
+        # queued by the group views.
+        if request.data.get('kind') != jobs.REBUILD:
+            return Response({'error': 'kind must be ' + jobs.REBUILD}, status=400)
+        return job_response(await jobs.aenqueue(request.user, jobs.REBUILD))
+
+class JobDetailView(AsyncAPIView):
+    async def get(self, request, id):
+        job = await Job.objects.aget(id=id)
+
+        if job.user_id != request.user.id:
+            return Response({'error': 'Unauthorized'}, status=401)
+
+        return Response(JobOutputSerializer(job).data)
+
+
+class ExportView(AsyncAPIView):
+    # Streams every group, todo and subtask of the caller as JSONL or CSV
+    # (?format=), a batch of rows per thread hop.
+    async def get(self, request):
+        format = request.query_params.get('format', transfer.JSONL)
+        if format not in transfer.FORMATS:
+            return Response({'error': 'format must be one of ' + ', '.join(transfer.FORMATS)}, status=400)
+
+        response = StreamingHttpResponse(transfer.aexport_lines(request.user, format), content_type=transfer.CONTENT_TYPES[format])
+        response['Content-Disposition'] = f'attachment; filename="todos.{format}"'
+        return response
+
+class ImportView(AsyncAPIView):
+    # Reads the request body line by line, never whole, so its size is
+    # bounded by the server's upload limits rather than by memory. The
+    # format comes from ?format= or the Content-Type.
+    async def post(self, request):
+        format = transfer.format_for(request.query_params.get('format') or request.content_type)
+        importer = transfer.Importer(request.user)
+        try:
+            counts = await sync_to_async(importer.run)(transfer.read(request._request, format))
+        except transfer.TransferError as error:
+            return Response({'error': str(error), 'line': error.line, 'imported': importer.counts}, status=400)
+        return Response(counts, status=201)
+
+
+class TodoGroupListView(AsyncAPIView):
+    async def get(self, request):
+        todo_groups = group_list(request.user)
+        return await acached_response(request, lambda: apaginated_response(request, todo_groups, CompactGroupSerializer, GROUP_ORDERING))
     
-    def post(self, request):
+    async def post(self, request):
         serializer = GroupInputSerializer(data=request.data)
-        if serializer.is_valid():
-            TodoGroupService.create(**serializer.validated_data, user=request.user)
+        if await sync_to_async(serializer.is_valid)():
+            await TodoGroupService.acreate(**serializer.validated_data, user=request.user)
             return Response(serializer.data, status=201)
         return Response(serializer.errors, status=400)
     
-class TodoGroupFilterView(APIView):
-    permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication, SessionAuthentication]
-
-    def get(self, request):
-        todos = TodoGroup.objects.filter(Q(user=request.user)).all()
+class TodoGroupFilterView(AsyncAPIView):
+    async def get(self, request):
+        todos = group_list(request.user)
         groups = request.data.get('groups', None)
         todos = todos.filter(Q(groups=groups))
-        serializer = GroupOutputSerializer(todos, many=True)
+        serializer = GroupOutputSerializer([todo async for todo in todos], many=True)
         return Response(serializer.data)
 
-class TodoGroupDetailView(APIView):
+class TodoGroupTreeView(APIView):
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    authentication_classes = [CachedTokenAuthentication, SessionAuthentication]
+
+    def get(self, request):
+        return cached_response(request, lambda: Response(grouptree.tree(request.user)))
 
-    def get(self, request, id):
-        todo_group = TodoGroup.objects.get(id=id)
+class TodoGroupDetailView(AsyncAPIView):
+    async def get(self, request, id):
+        todo_group = await agroup_get(id)
 
-        if todo_group.user != request.user:
+        if todo_group.user_id != request.user.id:
             return Response({'error': 'Unauthorized'}, status=401)
         
         serializer = GroupOutputSerializer(todo_group)
         return Response(serializer.data)
     
-    def put(self, request, id):
-        todo_group = TodoGroup.objects.get(id=id)
+    async def put(self, request, id):
+        todo_group = await TodoGroup.objects.aget(id=id)
 
-        if todo_group.user != request.user:
+        if todo_group.user_id != request.user.id:
             return Response({'error': 'Unauthorized'}, status=401)
         
         serializer = GroupInputSerializer(todo_group, data=request.data)
-        if serializer.is_valid():
-            TodoGroupService.update(id, **serializer.validated_data)
+        if await sync_to_async(serializer.is_valid)():
+            data = serializer.validated_data
+            difference = await sync_to_async(membership.changes)(todo_group, data['todos'], data['childs'])
+            if jobs.update_size(difference) > jobs.inline_limit():
+                parent = data.get('parent')
+                job = await jobs.aenqueue(
+                    request.user, jobs.UPDATE_GROUP, group=id, name=data['name'], parent=parent.id if parent else None,
+                    todos=data['todos'], childs=data['childs'],
+                )
+                return job_response(job)
+            await TodoGroupService.aupdate(todo_group, difference, **data)
             return Response({'success': 'Group updated successfully'}, status=200)
         return Response(serializer.errors, status=400)
     
-    def delete(self, request, id):
-        todo_group = TodoGroup.objects.get(id=id)
+    async def delete(self, request, id):
+        todo_group = await TodoGroup.objects.aget(id=id)
 
-        if todo_group.user != request.user:
+        if todo_group.user_id != request.user.id:
             return Response({'error': 'Unauthorized'}, status=401)
         
-        todo_group.delete()
+        if await sync_to_async(jobs.delete_size)(todo_group) > jobs.inline_limit():
+            return job_response(await jobs.aenqueue(request.user, jobs.DELETE_GROUP, group=id))
+        await TodoGroupService.adelete(todo_group)
         return Response({'success': 'Group deleted successfully'}, status=204)
 
-class TodoGroupActionView(APIView):
-    permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication, SessionAuthentication]
-
-    def post(self, request, id):
-        group = TodoGroup.objects.get(id=id)
+class TodoGroupActionView(AsyncAPIView):
+    async def post(self, request, id):
+        group = await TodoGroup.objects.aget(id=id)
 
-        if group.user != request.user:
+        if group.user_id != request.user.id:
             return Response({'error': 'Unauthorized'}, status=401)
         
-        action = request.data['action']
-        content = request.data['content']
-        if action == 'rename':
-            TodoGroupService.rename_group(group, content)
-        elif action == 'add_todo':
-            TodoGroupService.add_todo(group, content)
-        elif action == 'remove_todo':
-            TodoGroupService.remove_todo(group, content)
-        elif action == 'add_group':
-            TodoGroupService.add_group(group, content)
-        elif action == 'remove_group':
-            TodoGroupService.remove_group(group, content)
-        elif action == 'move_group':
-            old_group = content['old_group']
-            new_group = content['new_group']
-            TodoGroupService.move_group(old_group, new_group, group)
-        else:
-            return Response({'error': 'Invalid action'}, status=400)
-        return Response({'success': action +' performed successfully'}, status=200)
+        result = await TodoGroupService.aperform(group, request.data['action'], request.data.get('content'))
+        if not result['status']:
+            return Response({'error': result['error']}, status=400)
+        return Response({'success': result['success']}, status=200)
     
-class TodoSubtaskActionView(APIView):
-    permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication, SessionAuthentication]
-
-    def post(self, request, id):
-        subtask = Subtask.objects.get(id=id)
-        todo = subtask.todo
+class TodoSubtaskActionView(AsyncAPIView):
+    async def post(self, request, id):
+        subtask = await Subtask.objects.select_related('todo').aget(id=id)
 
-        if todo.user != request.user:
+        if subtask.todo.user_id != request.user.id:
             return Response({'error': 'Unauthorized'}, status=401)
         
-        action = request.data['action']
-        content = request.data['content']
-        if action == 'rename':
-            SubtaskService.rename(subtask, content)
-        elif action == 'check':
-            SubtaskService.check(subtask)
-        elif action == 'uncheck':
-            SubtaskService.uncheck(subtask)
-        elif action == 'remove':
-            SubtaskService.remove(subtask)
-        elif action == 'move':
-            SubtaskService.move(subtask, int(content))
-        else:
-            return Response({'error': 'Invalid action'}, status=400)
-        return Response({'success': action +' performed successfully'}, status=200)
+        result = await SubtaskService.aperform(subtask, request.data['action'], request.data.get('content'))
+        if not result['status']:
+            return Response({'error': result['error']}, status=400)
+        return Response({'success': result['success']}, status=200)
     
-    def delete(self, request, id):
-        subtask = Subtask.objects.get(id=id)
-        subtask.delete()
-        return Response({'success': 'Subtask deleted successfully'},status=204)
\ No newline at end of file
+    async def delete(self, request, id):
+        subtask = await Subtask.objects.select_related('todo').aget(id=id)
+
+        if subtask.todo.user_id != request.user.id:
+            return Response({'error': 'Unauthorized'}, status=401)
+
+        await SubtaskService.aremove(subtask)
+        return Response({'success': 'Subtask deleted successfully'},status=204)
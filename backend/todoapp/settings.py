@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,14 +43,17 @@ INSTALLED_APPS = [
     'todo'
 ]
 
+# Django's own middleware, through the subclasses in todo/middleware.py that
+# run their hooks on the event loop under ASGI.
 MIDDLEWARE = [
-    'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
-    'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'todo.metrics.MetricsMiddleware',
+    'todo.middleware.SecurityMiddleware',
+    'todo.middleware.SessionMiddleware',
+    'todo.middleware.CommonMiddleware',
+    'todo.middleware.CsrfViewMiddleware',
+    'todo.middleware.AuthenticationMiddleware',
+    'todo.middleware.MessageMiddleware',
+    'todo.middleware.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'todoapp.urls'
@@ -76,12 +80,164 @@ WSGI_APPLICATION = 'todoapp.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# TODO_DB_ENGINE picks the database profile: 'sqlite' (the default) or
+# 'postgresql' (needs psycopg), configured through the TODO_DB_* variables
+# below.
+
+TODO_DB_ENGINE = os.environ.get('TODO_DB_ENGINE', 'sqlite')
+
+if TODO_DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('TODO_DB_NAME', 'todoapp'),
+            'USER': os.environ.get('TODO_DB_USER', 'postgres'),
+            'PASSWORD': os.environ.get('TODO_DB_PASSWORD', ''),
+            'HOST': os.environ.get('TODO_DB_HOST', ''),
+            'PORT': os.environ.get('TODO_DB_PORT', ''),
+            # Persistent connections, one per worker thread, checked
+            # before reuse after an idle request.
+            'CONN_MAX_AGE': int(os.environ.get('TODO_DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            # Set when connecting through PgBouncer in transaction mode,
+            # which cannot keep server-side cursors open across queries.
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('TODO_DB_PGBOUNCER') == '1',
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'todo.backends.sqlite3',
+            'NAME': os.environ.get('TODO_DB_NAME', BASE_DIR / 'db.sqlite3'),
+        }
     }
+
+# Applied to every new SQLite connection by todo.backends.sqlite3. WAL
+# lets readers run alongside the single writer, busy_timeout makes writers
+# wait for the lock instead of failing with "database is locked", and
+# synchronous=NORMAL only syncs at checkpoints, which is safe under WAL.
+# Transactions start IMMEDIATE: one that reads before writing cannot wait
+# out another writer, SQLite fails it at once, so it takes the lock up
+# front where busy_timeout applies.
+
+TODO_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': int(os.environ.get('TODO_DB_BUSY_TIMEOUT', 5000)),
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
 }
+TODO_SQLITE_TRANSACTION_MODE = 'IMMEDIATE'
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+# TODO_CACHE names the cache holding per-user list responses, each keyed
+# by the user's version. LocMemCache evicts least recently used entries past
+# MAX_ENTRIES. TODO_VERSION_CACHE holds those versions and must be shared by
+# every process that writes todos (web workers, runworker, archive_todos,
+# import_todos), or their writes never invalidate the others' responses;
+# runworker refuses to start on a per-process one. It is per process unless
+# TODO_VERSION_CACHE_DIR names a directory for a file cache, shared on one
+# host; point both aliases at Redis or Memcached to share them between hosts.
+
+TODO_VERSION_CACHE_DIR = os.environ.get('TODO_VERSION_CACHE_DIR') or None
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'todo': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'todo',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    'versions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'versions',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+}
+
+if TODO_VERSION_CACHE_DIR:
+    CACHES['versions'].update(
+        BACKEND='django.core.cache.backends.filebased.FileBasedCache',
+        LOCATION=TODO_VERSION_CACHE_DIR,
+    )
+
+TODO_CACHE = 'todo'
+TODO_VERSION_CACHE = 'versions'
+
+# In-process cache of authenticated tokens used by
+# todo.authentication.CachedTokenAuthentication.
+
+TODO_AUTH_CACHE_SIZE = 10000
+TODO_AUTH_CACHE_TTL = 60
+
+# Password hashing pool used by login and register (todo/hashing.py).
+# Requests beyond TODO_HASH_MAX_PENDING running or queued hashes get a 429.
+
+TODO_HASH_WORKERS = 2
+TODO_HASH_MAX_PENDING = 16
+
+
+# Request metrics (todo/metrics.py), exported at /metrics/ in Prometheus
+# text format. The ring buffer holds the samples recorded between two
+# scrapes; requests issuing more than TODO_METRICS_MAX_QUERIES queries are
+# logged to the todo.metrics logger (None turns that off). /metrics/ answers
+# staff sessions and requests sending `Authorization: Bearer <token>` with
+# TODO_METRICS_TOKEN; anyone else gets a 401.
+
+TODO_METRICS_BUFFER_SIZE = 10000
+TODO_METRICS_MAX_QUERIES = 20
+TODO_METRICS_TOKEN = os.environ.get('TODO_METRICS_TOKEN') or None
+
+
+# Async views (todo/asyncapi.py). Under ASGI at most TODO_ASYNC_MAX_ACTIVE
+# of their requests run at once per event loop; the others wait for a slot
+# without holding a thread, as requests queue for a WSGI server's threads.
+
+TODO_ASYNC_MAX_ACTIVE = 16
+
+
+# Change feed (/feed/). Long-polls answer after TODO_FEED_TIMEOUT seconds
+# without changes; Server-Sent Event streams send a keepalive comment every
+# TODO_FEED_HEARTBEAT seconds. Both are woken by an in-process bus; streams
+# also check the shared version (TODO_VERSION_CACHE) on each heartbeat, so
+# writes from other processes reach them within one.
+
+TODO_FEED_TIMEOUT = 25
+TODO_FEED_HEARTBEAT = 15
+
+
+# Archive tier (todo/archive.py). `manage.py archive_todos`, run from cron,
+# moves checked, non-recurring todos dated and last changed more than
+# TODO_ARCHIVE_AFTER_DAYS days ago out of the hot tables,
+# TODO_ARCHIVE_BATCH_SIZE per transaction.
+
+TODO_ARCHIVE_AFTER_DAYS = 90
+TODO_ARCHIVE_BATCH_SIZE = 1000
+
+
+# Background jobs (todo/jobs.py). Group deletes and updates touching more
+# than TODO_JOB_INLINE_LIMIT todos or groups are answered with 202 and a
+# job at /jobs/<id>/, which `manage.py runworker` runs TODO_JOB_CHUNK_SIZE
+# rows per transaction, resting TODO_JOB_CHUNK_PAUSE seconds between
+# chunks so request writes get the lock. An idle worker checks the queue
+# every TODO_WORKER_POLL seconds; a running job without progress for
+# TODO_JOB_STALE_AFTER seconds is handed to the next worker.
+
+TODO_JOB_INLINE_LIMIT = 500
+TODO_JOB_CHUNK_SIZE = 500
+TODO_JOB_CHUNK_PAUSE = 0.05
+TODO_WORKER_POLL = 1.0
+TODO_JOB_STALE_AFTER = 300
 
 
 # Password validation
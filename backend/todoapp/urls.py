@@ -16,20 +16,33 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from todo.views import TodoItemListView, TodoItemDetailView, TodoGroupListView, TodoGroupDetailView, TodoGroupFilterView ,TodoGroupActionView, TodoItemFilterView, TodoItemActionView, TodoSubtaskActionView, LoginView, RegisterView, TestUserView
+from todo.metrics import metrics_view
+from todo.views import TodoItemListView, TodoItemDetailView, TodoGroupListView, TodoGroupDetailView, TodoGroupFilterView ,TodoGroupActionView, TodoGroupTreeView, TodoItemFilterView, TodoItemSearchView, TodoItemActionView, TodoSubtaskActionView, LoginView, LogoutView, RegisterView, TestUserView, BatchView, SyncView, FeedView, StatsView, ExportView, ImportView, JobListView, JobDetailView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('login/', LoginView.as_view(), name='login'),
+    path('logout/', LogoutView.as_view(), name='logout'),
     path('register/', RegisterView.as_view(), name='register'),
     path('todos/', TodoItemListView.as_view(), name='todo-list'),
     path('testuser/', TestUserView.as_view(), name='testuser'),
     path('todos/<int:id>/', TodoItemDetailView.as_view(), name='todo-detail'),
     path('todos/filter/', TodoItemFilterView.as_view(), name='todo-filter'),
+    path('todos/search/', TodoItemSearchView.as_view(), name='todo-search'),
     path('todos/<int:id>/action/', TodoItemActionView.as_view(), name='todo-action'),
     path('subtask/<int:id>/', TodoSubtaskActionView.as_view(), name='subtask-action'),
     path('groups/', TodoGroupListView.as_view(), name='group-list'),
     path('groups/<int:id>/', TodoGroupDetailView.as_view(), name='group-detail'),
     path('groups/filter/', TodoGroupFilterView.as_view(), name='group-filter'),
+    path('groups/tree/', TodoGroupTreeView.as_view(), name='group-tree'),
     path('groups/<int:id>/action/', TodoGroupActionView.as_view(), name='group-action'),
+    path('batch/', BatchView.as_view(), name='batch'),
+    path('sync/', SyncView.as_view(), name='sync'),
+    path('feed/', FeedView.as_view(), name='feed'),
+    path('export/', ExportView.as_view(), name='export'),
+    path('import/', ImportView.as_view(), name='import'),
+    path('jobs/', JobListView.as_view(), name='job-list'),
+    path('jobs/<int:id>/', JobDetailView.as_view(), name='job-detail'),
+    path('stats/', StatsView.as_view(), name='stats'),
+    path('metrics/', metrics_view, name='metrics'),
 ]